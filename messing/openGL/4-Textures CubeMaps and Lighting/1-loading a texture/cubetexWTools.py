@@ -4,12 +4,19 @@ import glfw
 import glfw.GLFW as GLFW_CONSTANTS
 from OpenGL.GL import *
 from tools.Entities import Entity,Player,Cube
-from tools.Objects import Mesh,ObjMesh,Material
-from tools.Shader import Shader as sdr
+from tools.Objects import Mesh,Material
+from tools.Loader import AssetLoader
+from tools.Assets import AssetRegistry
+from tools.Lod import LodMesh
+from tools.Culling import Frustum
+from tools.GLState import gl_state
+from tools.Shader import CameraBlock
+from tools.Instancing import InstanceBuffer
 from tools.Setup import AppSetup
 from tools.Scene import Scene
+from tools.Spatial import SpatialGrid
+from tools.Transforms import perspective_projection
 import numpy as np
-import pyrr
 
 
 """
@@ -36,6 +43,11 @@ CUBE_pth = "models/cube.obj"
 CUBE_txt_pth = "gfx/wood.jpeg"
 sdr_vtx_pth = "shaders/vertex.txt"
 sdr_frg_pth = "shaders/fragment.txt"
+#variant of the shared scene shaders, see tools/shaders
+SCENE_DEFINES = {"TEXTURED": None, "INSTANCED": None}
+#flat colored stand-in, drawn with until the variant above is linked
+FALLBACK_DEFINES = {"INSTANCED": None}
+FALLBACK_COLOR = np.array([0.5, 0.5, 0.5, 1.0], dtype=np.float32)
 
 
 ################### Model #####################################################
@@ -64,6 +76,7 @@ class Stage(Scene):
             eulers=[0,0,0],
             OBJECT_CAMERA=OBJECT_CAMERA
         )
+        self.build_stores()
 
 ################### Control ###################################################
 
@@ -106,7 +119,9 @@ class App(AppSetup):
             
             self.renderer.render(
                 camera = self.scene.camera,
-                renderables = self.scene.renderables
+                renderables = self.scene.renderables,
+                transforms = self.scene.model_transforms(),
+                spatial = self.scene.spatial
             )
 
             #timing
@@ -141,10 +156,10 @@ class Renderer:
         (w,h) = glfw.get_framebuffer_size(window)
         glViewport(0,0,w, h)
 
-        glEnable(GL_DEPTH_TEST)
+        gl_state.enable(GL_DEPTH_TEST)
         glDepthFunc(GL_LESS)
 
-        glEnable(GL_BLEND)
+        gl_state.enable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
     def make_assets(self) -> None:
@@ -153,30 +168,61 @@ class Renderer:
             the renderer will use.
         """
 
-        self.meshes: dict[int, Mesh] = {
-            OBJECT_CUBE: ObjMesh(CUBE_pth),
+        self.assets = AssetRegistry()
+        #variants of the scene shaders, each compiled on first use in render
+        self.variants = self.assets.get_shader_variants(sdr_vtx_pth, sdr_frg_pth)
+        #small enough to wait for, see readyOr in render
+        self.fallback = self.assets.get_shader(sdr_vtx_pth, sdr_frg_pth, defines = FALLBACK_DEFINES)
+        loader = AssetLoader(registry = self.assets)
+        loader.add_mesh(OBJECT_CUBE, CUBE_pth, indexed = True, vertex_format = "quantized")
+        loader.add_material(OBJECT_CUBE, CUBE_txt_pth)
+
+        meshes,materials = loader.load()
+        self.meshes: dict[int, Mesh] = meshes
+        self.materials: dict[int, Material] = materials
+        #textures named by each mesh's mtl file, per submesh material
+        self.range_materials: dict[int, dict[str, Material]] = {
+            objectType: self.assets.get_mesh_materials(mesh)
+            for objectType,mesh in self.meshes.items()
         }
-
-        self.materials: dict[int, Material] = {
-            OBJECT_CUBE: Material(CUBE_txt_pth),
+        #bounding sphere around an entity's position that holds its
+        #mesh however it is turned, for the spatial grid's frustum query
+        self.cull_radius = max(
+            [float(np.linalg.norm(mesh.bounding_center)) + mesh.bounding_radius
+             for mesh in self.meshes.values()],
+            default = 0.0
+        )
+        #per instance transforms, one buffer per vao drawn
+        self.instance_buffers: dict[int, InstanceBuffer] = {}
+        #reduced versions for entities far from the camera
+        self.lods: dict[int, LodMesh] = {
+            OBJECT_CUBE: LodMesh(
+                CUBE_pth, base = self.meshes[OBJECT_CUBE], vertex_format = "quantized"
+            ),
         }
 
-        self.shader = sdr(sdr_vtx_pth, sdr_frg_pth)
 
     def set_onetime_uniforms(self) -> None:
         """ Set any uniforms which can simply get set once and forgotten """
 
-        projection_transform = pyrr.matrix44.create_perspective_projection(
+        projection_transform = perspective_projection(
             fovy = 45, aspect = self.screenWidth / self.screenHeight, 
-            near = 0.1, far = 100, dtype = np.float32
+            near = 0.1, far = 100
         )
+        self.projection = projection_transform
+        self.frustum = Frustum()
+        #view and projection reach every program through this block
+        self.camera_block = CameraBlock()
 
-        self.shader.setMat4fv("projection",projection_transform)
-        self.shader.setInt("imageTexture",0)
+        #set on the scene variant when it is made, see render
+        self.scene_uniforms = {"imageTexture": 0}
+        self.fallback.setUniforms({"flatColor": FALLBACK_COLOR})
 
     def render(
             self, camera: Player, 
-        renderables: dict[int, list[Entity]]) -> None:
+        renderables: dict[int, list[Entity]],
+        transforms: dict[int, np.ndarray],
+        spatial: SpatialGrid) -> None:
         """
             Render a frame.
             Parameters:
@@ -184,32 +230,85 @@ class Renderer:
                 renderables: a dictionary of entities to draw, keys are the
                             entity types, for each of these there is a list
                             of entities.
+                transforms: the entities' model transforms, per type one
+                            (count, 4, 4) array in the order of renderables
+                spatial: the scene's index of the renderables' positions
         """
 
         #refresh screen
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        self.shader.use()
-
-        self.shader.setMat4fv("view", camera.get_view_transform())
+        shader = self.variants.get(
+            SCENE_DEFINES, wait = False, uniforms = self.scene_uniforms
+        ).readyOr(self.fallback)
+        shader.use()
+
+        view_transform = camera.get_view_transform()
+        self.camera_block.update(view_transform, self.projection, camera.position)
+        #drawn/culled counts are per frame
+        self.frustum.update(self.projection, view_transform)
+        self.frustum.reset_stats()
+        #the grid narrows the scene down to the entities near the view
+        near = {id(entity) for entity in spatial.query_frustum(self.frustum, self.cull_radius)}
 
         for objectType,objectList in renderables.items():
-            mesh = self.meshes[objectType]
-            material = self.materials[objectType]
-            glBindVertexArray(mesh.vao)
-            material.use()
-            for object in objectList:
-                self.shader.setMat4fv("model",object.get_model_transform())
-                glDrawArrays(GL_TRIANGLES, 0,mesh.vertex_count)
+            if not objectList:
+                continue
+            all_transforms = transforms[objectType]
+            rows = np.array(
+                [i for i,entity in enumerate(objectList) if id(entity) in near], dtype=np.intp
+            )
+            self.frustum.culled += len(objectList) - len(rows)
+            #reduced levels lie inside the full mesh's bounds
+            visible = rows[self.frustum.cull(all_transforms[rows], self.meshes[objectType])]
+            if objectType in self.lods:
+                groups = self.lods[objectType].partition(
+                    [objectList[i] for i in visible], camera.position
+                )
+                groups = [(mesh, visible[chosen]) for mesh,chosen in groups]
+            else:
+                groups = [(self.meshes[objectType], visible)]
+
+            for mesh,chosen in groups:
+                mesh.bind()
+                shader.setUniforms({
+                    "positionScale": mesh.position_scale,
+                    "positionOffset": mesh.position_offset,
+                })
+                #one upload and one draw per range, however many entities
+                instances = self.instance_buffers.get(mesh.vao)
+                if instances is None:
+                    instances = InstanceBuffer(mesh)
+                    self.instance_buffers[mesh.vao] = instances
+                instances.upload(all_transforms[chosen])
+                #ranges come sorted by texture, bind each one once
+                bound = None
+                for name,first,count in mesh.ranges:
+                    material = self.range_materials[objectType].get(
+                        name, self.materials[objectType]
+                    )
+                    if material is not bound:
+                        material.use()
+                        bound = material
+                    mesh.draw_range_instanced(first,count,instances.count)
         
         glFlush()
     
     def destroy(self) -> None:
         """ Free any allocated memory """
 
+        self.camera_block.destroy()
+        for (_,instances) in self.instance_buffers.items():
+            instances.destroy()
+        for (_,lod) in self.lods.items():
+            lod.destroy()
         for (_,mesh) in self.meshes.items():
-            mesh.destroy()
+            self.assets.release(mesh)
         for (_,material) in self.materials.items():
-            material.destroy()
-        self.shader.deletePgm()
+            self.assets.release(material)
+        for (_,materials) in self.range_materials.items():
+            for (_,material) in materials.items():
+                self.assets.release(material)
+        self.assets.release(self.fallback)
+        self.assets.release(self.variants)
 
 myApp = App(800,600)
\ No newline at end of file
@@ -0,0 +1,70 @@
+import sys
+sys.path.insert(0,'..')
+import os
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from tools.Loader import AssetLoader
+from synthetic import write_grid_obj
+
+"""
+    How AssetLoader's decoding scales with the pool size, over
+    generated obj models and jpeg textures. Only the worker side
+    (AssetLoader.decode) is timed, the uploads need a GL context.
+    Usage:
+        python assetLoader.py [models] [triangles per model] [texture size]
+                                                (default 32 50000 1024)
+    With the defaults that is 64 assets, models skip the mesh cache.
+"""
+
+def write_assets(folder:str, models:int, triangles:int, size:int) -> tuple[list,list]:
+
+    rng = np.random.default_rng(0)
+    obj_files = []
+    image_files = []
+    for i in range(models):
+        filename = os.path.join(folder,f"model{i}.obj")
+        write_grid_obj(filename,triangles)
+        obj_files.append(filename)
+
+        filepath = os.path.join(folder,f"texture{i}.jpeg")
+        pixels = rng.integers(0,256,(size,size,3),dtype=np.uint8)
+        Image.fromarray(pixels).save(filepath)
+        image_files.append(filepath)
+    return obj_files,image_files
+
+def time_decode(obj_files:list, image_files:list, workers:int, processes:bool) -> float:
+
+    loader = AssetLoader(workers=workers,processes=processes)
+    for filename in obj_files:
+        loader.add_mesh(filename,filename,cache=False)
+    for filepath in image_files:
+        loader.add_material(filepath,filepath)
+
+    start = time.perf_counter()
+    decoded = sum(1 for _ in loader.decode(*loader.queued_sources()))
+    elapsed = time.perf_counter() - start
+    assert decoded == len(obj_files) + len(image_files)
+    return elapsed
+
+def main(models:int, triangles:int, size:int) -> None:
+
+    cores = os.cpu_count()
+    pool_sizes = sorted({1,2,4,cores})
+    with tempfile.TemporaryDirectory() as folder:
+        obj_files,image_files = write_assets(folder,models,triangles,size)
+        print(f"{2*models} assets, {cores} cores")
+        print(f"{'workers':>8} {'threads':>9} {'speedup':>8} {'processes':>10} {'speedup':>8}")
+        base = {}
+        for workers in pool_sizes:
+            row = f"{workers:>8}"
+            for processes in (False,True):
+                elapsed = time_decode(obj_files,image_files,workers,processes)
+                base.setdefault(processes,elapsed)
+                row += f" {elapsed:>8.2f}s {base[processes]/elapsed:>7.1f}x"
+            print(row)
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [32,50000,1024][len(args):]))
@@ -0,0 +1,149 @@
+import sys
+sys.path.insert(0,'..')
+import os
+import tempfile
+import time
+import glfw
+import glfw.GLFW as GLFW_CONSTANTS
+import numpy as np
+from OpenGL.GL import *
+from tools.Objects import ObjMesh,load_mesh_data
+from tools.MeshPool import MeshPool
+from tools.Instancing import InstanceBuffer
+from tools.Shader import Shader
+from tools.GLState import gl_state
+from tools.Transforms import model_transforms
+from synthetic import write_grid_obj
+
+"""
+    Vao binds and draw calls per frame for a scene of static
+    entities of many mesh kinds. The old way binds each kind's mesh
+    and draws it instanced, the way the renderers draw every type.
+    The new way bakes all of them into a MeshPool and draws them
+    with one glMultiDrawElements (see render_static in
+    testing framebuffers/gettingItWorking.py).
+    Needs an OpenGL 3.3 context, made in a hidden window.
+    Usage:
+        python drawCalls.py [kinds] [entities per kind]     (default 64 16)
+"""
+
+#the scene shaders of tools/shaders, instanced and with a model uniform
+VERTEX_SOURCE = '#version 330 core\n#include "sceneVertex.txt"\n'
+FRAGMENT_SOURCE = '#version 330 core\n#include "sceneFragment.txt"\n'
+FRAMES = 200
+
+def open_context():
+
+    glfw.init()
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MAJOR,3)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MINOR,3)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_OPENGL_PROFILE,GLFW_CONSTANTS.GLFW_OPENGL_CORE_PROFILE)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_OPENGL_FORWARD_COMPAT,GLFW_CONSTANTS.GLFW_TRUE)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_VISIBLE,GLFW_CONSTANTS.GLFW_FALSE)
+    window = glfw.create_window(256,256,"drawCalls",None,None)
+    if not window:
+        raise RuntimeError("could not make an OpenGL 3.3 context")
+    glfw.make_context_current(window)
+    return window
+
+def make_shaders(folder:str) -> tuple[Shader,Shader]:
+    """ The instanced and the model uniform variants """
+
+    vertex_path = os.path.join(folder,"vertex.txt")
+    fragment_path = os.path.join(folder,"fragment.txt")
+    with open(vertex_path,'w') as f:
+        f.write(VERTEX_SOURCE)
+    with open(fragment_path,'w') as f:
+        f.write(FRAGMENT_SOURCE)
+
+    instanced = Shader(vertex_path,fragment_path,cache=False,defines={"INSTANCED": None})
+    static = Shader(vertex_path,fragment_path,cache=False)
+    for shader in (instanced,static):
+        shader.setUniforms({
+            "flatColor": np.ones(4,dtype=np.float32),
+            "positionScale": np.ones(3,dtype=np.float32),
+            "positionOffset": np.zeros(3,dtype=np.float32),
+        })
+    static.setUniform("model",np.identity(4,dtype=np.float32))
+    return instanced,static
+
+def instanced_frame(kinds:list) -> int:
+    """ A frame drawn a mesh kind at a time, returns the draw calls made """
+
+    draws = 0
+    for mesh,instances,transforms in kinds:
+        mesh.bind()
+        instances.upload(transforms)
+        for _,first,count in mesh.ranges:
+            mesh.draw_range_instanced(first,count,instances.count)
+            draws += 1
+    return draws
+
+def pooled_frame(pool:MeshPool) -> int:
+    """ A frame drawn from the static pool, returns the draw calls made """
+
+    pool.bind()
+    pool.draw_meshes(pool.meshes)
+    return 1
+
+def measure(frame, shader:Shader) -> tuple[float,int,int]:
+    """ Seconds per frame, and the vao binds and draw calls of one frame """
+
+    #every bind counts, as after the previous pass of a real frame
+    gl_state.reset()
+    shader.use()
+    issued = gl_state.issued
+    draws = frame()
+    binds = gl_state.issued - issued
+
+    glFinish()
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        frame()
+    glFinish()
+    return (time.perf_counter() - start) / FRAMES,binds,draws
+
+def main(kind_count:int, per_kind:int) -> None:
+
+    window = open_context()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as folder:
+        instanced,static = make_shaders(folder)
+        kinds = []
+        pool = MeshPool()
+        for kind in range(kind_count):
+            filename = os.path.join(folder,f"kind{kind}.obj")
+            write_grid_obj(filename,64 + 16*kind)
+            mesh = ObjMesh(filename,indexed=True,cache=False)
+            eulers = np.zeros((per_kind,3),dtype=np.float32)
+            eulers[:,2] = rng.uniform(0,360,per_kind)
+            transforms = model_transforms(
+                rng.uniform(-50,50,(per_kind,3)).astype(np.float32),eulers
+            )
+            kinds.append((mesh,InstanceBuffer(mesh,per_kind),transforms))
+
+            data = load_mesh_data(filename,True,False)
+            for transform in transforms:
+                pool.add(*data,transform=transform)
+
+        glViewport(0,0,256,256)
+        print(f"{kind_count} mesh kinds, {per_kind} static entities each")
+        print(f"{'':>10} {'vao binds':>10} {'draws':>7} {'frame':>10}")
+        for name,frame,shader in (
+            ("instanced",lambda: instanced_frame(kinds),instanced),
+            ("pooled",lambda: pooled_frame(pool),static)):
+            seconds,binds,draws = measure(frame,shader)
+            print(f"{name:>10} {binds:>10} {draws:>7} {seconds*1e3:>8.3f}ms")
+
+        for mesh,instances,_ in kinds:
+            instances.destroy()
+            mesh.destroy()
+        pool.destroy()
+        instanced.deletePgm()
+        static.deletePgm()
+    glfw.destroy_window(window)
+    glfw.terminate()
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [64,16][len(args):]))
@@ -0,0 +1,68 @@
+import sys
+sys.path.insert(0,'..')
+import time
+import numpy as np
+import pyrr
+from tools.Entities import Cube,Square,Player
+from tools.Scene import Scene
+
+"""
+    Per frame cost of the model transforms of every entity: one
+    pyrr identity/rotation/translation/multiply chain per entity,
+    against one vectorized pass over the scene's archetypes, and the
+    same scene of static squares, whose transforms stay cached.
+    Usage:
+        python entityTransforms.py [count ...]     (default 10000 100000)
+"""
+
+def pyrr_transform(entity:Cube) -> np.ndarray:
+    """ The per entity path get_model_transform used to take """
+
+    model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
+    model_transform = pyrr.matrix44.multiply(
+        m1=model_transform,
+        m2=pyrr.matrix44.create_from_z_rotation(
+            theta=np.radians(entity.eulers[2]),dtype=np.float32
+        )
+    )
+    return pyrr.matrix44.multiply(
+        m1=model_transform,
+        m2=pyrr.matrix44.create_from_translation(vec=entity.position,dtype=np.float32)
+    )
+
+def best_of(function, repeats:int) -> float:
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best,time.perf_counter() - start)
+    return best
+
+def main(counts:list[int]) -> None:
+
+    print(f"{'entities':>10} {'per entity':>12} {'batched':>10} {'speedup':>8} {'static':>10}")
+    rng = np.random.default_rng(0)
+    for count in counts:
+        cubes = [
+            Cube(position,[0,0,angle],1)
+            for position,angle in zip(rng.uniform(-100,100,(count,3)),rng.uniform(0,360,count))
+        ]
+        scene = Scene({1: cubes},Player([0,0,0],[0,0,0],2))
+
+        batched = best_of(scene.model_transforms,10)
+        per_entity = best_of(lambda: [pyrr_transform(cube) for cube in scene.renderables[1]],1)
+
+        expected = np.array([pyrr_transform(cube) for cube in scene.renderables[1][:100]])
+        assert np.allclose(scene.model_transforms()[1][:100],expected,atol=1e-5)
+
+        squares = [Square(cube.position,cube.eulers,2) for cube in scene.renderables[1]]
+        static_scene = Scene({2: squares},Player([0,0,0],[0,0,0],2))
+        static_scene.update(1.0)
+        static = best_of(lambda: (static_scene.update(1.0),static_scene.model_transforms()),10)
+        assert np.allclose(static_scene.model_transforms()[2][:100],expected,atol=1e-5)
+        print(f"{count:>10} {per_entity*1000:>10.1f}ms {batched*1000:>8.2f}ms "
+              f"{per_entity/batched:>7.0f}x {static*1000:>8.2f}ms")
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or [10000,100000])
@@ -0,0 +1,51 @@
+import sys
+sys.path.insert(0,'..')
+import time
+import numpy as np
+from tools.Entities import Cube
+from tools.ECS import World
+
+"""
+    Per frame update cost of spinning cubes: the update(rate) method
+    Scene.update used to call on every cube, against spin_system
+    running over the cubes' archetype columns.
+    Usage:
+        python entityUpdate.py [count ...]     (default 10000 100000 1000000)
+"""
+
+def cube_update(cube:Cube, rate:float) -> None:
+    """ What Cube.update used to do """
+
+    cube.eulers[2] += 0.25 * rate
+    if cube.eulers[2] > 360:
+        cube.eulers[2] -= 360
+
+def best_of(function, repeats:int) -> float:
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best,time.perf_counter() - start)
+    return best
+
+def main(counts:list[int]) -> None:
+
+    print(f"{'entities':>10} {'per entity':>12} {'systems':>10} {'speedup':>8}")
+    rng = np.random.default_rng(0)
+    for count in counts:
+        world = World()
+        eulers = np.zeros((count,3),dtype=np.float32)
+        eulers[:,2] = rng.uniform(0,360,count)
+        cubes = world.spawn(Cube,1,rng.uniform(-100,100,(count,3)),eulers)
+
+        systems = best_of(lambda: world.run_systems(1.0),10)
+        per_entity = best_of(lambda: [cube_update(cube,1.0) for cube in cubes],1)
+
+        angles = world.query("spin")[0].column("eulers")[:,2]
+        assert np.all((angles >= 0) & (angles <= 360))
+        print(f"{count:>10} {per_entity*1000:>10.1f}ms {systems*1000:>8.2f}ms "
+              f"{per_entity/systems:>7.0f}x")
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or [10000,100000,1000000])
@@ -0,0 +1,42 @@
+import sys
+sys.path.insert(0,'..')
+import os
+import tempfile
+import time
+import numpy as np
+from tools.Objects import load_mesh_data
+from synthetic import write_grid_obj
+
+"""
+    Cold versus warm load times of the binary mesh cache.
+    Cold: parse the obj and write the cache.
+    Warm: memory map the cache and touch every byte once,
+    as glBufferData would.
+    Usage:
+        python meshCache.py [triangle counts...]
+"""
+
+SIZES = [10_000,100_000,1_000_000]
+
+def timed_load(filename:str, indexed:bool) -> float:
+    start = time.perf_counter()
+    vertices,indices,_ = load_mesh_data(filename,indexed)
+    np.add.reduce(vertices)
+    if indices is not None:
+        np.add.reduce(indices)
+    return time.perf_counter() - start
+
+def main(sizes:list[int]) -> None:
+
+    print(f"{'triangles':>10} {'indexed':>8} {'cold':>10} {'warm':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            filename = os.path.join(folder,f"grid_{size}.obj")
+            triangles = write_grid_obj(filename,size)
+            for indexed in (False,True):
+                cold = timed_load(filename,indexed)
+                warm = timed_load(filename,indexed)
+                print(f"{triangles:>10} {str(indexed):>8} {cold:>9.3f}s {warm:>9.4f}s {cold/warm:>7.0f}x")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
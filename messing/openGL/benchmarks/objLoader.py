@@ -0,0 +1,49 @@
+import sys
+sys.path.insert(0,'..')
+import os
+import tempfile
+import time
+import numpy as np
+from tools.Objects import load_model_from_file,load_model_array
+from synthetic import write_grid_obj
+
+"""
+    Compare the line by line obj loader with the bulk numpy loader.
+    Usage:
+        python objLoader.py [triangle counts...]
+    The line by line loader is skipped above 1M triangles,
+    it takes minutes and several GB of memory.
+"""
+
+SIZES = [10_000,100_000,1_000_000,5_000_000]
+LEGACY_LIMIT = 1_000_000
+
+def time_call(function,*args) -> tuple[float,np.ndarray]:
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def main(sizes:list[int]) -> None:
+
+    print(f"{'triangles':>10} {'lines':>10} {'numpy':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            filename = os.path.join(folder,f"grid_{size}.obj")
+            triangles = write_grid_obj(filename,size)
+
+            fast,vertices = time_call(load_model_array,filename)
+
+            if triangles <= LEGACY_LIMIT:
+                slow,legacy = time_call(
+                    lambda name: np.array(load_model_from_file(name),dtype=np.float32),
+                    filename
+                )
+                assert np.array_equal(legacy,vertices)
+                print(f"{triangles:>10} {slow:>9.3f}s {fast:>9.3f}s {slow/fast:>7.1f}x")
+            else:
+                print(f"{triangles:>10} {'-':>10} {fast:>9.3f}s {'-':>8}")
+
+            os.remove(filename)
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,25 @@
+import sys
+sys.path.insert(0,'..')
+from tools.Objects import load_model_array
+from tools.VertexFormat import VERTEX_FORMATS,quantization_error
+
+"""
+    Report the largest error each compact vertex format brings
+    into the given meshes, and the bytes per vertex it saves.
+    Usage:
+        python quantizationError.py model.obj [model.obj ...]
+"""
+
+def main(filenames:list[str]) -> None:
+
+    print(f"{'mesh':<30} {'format':<10} {'bytes':>5} {'position':>10} {'texcoord':>10} {'normal':>8}")
+    for filename in filenames:
+        vertices = load_model_array(filename)
+        for vertex_format,layout in VERTEX_FORMATS.items():
+            error = quantization_error(vertices,vertex_format)
+            print(f"{filename[-30:]:<30} {vertex_format:<10} {layout.itemsize:>5} "
+                  f"{error['position']:>10.2e} {error['texcoord']:>10.2e} "
+                  f"{error['normal']:>7.3f}d")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
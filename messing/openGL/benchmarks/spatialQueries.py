@@ -0,0 +1,85 @@
+import sys
+sys.path.insert(0,'..')
+import time
+import numpy as np
+import pyrr
+from tools.Entities import Cube,Square,Player
+from tools.Culling import Frustum
+from tools.Spatial import SpatialGrid
+from tools.Scene import Scene
+
+"""
+    Radius, nearest neighbour and frustum queries through the spatial
+    grid against scanning every entity, with entities spread over a
+    400 unit cube. First checks that Scene.update re-indexes entities
+    moved through their setters.
+    Usage:
+        python spatialQueries.py [count ...]     (default 10000 100000)
+"""
+
+def best_of(function, repeats:int = 20) -> float:
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best,time.perf_counter() - start)
+    return best
+
+def check_moved() -> None:
+    """ Entities moved by setters are found at their new place after Scene.update """
+
+    cube = Cube([0,6,2],[0,0,0],1)
+    square = Square([6,0,2],[0,0,0],0)
+    scene = Scene({0: [square], 1: [cube]},Player([0,0,2],[0,0,0],2))
+    cube.position = [100,100,100]
+    square.set_component("position",[200,0,0])
+    scene.update(0)
+    assert scene.spatial.query_radius([0,0,0],10) == []
+    assert scene.spatial.query_radius([100,100,100],10) == [cube]
+    assert scene.spatial.query_radius([200,0,0],10) == [square]
+
+    cube.position[:] = [-50,0,0]
+    cube.moved()
+    scene.update(0)
+    assert scene.spatial.query_radius([-50,0,0],1) == [cube]
+    print("moved entities re-indexed")
+
+def main(counts:list[int]) -> None:
+
+    check_moved()
+    camera = Player([0,0,2],[0,0,30],2)
+    camera.update()
+    frustum = Frustum()
+    frustum.update(
+        pyrr.matrix44.create_perspective_projection(45,4/3,0.1,100,dtype=np.float32),
+        camera.get_view_transform()
+    )
+    point = np.array([3,4,5],dtype=np.float32)
+
+    print(f"{'entities':>10} {'query':>8} {'scan':>10} {'grid':>10}")
+    rng = np.random.default_rng(0)
+    for count in counts:
+        positions = rng.uniform(-200,200,(count,3)).astype(np.float32)
+        cubes = [Cube(position,[0,0,0],1) for position in positions]
+        grid = SpatialGrid(10)
+        for cube in cubes:
+            grid.insert(cube)
+
+        #the scans get the positions as one array, their best case
+        scans = {
+            "radius": lambda: np.flatnonzero(np.sum((positions - point)**2,axis=1) <= 25*25),
+            "nearest": lambda: np.argpartition(np.linalg.norm(positions - point,axis=1),5)[:5],
+            "frustum": lambda: np.flatnonzero(frustum.spheres_visible(positions,1.0)),
+        }
+        queries = {
+            "radius": lambda: grid.query_radius(point,25),
+            "nearest": lambda: grid.nearest(point,5),
+            "frustum": lambda: grid.query_frustum(frustum,1.0),
+        }
+        for name in scans:
+            print(f"{count:>10} {name:>8} {best_of(scans[name])*1000:>8.3f}ms "
+                  f"{best_of(queries[name])*1000:>8.3f}ms")
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or [10000,100000])
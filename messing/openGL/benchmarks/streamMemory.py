@@ -0,0 +1,87 @@
+import sys
+sys.path.insert(0,'..')
+import os
+import tempfile
+import tracemalloc
+from tools.Objects import load_model_array,load_model_chunks
+from synthetic import write_grid_obj
+
+"""
+    Peak host memory of the whole file loader versus the streaming
+    loader, measured with tracemalloc (numpy reports its buffers to it).
+    The streamed chunks are dropped instead of uploaded, like
+    glBufferSubData would leave them.
+    The whole streaming peak must stay under CHUNK_LIMIT chunks, and
+    must not grow with the model: it is streamed at a quarter of the
+    triangles first and the peaks of both sizes are compared. The
+    v, vt, vn tables are memory mapped (see load_model_chunks), their
+    pages belong to the os, not the loader.
+    Usage:
+        python streamMemory.py [triangles] [chunk MB]
+    The default of 60M triangles writes an obj of roughly 3 GB,
+    the whole file loader is only run below 5M triangles.
+"""
+
+TRIANGLES = 60_000_000
+CHUNK_MB = 16
+WHOLE_FILE_LIMIT = 5_000_000
+#streaming peak allowed, in chunks
+CHUNK_LIMIT = 20
+#allowed peak growth from a quarter to all of the triangles
+GROWTH_LIMIT = 1.1
+#the peak is reached with two full blocks of faces in flight, the
+#growth is only compared when the smaller obj is this many chunks
+GROWTH_MIN_CHUNKS = 8
+
+def peak_megabytes(function,*args) -> float:
+    tracemalloc.start()
+    function(*args)
+    _,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20
+
+def stream_peak(filename:str, chunk_bytes:int) -> float:
+    """ Peak MB of streaming the file """
+
+    def stream() -> None:
+        _,chunks = load_model_chunks(filename,chunk_bytes)
+        for chunk in chunks:
+            pass
+
+    return peak_megabytes(stream)
+
+def main(triangles:int, chunk_mb:int) -> None:
+
+    peaks = []
+    file_mbs = []
+    for count in (triangles // 4,triangles):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder,"grid.obj")
+            count = write_grid_obj(filename,count)
+            file_mb = os.path.getsize(filename) / 2**20
+            file_mbs.append(file_mb)
+            vbo_mb = count*3*32 / 2**20
+            print(f"{count} triangles, obj {file_mb:.0f} MB, vbo {vbo_mb:.0f} MB")
+
+            if count < WHOLE_FILE_LIMIT:
+                whole = peak_megabytes(load_model_array,filename)
+                print(f"    whole file peak: {whole:.0f} MB")
+
+            peak = stream_peak(filename,chunk_mb << 20)
+            peaks.append(peak)
+            print(f"    streamed peak ({chunk_mb} MB chunks): {peak:.0f} MB, "
+                  f"{peak/chunk_mb:.1f} chunks")
+            assert peak <= CHUNK_LIMIT*chunk_mb, \
+                f"streaming peak is over {CHUNK_LIMIT} chunks"
+
+    if file_mbs[0] < GROWTH_MIN_CHUNKS*chunk_mb:
+        print(f"streaming peak is bounded, the models are too small "
+              f"(under {GROWTH_MIN_CHUNKS} chunks) to compare its growth")
+        return
+    assert peaks[1] <= GROWTH_LIMIT*peaks[0], \
+        "streaming peak grows with the model"
+    print("streaming peak is bounded and independent of the model size")
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [TRIANGLES,CHUNK_MB][len(args):]))
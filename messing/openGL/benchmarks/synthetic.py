@@ -0,0 +1,49 @@
+import numpy as np
+
+"""
+    Generate synthetic models for the benchmarks
+"""
+
+def write_grid_obj(filename:str, triangles:int) -> int:
+    """
+        Write a flat grid of quads to an obj file, in the same
+        v/vt/vn layout blender exports. Written a few rows at a
+        time so multi GB files don't need multi GB of memory.
+        Returns the number of triangles actually written
+        (rounded to a whole square grid).
+    """
+
+    side = max(1,int(np.sqrt(triangles/2)))
+    points = side + 1
+    rows_per_batch = max(1,(1 << 20) // points)
+    coords = np.linspace(-1,1,points,dtype=np.float32)
+
+    with open(filename,'w') as f:
+        f.write("# synthetic grid\n")
+
+        for first_row in range(0,points,rows_per_batch):
+            ys = coords[first_row:first_row + rows_per_batch]
+            xs,ys = np.meshgrid(coords,ys)
+            positions = np.stack((xs.ravel(),ys.ravel(),np.zeros(xs.size)),axis=1)
+            np.savetxt(f,positions,fmt="v %.6f %.6f %.6f")
+
+        for first_row in range(0,points,rows_per_batch):
+            ys = coords[first_row:first_row + rows_per_batch]
+            xs,ys = np.meshgrid(coords,ys)
+            texcoords = np.stack((xs.ravel(),ys.ravel()),axis=1) * 0.5 + 0.5
+            np.savetxt(f,texcoords,fmt="vt %.6f %.6f")
+
+        f.write("vn 0.0000 0.0000 1.0000\n")
+
+        #corner indices of every quad, 1 based
+        for first_row in range(0,side,rows_per_batch):
+            last_row = min(side,first_row + rows_per_batch)
+            corner = np.arange(first_row*side,last_row*side)
+            corner = corner // side * points + corner % side + 1
+            quads = np.stack((corner,corner+1,corner+points+1,corner+points),axis=1)
+            np.savetxt(
+                f,np.repeat(quads,2,axis=1),
+                fmt="f %d/%d/1 %d/%d/1 %d/%d/1 %d/%d/1"
+            )
+
+    return side*side*2
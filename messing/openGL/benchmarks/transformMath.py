@@ -0,0 +1,123 @@
+import sys
+sys.path.insert(0,'..')
+import time
+import tracemalloc
+import numpy as np
+import pyrr
+from tools.Transforms import (
+    model_transform,model_transforms,camera_vectors,camera_bases,
+    view_transform,view_transforms,perspective_projection
+)
+
+"""
+    The pyrr path the entities and camera used to take against the
+    closed form out= kernels of tools.Transforms: time per call and the
+    bytes of temporary arrays each call leaves for the collector.
+    Usage:
+        python transformMath.py [count]     (batch size, default 10000)
+"""
+
+def pyrr_model(position, eulers) -> np.ndarray:
+
+    model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
+    model_transform = pyrr.matrix44.multiply(
+        m1=model_transform,
+        m2=pyrr.matrix44.create_from_z_rotation(theta=np.radians(eulers[2]),dtype=np.float32)
+    )
+    return pyrr.matrix44.multiply(
+        m1=model_transform,
+        m2=pyrr.matrix44.create_from_translation(vec=position,dtype=np.float32)
+    )
+
+def pyrr_vectors(eulers) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+
+    forwards = np.array(
+        [
+        np.cos(np.radians(eulers[2]))*np.cos(np.radians(eulers[1])),
+        np.sin(np.radians(eulers[2]))*np.cos(np.radians(eulers[1])),
+        np.sin(np.radians(eulers[1]))
+        ],
+        dtype=np.float32
+    )
+    right = pyrr.vector.normalise(np.cross(forwards,np.array([0,0,1],dtype=np.float32)))
+    up = pyrr.vector.normalise(np.cross(right,forwards))
+    return forwards,right,up
+
+def pyrr_view(position, forwards, up) -> np.ndarray:
+
+    return pyrr.matrix44.create_look_at(
+        eye=position,target=position + forwards,up=up,dtype=np.float32
+    )
+
+def pyrr_projection() -> np.ndarray:
+
+    return pyrr.matrix44.create_perspective_projection(45,4/3,0.1,100,dtype=np.float32)
+
+def measure(function, repeats:int) -> tuple[float,int]:
+    """ Best seconds per call, and the peak bytes of temporaries of one call """
+
+    function()
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best,time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    current,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best,peak
+
+def report(name:str, old, new, repeats:int) -> None:
+
+    old_time,old_bytes = measure(old,repeats)
+    new_time,new_bytes = measure(new,repeats)
+    print(f"{name:>22} {old_time*1e6:>10.1f}us {new_time*1e6:>9.1f}us "
+          f"{old_time/new_time:>7.1f}x {old_bytes:>10} {new_bytes:>8}")
+
+def main(count:int) -> None:
+
+    rng = np.random.default_rng(0)
+    position = rng.uniform(-100,100,3).astype(np.float32)
+    eulers = np.array([0,30,120],dtype=np.float32)
+    forwards,right,up = (np.zeros(3,dtype=np.float32) for _ in range(3))
+    matrix = np.zeros((4,4),dtype=np.float32)
+
+    positions = rng.uniform(-100,100,(count,3)).astype(np.float32)
+    angles = rng.uniform(0,360,(count,3)).astype(np.float32)
+    angles[:,1] = rng.uniform(-89,89,count)
+    bases = [np.zeros((count,3),dtype=np.float32) for _ in range(3)]
+    matrices = np.zeros((count,4,4),dtype=np.float32)
+
+    #same results before timing anything
+    camera_vectors(eulers,forwards,right,up)
+    for expected,got in zip(pyrr_vectors(eulers),(forwards,right,up)):
+        assert np.allclose(expected,got,atol=1e-5)
+    assert np.allclose(pyrr_model(position,eulers),model_transform(position,eulers),atol=1e-4)
+    assert np.allclose(pyrr_view(position,forwards,up),view_transform(position,forwards,right,up),atol=1e-3)
+    assert np.allclose(pyrr_projection(),perspective_projection(45,4/3,0.1,100))
+
+    print(f"{'':>22} {'pyrr':>12} {'Transforms':>11} {'speedup':>8} {'pyrr bytes':>10} {'bytes':>8}")
+    report("model",
+           lambda: pyrr_model(position,eulers),
+           lambda: model_transform(position,eulers,matrix),1000)
+    report("camera vectors",
+           lambda: pyrr_vectors(eulers),
+           lambda: camera_vectors(eulers,forwards,right,up),1000)
+    report("view",
+           lambda: pyrr_view(position,forwards,up),
+           lambda: view_transform(position,forwards,right,up,matrix),1000)
+    report("projection",
+           pyrr_projection,
+           lambda: perspective_projection(45,4/3,0.1,100,matrix),1000)
+
+    report(f"{count} models",
+           lambda: [pyrr_model(p,e) for p,e in zip(positions,angles)],
+           lambda: model_transforms(positions,angles,matrices),3)
+    report(f"{count} views",
+           lambda: [pyrr_view(p,*pyrr_vectors(e)[0:3:2]) for p,e in zip(positions,angles)],
+           lambda: (camera_bases(angles,*bases),view_transforms(positions,*bases,matrices)),3)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,25 @@
+import sys
+sys.path.insert(0,'..')
+import time
+from tools.Objects import parse_mesh_data
+
+"""
+    Average cache miss ratio of indexed meshes as exported and after
+    the vertex cache optimisation ObjMesh applies (paid once, the
+    result is kept in the mesh cache).
+    Usage:
+        python vertexCache.py model.obj [model.obj ...]
+"""
+
+def main(filenames:list[str]) -> None:
+
+    print(f"{'mesh':<30} {'triangles':>10} {'exported':>9} {'optimized':>9} {'time':>8}")
+    for filename in filenames:
+        start = time.perf_counter()
+        _,indices,submeshes = parse_mesh_data(filename,indexed=True)
+        elapsed = time.perf_counter() - start
+        before,after = submeshes["acmr"]
+        print(f"{filename[-30:]:<30} {len(indices)//3:>10} {before:>9.3f} {after:>9.3f} {elapsed:>7.2f}s")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -4,12 +4,20 @@ import glfw
 import glfw.GLFW as GLFW_CONSTANTS
 from OpenGL.GL import *
 from tools.Entities import Entity,Player,Square,Cube
-from tools.Objects import Mesh,ObjMesh,Material
-from tools.Shader import Shader as sdr
+from tools.Objects import Mesh,Material
+from tools.MeshPool import MeshPool
+from tools.Loader import AssetLoader
+from tools.Assets import AssetRegistry
+from tools.Lod import LodMesh
+from tools.Culling import Frustum
+from tools.GLState import gl_state
+from tools.Shader import CameraBlock
+from tools.Instancing import InstanceBuffer
 from tools.Setup import AppSetup
 from tools.Scene import Scene
+from tools.Spatial import SpatialGrid
+from tools.Transforms import perspective_projection
 import numpy as np
-import pyrr
 
 
 """
@@ -39,6 +47,13 @@ CUBE_txt_pth = "gfx/wood.jpeg"
 SCREEN_pth = "models/screen.obj"
 scn_sdr_vtx_pth = "shaders/vertex.txt"
 scn_sdr_frg_pth = "shaders/fragment.txt"
+#variant of the shared scene shaders, see tools/shaders
+SCENE_DEFINES = {"TEXTURED": None, "INSTANCED": None}
+#the static batch is in world space, drawn with an identity model
+STATIC_DEFINES = {"TEXTURED": None}
+#flat colored stand-ins, drawn with until the variants above are linked
+FALLBACK_DEFINES = {"INSTANCED": None}
+FALLBACK_COLOR = np.array([0.5, 0.5, 0.5, 1.0], dtype=np.float32)
 scrn_sdr_vtx_pth = "shaders/screenVertex.txt"
 scrn_sdr_frg_pth = "shaders/screenFragment.txt"
 
@@ -80,6 +95,7 @@ class Stage(Scene):
             eulers=[0,0,0],
             OBJECT_CAMERA=OBJECT_CAMERA
         )
+        self.build_stores()
 
 ################### Control ###################################################
 
@@ -96,10 +112,16 @@ class App(AppSetup):
     def make_objects(self) -> None:
         """ Make any object used by the App"""
 
+        self.scene = Stage()
+        #types whose entities are all static are baked into one pool
+        static_types = {
+            objectType for objectType,objectList in self.scene.renderables.items()
+            if objectList and all(entity.static for entity in objectList)
+        }
         self.renderer = Renderer(
-            self.screenWidth, self.screenHeight, self.window
+            self.screenWidth, self.screenHeight, self.window, static_types
         )
-        self.scene = Stage()
+        self.renderer.batch_static(self.scene.model_transforms())
     
     def mainLoop(self) -> None:
         """ Run the App """
@@ -122,7 +144,9 @@ class App(AppSetup):
             
             self.renderer.render(
                 camera = self.scene.camera,
-                renderables = self.scene.renderables
+                renderables = self.scene.renderables,
+                transforms = self.scene.model_transforms(),
+                spatial = self.scene.spatial
             )
 
             #timing
@@ -138,10 +162,12 @@ class Renderer:
     def __init__(
             self,
             screenWidth: int,screenHeight: int,
-            window) -> None:
+            window, static_types: set[int] = ()) -> None:
         
         self.screenWidth = screenWidth
         self.screenHeight = screenHeight
+        #drawn from the static pool, see batch_static
+        self.static_types: set[int] = set(static_types)
 
         self.set_up_opengl(window)
         self.make_assets()
@@ -157,10 +183,10 @@ class Renderer:
         (w,h) = glfw.get_framebuffer_size(window)
         glViewport(0,0,w, h)
 
-        glEnable(GL_DEPTH_TEST)
+        gl_state.enable(GL_DEPTH_TEST)
         glDepthFunc(GL_LESS)
 
-        glEnable(GL_BLEND)
+        gl_state.enable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
     def make_assets(self) -> None:
@@ -169,38 +195,123 @@ class Renderer:
             the renderer will use.
         """
 
-        self.meshes: dict[int, Mesh] = {
-            OBJECT_SQUARE: ObjMesh(SQUARE_pth),
+        self.assets = AssetRegistry()
+        #variants of the scene shaders, each compiled on first use in render
+        self.scene_variants = self.assets.get_shader_variants(scn_sdr_vtx_pth, scn_sdr_frg_pth)
+        #small enough to wait for, see readyOr in render
+        self.SCENEfallback = self.assets.get_shader(
+            scn_sdr_vtx_pth, scn_sdr_frg_pth, defines = FALLBACK_DEFINES
+        )
+        self.STATICfallback = self.assets.get_shader(scn_sdr_vtx_pth, scn_sdr_frg_pth)
+        #the screen pass has no stand-in
+        self.SCREENshader = self.assets.get_shader(scrn_sdr_vtx_pth,scrn_sdr_frg_pth)
+        loader = AssetLoader(registry = self.assets)
+        self.mesh_paths = {OBJECT_SQUARE: SQUARE_pth, OBJECT_CUBE: CUBE_pth}
+        mesh_options = {OBJECT_SQUARE: {}, OBJECT_CUBE: {"indexed": True, "vertex_format": "quantized"}}
+        for objectType,path in self.mesh_paths.items():
+            if objectType in self.static_types:
+                #only decoded, batch_static copies the data into the pool
+                loader.add_mesh(objectType, path, indexed = True, upload = False)
+            else:
+                loader.add_mesh(objectType, path, **mesh_options[objectType])
+            loader.add_material(objectType, CUBE_txt_pth)
+        loader.add_mesh(SCREEN_pth, SCREEN_pth)
+
+        meshes,materials = loader.load()
+        self.screenobj = meshes.pop(SCREEN_pth)
+        self.static_data: dict[int, tuple] = {
+            objectType: meshes.pop(objectType) for objectType in self.static_types
         }
-
-        self.materials: dict[int, Material] = {
-            OBJECT_SQUARE: Material(CUBE_txt_pth),
+        self.meshes: dict[int, Mesh] = meshes
+        self.materials: dict[int, Material] = materials
+        #textures named by each mesh's mtl file, per submesh material
+        self.range_materials: dict[int, dict[str, Material]] = {
+            objectType: self.assets.get_mesh_materials(mesh)
+            for objectType,mesh in self.meshes.items()
         }
+        #bounding sphere around an entity's position that holds its
+        #mesh however it is turned, for the spatial grid's frustum query
+        self.cull_radius = max(
+            [float(np.linalg.norm(mesh.bounding_center)) + mesh.bounding_radius
+             for mesh in self.meshes.values()],
+            default = 0.0
+        )
+        #per instance transforms, one buffer per vao drawn
+        self.instance_buffers: dict[int, InstanceBuffer] = {}
+        #reduced versions for entities far from the camera
+        self.lods: dict[int, LodMesh] = {}
+        if OBJECT_CUBE in self.meshes:
+            self.lods[OBJECT_CUBE] = LodMesh(
+                CUBE_pth, base = self.meshes[OBJECT_CUBE], vertex_format = "quantized"
+            )
 
-        self.meshes[OBJECT_CUBE] = ObjMesh(CUBE_pth)
-             
-        self.materials[OBJECT_CUBE] = Material(CUBE_txt_pth)
-
-        self.screenobj = ObjMesh(SCREEN_pth)
+        #entities that never move, baked into one pool, see batch_static
+        self.static_pool = MeshPool()
+        #material: (pooled mesh number, first index, count) to draw with it
+        self.static_ranges: dict[Material, list[tuple[int,int,int]]] = {}
+        self.static_centers = np.zeros((0,3),dtype=np.float32)
+        self.static_radii = np.zeros(0,dtype=np.float32)
 
-        self.SCENEshader = sdr(scn_sdr_vtx_pth, scn_sdr_frg_pth)
-        self.SCREENshader = sdr(scrn_sdr_vtx_pth,scrn_sdr_frg_pth)
         self.fbo = frameBuffer()
 
+    def batch_static(self, transforms: dict[int, np.ndarray]) -> None:
+        """
+            Bake every entity of the static types into the static
+            pool at its transform, render then draws them from there
+            (see render_static) instead of instancing them.
+            The entities must not move after.
+        """
+
+        for objectType,data in self.static_data.items():
+            for transform in transforms[objectType]:
+                mesh = self.static_pool.add(
+                    *data, transform = transform, filename = self.mesh_paths[objectType]
+                )
+                number = len(self.static_pool.meshes) - 1
+                if objectType not in self.range_materials:
+                    self.range_materials[objectType] = self.assets.get_mesh_materials(mesh)
+                for name,first,count in mesh.ranges:
+                    material = self.range_materials[objectType].get(
+                        name, self.materials[objectType]
+                    )
+                    self.static_ranges.setdefault(material, []).append((number,first,count))
+        #the pool holds its own copy now
+        self.static_data.clear()
+
+        meshes = self.static_pool.meshes
+        self.static_centers = np.array(
+            [mesh.bounding_center for mesh in meshes], dtype=np.float32
+        ).reshape(-1,3)
+        self.static_radii = np.array([mesh.bounding_radius for mesh in meshes], dtype=np.float32)
+
     def set_onetime_uniforms(self) -> None:
         """ Set any uniforms which can simply get set once and forgotten """
 
-        projection_transform = pyrr.matrix44.create_perspective_projection(
+        projection_transform = perspective_projection(
             fovy = 45, aspect = self.screenWidth / self.screenHeight, 
-            near = 0.1, far = 100, dtype = np.float32
+            near = 0.1, far = 100
         )
-
-        self.SCENEshader.setMat4fv("projection",projection_transform)
-        self.SCENEshader.setInt("imageTexture",0)
+        self.projection = projection_transform
+        self.frustum = Frustum()
+        #view and projection reach every program through this block
+        self.camera_block = CameraBlock()
+
+        static_uniforms = {
+            "model": np.identity(4, dtype=np.float32),
+            "positionScale": np.ones(3, dtype=np.float32),
+            "positionOffset": np.zeros(3, dtype=np.float32),
+        }
+        #set on each scene variant when it is made, see render
+        self.scene_uniforms = {"imageTexture": 0}
+        self.static_uniforms = {"imageTexture": 0, **static_uniforms}
+        self.SCENEfallback.setUniforms({"flatColor": FALLBACK_COLOR})
+        self.STATICfallback.setUniforms({"flatColor": FALLBACK_COLOR, **static_uniforms})
 
     def render(
             self, camera: Player, 
-        renderables: dict[int, list[Entity]]) -> None:
+        renderables: dict[int, list[Entity]],
+        transforms: dict[int, np.ndarray],
+        spatial: SpatialGrid) -> None:
         """
             Render a frame.
             Parameters:
@@ -208,44 +319,126 @@ class Renderer:
                 renderables: a dictionary of entities to draw, keys are the
                             entity types, for each of these there is a list
                             of entities.
+                transforms: the entities' model transforms, per type one
+                            (count, 4, 4) array in the order of renderables
+                spatial: the scene's index of the renderables' positions
         """
 
         #refresh screen
         self.fbo.use()
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         
-        self.SCENEshader.use()
-
-        self.SCENEshader.setMat4fv("view", camera.get_view_transform())
+        shader = self.scene_variants.get(
+            SCENE_DEFINES, wait = False, uniforms = self.scene_uniforms
+        ).readyOr(self.SCENEfallback)
+        shader.use()
+
+        view_transform = camera.get_view_transform()
+        self.camera_block.update(view_transform, self.projection, camera.position)
+        #drawn/culled counts are per frame
+        self.frustum.update(self.projection, view_transform)
+        self.frustum.reset_stats()
+        #the grid narrows the scene down to the entities near the view
+        near = {id(entity) for entity in spatial.query_frustum(self.frustum, self.cull_radius)}
 
         for objectType,objectList in renderables.items():
-            mesh = self.meshes[objectType]
-            material = self.materials[objectType]
-            glBindVertexArray(mesh.vao)
-            material.use()
-            for object in objectList:
-                self.SCENEshader.setMat4fv("model",object.get_model_transform())
-                glDrawArrays(GL_TRIANGLES, 0,mesh.vertex_count)
-
-        glBindFramebuffer(GL_FRAMEBUFFER,0)
-        glDisable(GL_DEPTH_TEST)
+            if not objectList or objectType in self.static_types:
+                continue
+            all_transforms = transforms[objectType]
+            rows = np.array(
+                [i for i,entity in enumerate(objectList) if id(entity) in near], dtype=np.intp
+            )
+            self.frustum.culled += len(objectList) - len(rows)
+            #reduced levels lie inside the full mesh's bounds
+            visible = rows[self.frustum.cull(all_transforms[rows], self.meshes[objectType])]
+            if objectType in self.lods:
+                groups = self.lods[objectType].partition(
+                    [objectList[i] for i in visible], camera.position
+                )
+                groups = [(mesh, visible[chosen]) for mesh,chosen in groups]
+            else:
+                groups = [(self.meshes[objectType], visible)]
+
+            for mesh,chosen in groups:
+                mesh.bind()
+                shader.setUniforms({
+                    "positionScale": mesh.position_scale,
+                    "positionOffset": mesh.position_offset,
+                })
+                #one upload and one draw per range, however many entities
+                instances = self.instance_buffers.get(mesh.vao)
+                if instances is None:
+                    instances = InstanceBuffer(mesh)
+                    self.instance_buffers[mesh.vao] = instances
+                instances.upload(all_transforms[chosen])
+                #ranges come sorted by texture, bind each one once
+                bound = None
+                for name,first,count in mesh.ranges:
+                    material = self.range_materials[objectType].get(
+                        name, self.materials[objectType]
+                    )
+                    if material is not bound:
+                        material.use()
+                        bound = material
+                    mesh.draw_range_instanced(first,count,instances.count)
+
+        self.render_static()
+
+        gl_state.bind_framebuffer(0)
+        gl_state.disable(GL_DEPTH_TEST)
         glClear(GL_COLOR_BUFFER_BIT)
         self.SCREENshader.use()
         
-        glBindVertexArray(self.screenobj.vao)
-        glBindTexture(GL_TEXTURE_2D,self.fbo.texture)
-        glDrawArrays(GL_TRIANGLES, 0,self.screenobj.vertex_count)
+        self.screenobj.bind()
+        gl_state.bind_texture(self.fbo.texture)
+        self.screenobj.draw()
         
         glFlush()
+
+    def render_static(self) -> None:
+        """
+            Draw the visible meshes of the static batch: one vao
+            bind, then one glMultiDrawElements per material.
+        """
+
+        if not self.static_ranges:
+            return
+        visible = self.frustum.spheres_visible(self.static_centers, self.static_radii)
+        drawn = int(np.count_nonzero(visible))
+        self.frustum.drawn += drawn
+        self.frustum.culled += len(visible) - drawn
+
+        self.scene_variants.get(
+            STATIC_DEFINES, wait = False, uniforms = self.static_uniforms
+        ).readyOr(self.STATICfallback).use()
+        self.static_pool.bind()
+        for material,ranges in self.static_ranges.items():
+            ranges = [(first,count) for number,first,count in ranges if visible[number]]
+            if ranges:
+                material.use()
+                self.static_pool.draw_ranges(ranges)
     
     def destroy(self) -> None:
         """ Free any allocated memory """
 
+        self.camera_block.destroy()
+        for (_,instances) in self.instance_buffers.items():
+            instances.destroy()
+        for (_,lod) in self.lods.items():
+            lod.destroy()
         for (_,mesh) in self.meshes.items():
-            mesh.destroy()
+            self.assets.release(mesh)
         for (_,material) in self.materials.items():
-            material.destroy()
-        self.SCENEshader.deletePgm()
+            self.assets.release(material)
+        for (_,materials) in self.range_materials.items():
+            for (_,material) in materials.items():
+                self.assets.release(material)
+        self.static_pool.destroy()
+        self.assets.release(self.screenobj)
+        self.assets.release(self.SCENEfallback)
+        self.assets.release(self.STATICfallback)
+        self.assets.release(self.scene_variants)
+        self.assets.release(self.SCREENshader)
 
 ############### Framebuffers ##################################################
 class frameBuffer:
@@ -256,9 +449,9 @@ class frameBuffer:
     def Create_framebuffer(self):
 
         self.FBufferObj = glGenFramebuffers(1)
-        glBindFramebuffer(GL_FRAMEBUFFER,self.FBufferObj)
+        gl_state.bind_framebuffer(self.FBufferObj)
         self.texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D,self.texture)
+        gl_state.bind_texture(self.texture)
         glTexImage2D(GL_TEXTURE_2D,0,GL_RGBA,Screen_Width,Screen_Height,0,GL_RGBA,GL_UNSIGNED_BYTE,None)
         glTexParameteri(GL_TEXTURE_2D,GL_TEXTURE_MIN_FILTER,GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D,GL_TEXTURE_MAG_FILTER,GL_LINEAR)
@@ -270,12 +463,13 @@ class frameBuffer:
         glFramebufferRenderbuffer(GL_FRAMEBUFFER,GL_DEPTH_STENCIL_ATTACHMENT,GL_RENDERBUFFER,self.renderbuff)
 
     def use(self):
-        glBindFramebuffer(GL_FRAMEBUFFER,self.FBufferObj)
+        gl_state.bind_framebuffer(self.FBufferObj)
         glClearColor(0.1,0.1,0.1,0.1)
-        glEnable(GL_DEPTH_TEST)
+        gl_state.enable(GL_DEPTH_TEST)
         
 
     def delete(self):
+        gl_state.forget_framebuffer(self.FBufferObj)
         glDeleteFramebuffers(1,(self.FBufferObj,))
 
 
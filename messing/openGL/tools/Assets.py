@@ -0,0 +1,156 @@
+import os
+from tools.Objects import Mesh,ObjMesh,Material,read_mtl_file
+from tools.Shader import Shader,ShaderVariants,define_lines
+
+"""
+    Share meshes, materials and shaders between their users,
+    so each source file is decoded, uploaded and stored on the
+    gpu only once.
+"""
+
+class AssetRegistry:
+    """
+        Hands out ObjMesh, Material and ShaderVariants instances keyed
+        by their source paths and parameters, with reference counting.
+        Shaders are held from their sources' ShaderVariants.
+        Every get_* call is one reference, give it back with release().
+        The gpu objects are freed when the last reference is released.
+    """
+
+    def __init__(self) -> None:
+
+        #key: [asset, reference count]
+        self.assets: dict[tuple,list] = {}
+        #id(asset): key, to find an asset's entry on release
+        self.keys: dict[int,tuple] = {}
+        #id(shader): the ShaderVariants it is held from
+        self.shader_variants: dict[int,ShaderVariants] = {}
+
+    def mesh_key(self, filename:str, indexed:bool = False, vertex_format:str = None) -> tuple:
+        return ("mesh", os.path.abspath(filename), indexed, vertex_format)
+
+    def material_key(self, filepath:str) -> tuple:
+        return ("material", os.path.abspath(filepath))
+
+    def shader_key(self, *paths:str, type:str = 'G') -> tuple:
+        return ("shader", type) + tuple(os.path.abspath(path) for path in paths)
+
+    def get_mesh(self, filename:str, indexed:bool = False,
+                 cache:bool = True, data = None, vertex_format:str = None) -> ObjMesh:
+        """ Shared ObjMesh for the file, see ObjMesh for parameters """
+
+        return self.acquire(
+            self.mesh_key(filename,indexed,vertex_format),
+            lambda: ObjMesh(filename,indexed,cache,data=data,vertex_format=vertex_format)
+        )
+
+    def get_material(self, filepath:str, data = None) -> Material:
+        """ Shared Material for the image, see Material for parameters """
+
+        return self.acquire(
+            self.material_key(filepath),
+            lambda: Material(filepath,data=data)
+        )
+
+    def get_mesh_materials(self, mesh:Mesh) -> dict[str,Material]:
+        """
+            Shared Materials for the textured (map_Kd) materials of
+            the mesh's library, keyed by material name.
+            Each one holds a reference, release them all when done.
+        """
+
+        if mesh.mtllib is None:
+            return {}
+
+        library = read_mtl_file(mesh.mtllib)
+        folder = os.path.dirname(mesh.mtllib)
+        materials = {}
+        for name,_,_ in mesh.ranges:
+            texture = library.get(name,{}).get("map_Kd")
+            if texture and name not in materials:
+                materials[name] = self.get_material(os.path.join(folder,texture))
+        return materials
+
+    def get_shader_variants(self, *paths:str, type:str = 'G') -> ShaderVariants:
+        """
+            Shared ShaderVariants for the sources, its variants are
+            compiled on first get() and the least recently used are
+            deleted past its capacity.
+        """
+
+        return self.acquire(
+            self.shader_key(*paths,type=type),
+            lambda: ShaderVariants(*paths,type=type)
+        )
+
+    def get_shader(self, *paths:str, type:str = 'G', wait:bool = True,
+                   defines = None) -> Shader:
+        """
+            Shared Shader for the sources and defines, see Shader for
+            parameters. It is held in the sources' ShaderVariants, so
+            it stays linked until released.
+        """
+
+        variants = self.get_shader_variants(*paths,type=type)
+        shader = variants.hold(defines,wait)
+        self.shader_variants[id(shader)] = variants
+        return shader
+
+    def contains(self, key:tuple) -> bool:
+        return key in self.assets
+
+    def acquire(self, key:tuple, create):
+        """
+            Return the asset stored under key, making it with create()
+            the first time, and count one more reference to it.
+        """
+
+        entry = self.assets.get(key)
+        if entry is None:
+            entry = [create(),0]
+            self.assets[key] = entry
+            self.keys[id(entry[0])] = key
+        entry[1] += 1
+        return entry[0]
+
+    def ref_count(self, asset) -> int:
+        variants = self.shader_variants.get(id(asset))
+        if variants is not None:
+            return variants.holds.get(define_lines(asset.defines),0)
+        key = self.keys.get(id(asset))
+        if key is None:
+            return 0
+        return self.assets[key][1]
+
+    def release(self, asset) -> None:
+        """
+            Give back one reference, the asset is destroyed when
+            nobody holds it anymore.
+        """
+
+        variants = self.shader_variants.get(id(asset))
+        if variants is not None:
+            if not variants.drop(asset):
+                del self.shader_variants[id(asset)]
+            self.release(variants)
+            return
+
+        key = self.keys.get(id(asset))
+        if key is None:
+            raise KeyError("asset is not held by this registry")
+
+        entry = self.assets[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.assets[key]
+            del self.keys[id(asset)]
+            asset.destroy()
+
+    def destroy(self) -> None:
+        """ Free every asset, whatever its reference count """
+
+        for asset,_ in self.assets.values():
+            asset.destroy()
+        self.assets.clear()
+        self.keys.clear()
+        self.shader_variants.clear()
@@ -0,0 +1,75 @@
+import numpy as np
+from tools.Objects import Mesh
+
+"""
+    View frustum culling of entities against their mesh's
+    bounding sphere, done for all entities of a type at once.
+"""
+
+class Frustum:
+    """
+        The six planes of a camera's view volume, and counts of
+        what passed and failed the test since the last reset.
+    """
+
+    def __init__(self) -> None:
+
+        #(a, b, c, d) per plane, inside is a*x + b*y + c*z + d >= 0
+        self.planes = np.zeros((6,4),dtype=np.float32)
+        #world space corners of the view volume
+        self.corners = np.zeros((8,3),dtype=np.float32)
+        self.drawn = 0
+        self.culled = 0
+
+    def update(self, projection:np.ndarray, view:np.ndarray) -> None:
+        """
+            Extract the planes from pyrr style (row vector) view and
+            projection matrices, as passed to the shaders.
+        """
+
+        #clip = world @ view @ projection, so the planes are sums
+        #and differences of the combined matrix's columns
+        combined = np.asarray(view,dtype=np.float32) @ np.asarray(projection,dtype=np.float32)
+        columns = combined.T
+        self.planes[0] = columns[3] + columns[0]    #left
+        self.planes[1] = columns[3] - columns[0]    #right
+        self.planes[2] = columns[3] + columns[1]    #bottom
+        self.planes[3] = columns[3] - columns[1]    #top
+        self.planes[4] = columns[3] + columns[2]    #near
+        self.planes[5] = columns[3] - columns[2]    #far
+        self.planes /= np.linalg.norm(self.planes[:,0:3],axis=1,keepdims=True)
+
+        clip_corners = np.array(
+            [[x,y,z,1] for x in (-1,1) for y in (-1,1) for z in (-1,1)],dtype=np.float32
+        )
+        corners = clip_corners @ np.linalg.inv(combined)
+        self.corners[:] = corners[:,0:3] / corners[:,3:4]
+
+    def reset_stats(self) -> None:
+        self.drawn = 0
+        self.culled = 0
+
+    def spheres_visible(self, centers:np.ndarray, radii) -> np.ndarray:
+        """ Whether each world space sphere touches the frustum """
+
+        distances = centers @ self.planes[:,0:3].T + self.planes[:,3]
+        return np.all(distances >= -np.reshape(radii,(-1,1)),axis=1)
+
+    def cull(self, transforms:np.ndarray, mesh:Mesh) -> np.ndarray:
+        """
+            Which of the (count, 4, 4) model transforms place the mesh
+            inside the frustum, counted in drawn/culled.
+            Transforms are assumed to be rotations and translations,
+            so the mesh's bounding radius is unchanged.
+        """
+
+        if len(transforms) == 0 or not np.isfinite(mesh.bounding_radius):
+            self.drawn += len(transforms)
+            return np.ones(len(transforms),dtype=bool)
+
+        centers = np.append(mesh.bounding_center,1) @ transforms
+        visible = self.spheres_visible(centers[:,0:3],mesh.bounding_radius)
+        drawn = int(np.count_nonzero(visible))
+        self.drawn += drawn
+        self.culled += len(visible) - drawn
+        return visible
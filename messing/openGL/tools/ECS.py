@@ -0,0 +1,322 @@
+import numpy as np
+from tools.Transforms import model_transforms
+
+"""
+    Archetype based entity component system. Entities with the same
+    type and set of components share an Archetype, which keeps each
+    component in a typed numpy column, and systems update whole
+    columns at once instead of calling a method per entity.
+"""
+
+#name: (dtype, shape of one entity's value), see register_component
+COMPONENTS: dict[str,tuple[np.dtype,tuple]] = {
+    "position": (np.dtype(np.float32),(3,)),
+    "eulers": (np.dtype(np.float32),(3,)),
+    #degrees about z per unit of rate, see spin_system
+    "spin": (np.dtype(np.float32),()),
+}
+
+#every archetype has these
+BASE_COMPONENTS = frozenset(("position","eulers"))
+
+def register_component(name:str, dtype = np.float32, shape:tuple = ()) -> None:
+    """ Declare a component, its columns hold one dtype value of shape per entity """
+
+    COMPONENTS[name] = (np.dtype(dtype),tuple(shape))
+
+class Archetype:
+    """
+        The entities of one object type having one set of components,
+        structure of arrays: columns[name][row] is a component of the
+        entity entities[row]. Entities read and write their row through
+        store/index (see Entity), systems use the columns directly.
+    """
+
+    def __init__(self, objectType:int, components = (), capacity:int = 16) -> None:
+
+        self.objectType = objectType
+        self.components = BASE_COMPONENTS | frozenset(components)
+        self.count = 0
+        self.columns: dict[str,np.ndarray] = {
+            name: np.zeros((capacity,) + COMPONENTS[name][1],dtype=COMPONENTS[name][0])
+            for name in self.components
+        }
+        #kept between model_transforms calls, a row is only
+        #recomputed when it is dirty or its entity isn't static
+        self.transforms = np.zeros((capacity,4,4),dtype=np.float32)
+        self.dirty = np.ones(capacity,dtype=bool)
+        self.moving = np.zeros(capacity,dtype=bool)
+        #every row is out of date (grown, or moved by a system)
+        self.all_dirty = True
+        #rows whose position changed since the last take_relocated,
+        #for indexes kept over positions (eg. Scene.spatial)
+        self.relocated = np.zeros(capacity,dtype=bool)
+        self.all_relocated = False
+        self.entities: list = []
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def capacity(self) -> int:
+        return len(self.transforms)
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self.columns["position"]
+
+    @property
+    def eulers(self) -> np.ndarray:
+        return self.columns["eulers"]
+
+    def column(self, name:str) -> np.ndarray:
+        """ The used rows of a component's column """
+
+        return self.columns[name][:self.count]
+
+    def add(self, entity, values:dict) -> None:
+        """
+            Give the entity the next row, it must not be in another
+            archetype. values (component: value) may leave components
+            out, they start at zero.
+        """
+
+        if self.count == self.capacity:
+            self.grow(max(16,2*self.count))
+        for name,column in self.columns.items():
+            column[self.count] = values.get(name,0)
+        self.dirty[self.count] = True
+        self.moving[self.count] = not entity.static
+        entity.store = self
+        entity.index = self.count
+        self.entities.append(entity)
+        self.count += 1
+
+    def extend(self, entities:list, values:dict) -> None:
+        """ add for many entities at once, values holds a column (or one value) per component """
+
+        count = len(entities)
+        if self.count + count > self.capacity:
+            self.grow(max(16,2*self.capacity,self.count + count))
+        rows = slice(self.count,self.count + count)
+        for name,column in self.columns.items():
+            column[rows] = values.get(name,0)
+        self.dirty[rows] = True
+        self.moving[rows] = np.fromiter((not entity.static for entity in entities),bool,count)
+        for index,entity in enumerate(entities,self.count):
+            entity.store = self
+            entity.index = index
+        self.entities += entities
+        self.count += count
+
+    def row(self, index:int) -> dict[str,np.ndarray]:
+        """ Copies of the components of the entity at row index """
+
+        return {name: column[index].copy() for name,column in self.columns.items()}
+
+    def remove(self, entity) -> None:
+        """ Free the entity's row, the last row moves into it """
+
+        index = entity.index
+        last = self.count - 1
+        if index != last:
+            moved = self.entities[last]
+            for column in self.columns.values():
+                column[index] = column[last]
+            self.dirty[index] = True
+            self.moving[index] = self.moving[last]
+            self.relocated[index] = self.relocated[last]
+            self.entities[index] = moved
+            moved.index = index
+        self.entities.pop()
+        self.count -= 1
+        entity.store = None
+        entity.index = -1
+
+    def grow(self, capacity:int) -> None:
+
+        for name,old in self.columns.items():
+            new = np.zeros((capacity,) + old.shape[1:],dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            self.columns[name] = new
+        self.transforms = np.zeros((capacity,4,4),dtype=np.float32)
+        moving = np.zeros(capacity,dtype=bool)
+        moving[:self.count] = self.moving[:self.count]
+        self.moving = moving
+        relocated = np.zeros(capacity,dtype=bool)
+        relocated[:self.count] = self.relocated[:self.count]
+        self.relocated = relocated
+        self.dirty = np.ones(capacity,dtype=bool)
+        self.all_dirty = True
+
+    def mark_dirty(self, index:int = None, relocated:bool = True) -> None:
+        """
+            The entity at row index (every row if None) has moved,
+            relocated False when only its eulers changed.
+        """
+
+        if index is None:
+            self.all_dirty = True
+            self.all_relocated |= relocated
+        else:
+            self.dirty[index] = True
+            self.relocated[index] |= relocated
+
+    def take_relocated(self) -> list:
+        """ The entities whose position changed since the last call """
+
+        count = self.count
+        if self.all_relocated:
+            entities = list(self.entities)
+        else:
+            entities = [self.entities[row] for row in np.flatnonzero(self.relocated[:count])]
+        self.relocated[:count] = False
+        self.all_relocated = False
+        return entities
+
+    def model_transforms(self) -> np.ndarray:
+        """
+            (count, 4, 4) model transforms of every entity, in row order.
+            Rows of static entities are kept from the last call unless
+            marked dirty, the rest are recomputed.
+        """
+
+        count = self.count
+        transforms = self.transforms[:count]
+        if not self.all_dirty:
+            rows = np.flatnonzero(self.dirty[:count] | self.moving[:count])
+            if len(rows) < count:
+                if len(rows):
+                    transforms[rows] = model_transforms(
+                        self.columns["position"][rows],self.columns["eulers"][rows]
+                    )
+                    self.dirty[rows] = False
+                return transforms
+
+        model_transforms(self.column("position"),self.column("eulers"),transforms)
+        self.dirty[:count] = False
+        self.all_dirty = False
+        return transforms
+
+def spin_system(archetype:Archetype, rate:float) -> None:
+    """ Turn about z by spin degrees per unit of rate, wrapping at 360 """
+
+    angles = archetype.column("eulers")[:,2]
+    angles += archetype.column("spin") * rate
+    np.subtract(angles,360,out=angles,where=angles > 360)
+
+class World:
+    """
+        The archetypes of a scene, keyed by (object type, components),
+        and the systems run over them every frame. Entities change
+        archetype when they gain or lose a component.
+    """
+
+    def __init__(self) -> None:
+
+        self.archetypes: dict[tuple[int,frozenset],Archetype] = {}
+        #(function(archetype, rate), components it needs, components it writes)
+        self.systems: list[tuple] = []
+        self.add_system(spin_system,("eulers","spin"),("eulers",))
+
+    def add_system(self, function, requires, writes = ()) -> None:
+        """
+            Run function(archetype, rate) every frame on each archetype
+            having all the required components. writes names the
+            components it changes, so users know what moved.
+        """
+
+        self.systems.append((function,frozenset(requires),frozenset(writes)))
+
+    def archetype(self, objectType:int, components = ()) -> Archetype:
+        """ The archetype for the type and components, made if needed """
+
+        key = (objectType,BASE_COMPONENTS | frozenset(components))
+        archetype = self.archetypes.get(key)
+        if archetype is None:
+            archetype = Archetype(objectType,key[1])
+            self.archetypes[key] = archetype
+        return archetype
+
+    def query(self, *components:str, objectType:int = None) -> list[Archetype]:
+        """ Archetypes having all the components (and of objectType if given) """
+
+        wanted = frozenset(components)
+        return [
+            archetype for (kind,has),archetype in self.archetypes.items()
+            if wanted <= has and (objectType is None or kind == objectType)
+        ]
+
+    def add(self, entity, components:dict = None) -> Archetype:
+        """
+            Move an entity and its component values into this world,
+            components (name: value) adds to or overrides them.
+        """
+
+        values = entity.store.row(entity.index)
+        values.update(components or {})
+        return self.place(entity,values)
+
+    def spawn(self, cls, objectType:int, positions:np.ndarray, eulers:np.ndarray,
+              components:dict = None) -> list:
+        """
+            Make len(positions) entities of class cls at once, with the
+            class's components (overridden by components, a column or one
+            value each). cls.__init__ is not run, so this is for classes
+            with no state beyond their components, like Cube.
+        """
+
+        values = dict(cls.components)
+        values.update(components or {})
+        values["position"] = positions
+        values["eulers"] = eulers
+        entities = [object.__new__(cls) for _ in range(len(positions))]
+        for entity in entities:
+            entity.objectType = objectType
+        self.archetype(objectType,values).extend(entities,values)
+        return entities
+
+    def place(self, entity, values:dict) -> Archetype:
+        """ Put the entity in the archetype with exactly the components of values """
+
+        archetype = self.archetype(entity.objectType,values)
+        if entity.store is not None:
+            entity.store.remove(entity)
+        archetype.add(entity,values)
+        return archetype
+
+    def remove(self, entity) -> None:
+        """ Take an entity out, it keeps its values in an archetype of its own """
+
+        values = entity.store.row(entity.index)
+        entity.store.remove(entity)
+        Archetype(entity.objectType,values,1).add(entity,values)
+
+    def add_component(self, entity, name:str, value = 0) -> None:
+
+        values = entity.store.row(entity.index)
+        values[name] = value
+        self.place(entity,values)
+
+    def remove_component(self, entity, name:str) -> None:
+
+        values = entity.store.row(entity.index)
+        del values[name]
+        self.place(entity,values)
+
+    def run_systems(self, rate:float) -> list[tuple[Archetype,frozenset]]:
+        """
+            Run every system over every archetype it applies to.
+            Returns the (archetype, components written) touched.
+        """
+
+        written = []
+        for function,requires,writes in self.systems:
+            moves = not BASE_COMPONENTS.isdisjoint(writes)
+            for archetype in self.archetypes.values():
+                if archetype.count and requires <= archetype.components:
+                    function(archetype,rate)
+                    if moves:
+                        archetype.mark_dirty(relocated="position" in writes)
+                    written.append((archetype,writes))
+        return written
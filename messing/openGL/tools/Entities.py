@@ -1,12 +1,24 @@
 import numpy as np
-import pyrr
+from tools.ECS import Archetype
+from tools.Transforms import model_transform,camera_vectors,view_transform
 
 """
     Make and handle entities such as cameras, players, cubes, etc    
 """
 
 class Entity:
-    """ Represents a general object with a position and rotation applied"""
+    """
+        Represents a general object with a position and rotation applied.
+        A facade over its row of an ECS Archetype: the state lives in
+        the archetype's columns and behaviour in systems (see World).
+    """
+
+    #static entities never move by themselves, Scene.update skips them
+    #and their model transforms are cached. Writing into a static
+    #entity's position or eulers views needs a moved() after
+    static = False
+    #components beyond position and eulers: initial value
+    components: dict = {}
 
     def __init__(self,
                  position:list[float],
@@ -21,50 +33,79 @@ class Entity:
                 objectType: The type of object which the entity represents,
                             this should match a named constant.
         """
-        self.position = np.array(position,dtype=np.float32)
-        self.eulers = np.array(eulers,dtype=np.float32)
         self.objectType = objectType
+        #an archetype of its own, until a World takes it in
+        self.store: Archetype = None
+        self.index = -1
+        values = dict(self.components)
+        values["position"] = position
+        values["eulers"] = eulers
+        Archetype(objectType,values,1).add(self,values)
 
-    def get_model_transform(self) ->np.ndarray:
+    #views of the entity's row in its archetype
+    @property
+    def position(self) -> np.ndarray:
+        return self.store.positions[self.index]
+
+    @position.setter
+    def position(self, value) -> None:
+        self.store.positions[self.index] = value
+        self.store.mark_dirty(self.index)
+
+    @property
+    def eulers(self) -> np.ndarray:
+        return self.store.eulers[self.index]
+
+    @eulers.setter
+    def eulers(self, value) -> None:
+        self.store.eulers[self.index] = value
+        self.store.mark_dirty(self.index,relocated=False)
+
+    def moved(self) -> None:
+        """ Call after changing position or eulers in place """
+
+        self.store.mark_dirty(self.index)
+
+    def component(self, name:str):
+        """ The entity's value of a component, a view for vector components """
+
+        return self.store.columns[name][self.index]
+
+    def set_component(self, name:str, value) -> None:
+
+        self.store.columns[name][self.index] = value
+        if name == "position" or name == "eulers":
+            self.moved()
+
+    def get_model_transform(self, out:np.ndarray = None) ->np.ndarray:
         """
             Calculates and returns the entity's transform matrix,
-            based on its position and rotation.
+            based on its position and rotation, written into out
+            ((4, 4) float32) when given.
+            For many entities use Archetype.model_transforms.
         """
 
-        model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
-
-        model_transform = pyrr.matrix44.multiply(
-            m1=model_transform,
-            m2=pyrr.matrix44.create_from_z_rotation(
-            theta=np.radians(self.eulers[2]),
-            dtype=np.float32
-            )
-        )
-
-        model_transform = pyrr.matrix44.multiply(
-            m1=model_transform, 
-            m2=pyrr.matrix44.create_from_translation(
-                vec=self.position,
-                dtype=np.float32
-            )
-        )
-
-        return model_transform
+        return model_transform(self.position,self.eulers,out)
     
     def update(self, rate: float) -> None:
-        raise NotImplementedError
+        """
+            Per entity behaviour, Scene.update calls it only for
+            classes that override it, the rest is done by systems.
+        """
+
+        pass
 
     
 class Cube(Entity):
+    #turned by spin_system
+    components = {"spin": 0.25}
+
     def __init__(self,position:list[float],eulers:list[float],OBJECT_CUBE) -> None:
         super().__init__(position,eulers,OBJECT_CUBE)
 
-    def update(self,rate:float) -> None:
-        self.eulers[2] += 0.25 * rate
-        if self.eulers[2] > 360:
-            self.eulers[2] -= 360
-
 class Square(Entity):
+    static = True
+
     def __init__(self,position,eulers,OBJECT_SQUARE) -> None:
         super().__init__(position,eulers,OBJECT_SQUARE)
 
@@ -78,43 +119,31 @@ class Player(Entity):
     def __init__(self, position: list[float], eulers: list[float],OBJECT_CAMERA) -> None:
         super().__init__(position, eulers, OBJECT_CAMERA)
 
+        #the basis is computed for z up (see camera_vectors)
         self.localUp = np.array([0,0,1],dtype=np.float32)
 
         #directions after rotation
         self.up = np.array([0,0,1],dtype=np.float32)
         self.right = np.array([0,1,0],dtype=np.float32)
         self.forwards = np.array([1,0,0],dtype=np.float32)
+        #reused by get_view_transform
+        self.view = np.identity(4,dtype=np.float32)
 
     def calculate_vectors(self) -> None:
 
         """ 
-            Calculate the camera's fundamental vectors.
-            There are various ways to do this, this function
-            achieves it by using cross products to produce
-            an orthonormal basis.
+            Calculate the camera's fundamental vectors: forwards from
+            spherical coordinates, then the right and up vectors of an
+            orthonormal basis, in closed form and in place.
         """
-        #calculate the forwards vector directly using spherical coordinates
-        self.forwards = np.array(
-            [
-            np.cos(np.radians(self.eulers[2]))*np.cos(np.radians(self.eulers[1])),
-            np.sin(np.radians(self.eulers[2]))*np.cos(np.radians(self.eulers[1])),
-            np.sin(np.radians(self.eulers[1]))
-            ],
-            dtype=np.float32
-        )
-
-        self.right = pyrr.vector.normalise(np.cross(self.forwards,self.localUp))
-        self.up = pyrr.vector.normalise(np.cross(self.right,self.forwards))
+
+        camera_vectors(self.eulers,self.forwards,self.right,self.up)
         
     def update(self) -> None:
         """Updates the camera"""
         self.calculate_vectors()
 
     def get_view_transform(self) -> np.ndarray:
-        return pyrr.matrix44.create_look_at(
-            eye = self.position,
-            target=self.position + self.forwards,
-            up = self.up,
-            dtype= np.float32
-        )
-    
\ No newline at end of file
+        """ The view transform, in a buffer reused by the next call """
+
+        return view_transform(self.position,self.forwards,self.right,self.up,self.view)
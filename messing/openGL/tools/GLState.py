@@ -0,0 +1,140 @@
+from OpenGL.GL import *
+
+"""
+    Cache of the bits of OpenGL state the tools change, so binds that
+    would not change anything never reach the driver (each PyOpenGL
+    call costs microseconds of python). Everything in tools binds
+    through the shared gl_state; code that calls glUseProgram,
+    glBindVertexArray, etc. itself must call gl_state.reset() after.
+"""
+
+class GLState:
+    """
+        Remembers the current program, vao, active texture unit,
+        texture per (unit, target), framebuffer and enable flags.
+        skipped/issued count the calls avoided and made.
+    """
+
+    def __init__(self) -> None:
+
+        self.reset()
+        self.skipped = 0
+        self.issued = 0
+
+    def reset(self) -> None:
+        """ Forget everything, the next call of each kind always goes through """
+
+        self.program = None
+        self.vao = None
+        self.active_unit = None
+        #(unit, target): texture
+        self.textures: dict[tuple[int,int],int] = {}
+        #target: framebuffer
+        self.framebuffers: dict[int,int] = {}
+        #capability: enabled
+        self.flags: dict[int,bool] = {}
+
+    def use_program(self, program) -> None:
+
+        if program == self.program:
+            self.skipped += 1
+            return
+        glUseProgram(program)
+        self.program = program
+        self.issued += 1
+
+    def bind_vertex_array(self, vao) -> None:
+
+        if vao == self.vao:
+            self.skipped += 1
+            return
+        glBindVertexArray(vao)
+        self.vao = vao
+        self.issued += 1
+
+    def active_texture(self, unit:int) -> None:
+        """ Select texture unit (0, 1, ...) for glTexParameter and friends """
+
+        if unit == self.active_unit:
+            self.skipped += 1
+            return
+        glActiveTexture(GL_TEXTURE0 + unit)
+        self.active_unit = unit
+        self.issued += 1
+
+    def bind_texture(self, texture, unit:int = 0, target = GL_TEXTURE_2D) -> None:
+        """
+            Bind texture to unit. The active unit is only changed when
+            the bind happens, so select it with active_texture before
+            glTexParameter calls on an already bound texture.
+        """
+
+        if self.textures.get((unit,target)) == texture:
+            self.skipped += 1
+            return
+        self.active_texture(unit)
+        glBindTexture(target, texture)
+        self.textures[(unit,target)] = texture
+        self.issued += 1
+
+    def bind_framebuffer(self, framebuffer, target = GL_FRAMEBUFFER) -> None:
+
+        if self.framebuffers.get(target) == framebuffer:
+            self.skipped += 1
+            return
+        glBindFramebuffer(target, framebuffer)
+        #GL_FRAMEBUFFER sets both the draw and the read binding
+        if target == GL_FRAMEBUFFER:
+            self.framebuffers[GL_DRAW_FRAMEBUFFER] = framebuffer
+            self.framebuffers[GL_READ_FRAMEBUFFER] = framebuffer
+        else:
+            self.framebuffers.pop(GL_FRAMEBUFFER,None)
+        self.framebuffers[target] = framebuffer
+        self.issued += 1
+
+    def enable(self, capability) -> None:
+
+        if self.flags.get(capability) is True:
+            self.skipped += 1
+            return
+        glEnable(capability)
+        self.flags[capability] = True
+        self.issued += 1
+
+    def disable(self, capability) -> None:
+
+        if self.flags.get(capability) is False:
+            self.skipped += 1
+            return
+        glDisable(capability)
+        self.flags[capability] = False
+        self.issued += 1
+
+    def forget_program(self, program) -> None:
+        """ Call when deleting a program, GL may reuse the name """
+
+        if program == self.program:
+            self.program = None
+
+    def forget_vertex_array(self, vao) -> None:
+        """ Call when deleting a vao, GL unbinds it and may reuse the name """
+
+        if vao == self.vao:
+            self.vao = None
+
+    def forget_texture(self, texture) -> None:
+        """ Call when deleting a texture, GL unbinds it and may reuse the name """
+
+        self.textures = {
+            key:bound for key,bound in self.textures.items() if bound != texture
+        }
+
+    def forget_framebuffer(self, framebuffer) -> None:
+        """ Call when deleting a framebuffer, GL unbinds it and may reuse the name """
+
+        self.framebuffers = {
+            target:bound for target,bound in self.framebuffers.items() if bound != framebuffer
+        }
+
+#the one context the tools render with
+gl_state = GLState()
@@ -0,0 +1,58 @@
+from OpenGL.GL import *
+import numpy as np
+
+"""
+    Per instance model transforms, so many entities sharing a mesh
+    are drawn with one instanced draw call per range instead of a
+    uniform upload and draw per entity.
+"""
+
+#first of the 4 attribute locations the mat4 takes, one per column,
+#after position, texcoord and normal
+INSTANCE_LOCATION = 3
+
+class InstanceBuffer:
+    """
+        A stream vbo of (count, 4, 4) float32 model transforms attached
+        to a mesh's vao as a per instance mat4 attribute, which the
+        INSTANCED scene shader variant reads instead of the model uniform.
+        Matrices are read the same way glUniformMatrix4fv(..., GL_FALSE, ...)
+        reads them, so pyrr transforms go in unchanged.
+    """
+
+    def __init__(self, mesh, capacity:int = 256) -> None:
+        """
+            Parameters:
+                mesh: the Mesh (or PooledMesh) whose vao reads the buffer
+                capacity: instances to make room for, grows as needed
+        """
+
+        self.capacity = capacity
+        self.count = 0
+        self.vbo = glGenBuffers(1)
+
+        mesh.bind()
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, capacity*64, None, GL_STREAM_DRAW)
+        for column in range(4):
+            location = INSTANCE_LOCATION + column
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, 64,
+                                  ctypes.c_void_p(16*column))
+            glVertexAttribDivisor(location, 1)
+
+    def upload(self, transforms:np.ndarray) -> None:
+        """ Replace the buffer's transforms, once per frame """
+
+        transforms = np.ascontiguousarray(transforms,dtype=np.float32)
+        self.count = len(transforms)
+        if self.count > self.capacity:
+            self.capacity = max(self.count,2*self.capacity)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        #orphan last frame's storage so the gpu can keep reading it
+        glBufferData(GL_ARRAY_BUFFER, self.capacity*64, None, GL_STREAM_DRAW)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, transforms.nbytes, transforms)
+
+    def destroy(self) -> None:
+        glDeleteBuffers(1,(self.vbo,))
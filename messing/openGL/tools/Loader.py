@@ -0,0 +1,177 @@
+from concurrent.futures import ThreadPoolExecutor,ProcessPoolExecutor,as_completed
+from contextlib import closing
+import os
+from tools.Objects import ObjMesh,Material,load_mesh_data,load_image_data
+from tools.Assets import AssetRegistry
+
+"""
+    Load assets in parallel: file reading, obj parsing and image
+    decoding run in a worker pool, the GL uploads stay on the
+    thread that owns the context.
+"""
+
+class AssetLoader:
+    """
+        Collects the meshes and materials a renderer needs,
+        then loads them all at once.
+        Each distinct source file is only decoded once, with a
+        registry it is also only uploaded once and shared
+        between all the keys that asked for it.
+
+        Usage:
+            loader = AssetLoader()
+            loader.add_mesh(OBJECT_CUBE, "models/cube.obj", indexed = True)
+            loader.add_material(OBJECT_CUBE, "gfx/wood.jpeg")
+            meshes,materials = loader.load()
+    """
+
+    def __init__(self, workers:int = None, processes:bool = False,
+                 registry:AssetRegistry = None) -> None:
+        """
+            Parameters:
+                workers: pool size, defaults to the executor's own choice
+                         (based on the number of cores)
+                processes: use a process pool instead of threads.
+                           Needs the calling script to be import safe
+                           (an if __name__ == "__main__" guard).
+                registry: take shared assets from (and add them to) this
+                          registry, each returned asset holds one reference.
+        """
+
+        self.workers = workers
+        self.processes = processes
+        self.registry = registry
+        self.meshes: dict[object,tuple[str,bool,bool,str,bool]] = {}
+        self.materials: dict[object,str] = {}
+
+    def add_mesh(self, key, filename:str, indexed:bool = False, cache:bool = True,
+                 vertex_format:str = None, upload:bool = True) -> None:
+        """
+            Queue an obj file (see ObjMesh), it will be returned under key.
+            With upload off, key gets the decoded (vertices, indices,
+            submeshes) of load_mesh_data instead of a mesh, for callers
+            that copy it elsewhere (eg. into a MeshPool).
+        """
+
+        self.meshes[key] = (filename,indexed,cache,vertex_format,upload)
+
+    def add_material(self, key, filepath:str) -> None:
+        """ Queue an image file, it will be returned under key """
+
+        self.materials[key] = filepath
+
+    def queued_sources(self) -> tuple[dict[tuple,list],dict[str,list]]:
+        """
+            The distinct sources queued, with the keys waiting on each:
+            {(abs path, indexed, cache, vertex format): keys} for meshes,
+            {abs path: keys} for materials.
+        """
+
+        mesh_sources: dict[tuple,list] = {}
+        for key,(filename,indexed,cache,vertex_format,_) in self.meshes.items():
+            source = (os.path.abspath(filename),indexed,cache,vertex_format)
+            mesh_sources.setdefault(source,[]).append(key)
+        material_sources: dict[str,list] = {}
+        for key,filepath in self.materials.items():
+            material_sources.setdefault(os.path.abspath(filepath),[]).append(key)
+        return mesh_sources,material_sources
+
+    def decode(self, mesh_sources, material_sources):
+        """
+            Decode the sources in the pool, yielding ("mesh" or
+            "material", source, data) as each one is ready.
+            Makes no GL calls. Closing the generator early cancels
+            the jobs that have not started.
+        """
+
+        executor = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        with executor(max_workers=self.workers) as pool:
+            jobs = {}
+            for source in mesh_sources:
+                filename,indexed,cache,_ = source
+                jobs[pool.submit(load_mesh_data,filename,indexed,cache)] = ("mesh",source)
+            for source in material_sources:
+                jobs[pool.submit(load_image_data,source)] = ("material",source)
+            try:
+                for job in as_completed(jobs):
+                    kind,source = jobs[job]
+                    yield kind,source,job.result()
+            finally:
+                for job in jobs:
+                    job.cancel()
+
+    def load(self) -> tuple[dict[object,ObjMesh],dict[object,Material]]:
+        """
+            Decode everything queued in the pool and upload each
+            asset as soon as its data is ready (meshes queued with
+            upload off are returned as their decoded data).
+            Must be called on the thread that owns the GL context.
+            If anything fails, the assets already uploaded are
+            destroyed (or released to the registry) before the error
+            is raised again, and the queue is kept.
+        """
+
+        meshes = {}
+        mesh_data = {}
+        materials = {}
+        mesh_sources,material_sources = self.queued_sources()
+
+        try:
+            #sources the registry already holds need no decoding
+            if self.registry is not None:
+                for source in list(mesh_sources):
+                    filename,indexed,cache,vertex_format = source
+                    if self.registry.contains(self.registry.mesh_key(filename,indexed,vertex_format)):
+                        #keys wanting the data still wait on the decode
+                        waiting = []
+                        for key in mesh_sources[source]:
+                            if self.meshes[key][4]:
+                                meshes[key] = self.registry.get_mesh(
+                                    filename,indexed,vertex_format=vertex_format)
+                            else:
+                                waiting.append(key)
+                        if waiting:
+                            mesh_sources[source] = waiting
+                        else:
+                            del mesh_sources[source]
+                for source in list(material_sources):
+                    if self.registry.contains(self.registry.material_key(source)):
+                        for key in material_sources.pop(source):
+                            materials[key] = self.registry.get_material(source)
+
+            with closing(self.decode(mesh_sources,material_sources)) as decoded:
+                for kind,source,data in decoded:
+                    if kind == "mesh":
+                        filename,indexed,cache,vertex_format = source
+                        for key in mesh_sources[source]:
+                            if not self.meshes[key][4]:
+                                mesh_data[key] = data
+                            elif self.registry is None:
+                                meshes[key] = ObjMesh(filename,indexed,cache,data=data,
+                                                      vertex_format=vertex_format)
+                            else:
+                                meshes[key] = self.registry.get_mesh(filename,indexed,cache,data=data,
+                                                                     vertex_format=vertex_format)
+                    else:
+                        for key in material_sources[source]:
+                            if self.registry is None:
+                                materials[key] = Material(source,data=data)
+                            else:
+                                materials[key] = self.registry.get_material(source,data=data)
+        except BaseException:
+            self.discard(list(meshes.values()) + list(materials.values()))
+            raise
+
+        self.meshes.clear()
+        self.materials.clear()
+        meshes.update(mesh_data)
+        return meshes,materials
+
+    def discard(self, assets:list) -> None:
+        """ Free what a failed load had already uploaded """
+
+        for asset in assets:
+            if self.registry is None:
+                asset.destroy()
+            else:
+                self.registry.release(asset)
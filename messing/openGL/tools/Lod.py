@@ -0,0 +1,222 @@
+import numpy as np
+from tools.Entities import Entity
+from tools.Objects import (ObjMesh,load_mesh_data,
+                           source_cache_path,read_mesh_cache,write_mesh_cache,
+                           MESH_CACHE_DIR,PARSER_VERSION)
+from tools.MeshOptimize import optimize_mesh
+
+"""
+    Reduced level of detail versions of meshes, and picking
+    a level per entity from its distance to the camera.
+"""
+
+#bump whenever the simplification changes
+LOD_VERSION = 1
+
+def load_lod_data(filename:str,
+                  resolution:int,
+                  cache:bool = True) -> tuple[np.ndarray,np.ndarray,dict]:
+    """
+        Get a simplified, indexed version of an obj file, in the same
+        (vertices, indices, submeshes) form as load_mesh_data.
+        Built by vertex clustering (see cluster_vertices) with the
+        given number of grid cells along the longest side, and kept
+        in the mesh cache so it is only built once.
+    """
+
+    if not cache:
+        return build_lod_data(filename,resolution)
+
+    cache_path = source_cache_path(
+        filename,MESH_CACHE_DIR,".mesh",
+        PARSER_VERSION,"lod",LOD_VERSION,resolution
+    )
+    cached = read_mesh_cache(cache_path)
+    if cached is not None:
+        return cached
+
+    data = build_lod_data(filename,resolution)
+    write_mesh_cache(cache_path,*data)
+    return data
+
+def build_lod_data(filename:str, resolution:int) -> tuple[np.ndarray,np.ndarray,dict]:
+    """
+        Simplify every material range of the mesh separately,
+        so materials keep their own vertices and texture coordinates.
+    """
+
+    vertices,indices,submeshes = load_mesh_data(filename,indexed=True)
+    rows = np.asarray(vertices).reshape(-1,8)
+    indices = np.asarray(indices,dtype=np.int64)
+
+    #one grid for the whole mesh, so ranges still meet at the seams
+    low = rows[:,:3].min(axis=0)
+    cell_size = max(float((rows[:,:3].max(axis=0) - low).max()) / resolution,1e-6)
+
+    new_rows = []
+    new_indices = []
+    ranges = []
+    vertex_offset = 0
+    index_offset = 0
+    for name,first,count in submeshes["ranges"]:
+        range_rows,range_indices = cluster_vertices(
+            rows,indices[first:first + count],low,cell_size
+        )
+        new_rows.append(range_rows)
+        new_indices.append(range_indices + vertex_offset)
+        ranges.append([name,index_offset,len(range_indices)])
+        vertex_offset += len(range_rows)
+        index_offset += len(range_indices)
+
+    vertices = np.concatenate(new_rows).astype(np.float32).ravel()
+    index_type = np.uint16 if vertex_offset <= 65536 else np.uint32
+    indices = np.concatenate(new_indices).astype(index_type)
+    vertices,indices,lod_acmr = optimize_mesh(vertices,indices,ranges)
+    return vertices,indices,{
+        "mtllib": submeshes["mtllib"], "ranges": ranges, "acmr": lod_acmr
+    }
+
+def cluster_vertices(rows:np.ndarray,
+                     indices:np.ndarray,
+                     low:np.ndarray,
+                     cell_size:float) -> tuple[np.ndarray,np.ndarray]:
+    """
+        Vertex clustering: every vertex used by the triangles is snapped
+        into a grid cell, each cell becomes one vertex (the average of
+        its members, normals renormalised) and triangles that collapse
+        into a line or point, or duplicate another, are dropped.
+        Returns the new (count, 8) vertex rows and triangle indices.
+    """
+
+    used,local = np.unique(indices,return_inverse=True)
+    members = rows[used]
+
+    cells = np.floor((members[:,:3] - low) / cell_size).astype(np.int64)
+    side = int(cells.max()) + 1
+    cell_ids = (cells[:,0]*side + cells[:,1])*side + cells[:,2]
+    _,vertex_cell = np.unique(cell_ids,return_inverse=True)
+    cell_count = int(vertex_cell.max()) + 1
+
+    member_counts = np.bincount(vertex_cell,minlength=cell_count)
+    clustered = np.empty((cell_count,8),dtype=np.float64)
+    for column in range(8):
+        clustered[:,column] = np.bincount(
+            vertex_cell,weights=members[:,column],minlength=cell_count
+        ) / member_counts
+    lengths = np.linalg.norm(clustered[:,5:8],axis=1,keepdims=True)
+    clustered[:,5:8] /= np.maximum(lengths,1e-12)
+
+    triangles = vertex_cell[local.ravel()].reshape(-1,3)
+    keep = (triangles[:,0] != triangles[:,1]) \
+        & (triangles[:,1] != triangles[:,2]) \
+        & (triangles[:,0] != triangles[:,2])
+    triangles = triangles[keep]
+
+    #drop duplicates, whatever corner they start at, keeping winding
+    rolled = np.argmin(triangles,axis=1)
+    canonical = np.stack([
+        triangles[np.arange(len(triangles)),(rolled + i) % 3] for i in range(3)
+    ],axis=1)
+    _,first_seen = np.unique(canonical,axis=0,return_index=True)
+    triangles = triangles[np.sort(first_seen)]
+
+    #drop cells no triangle uses anymore
+    used_cells,triangles = np.unique(triangles,return_inverse=True)
+    return clustered[used_cells],triangles.ravel()
+
+class LodMesh:
+    """
+        A mesh with reduced versions for distant entities.
+        levels[0] is the full mesh, each next level is coarser.
+    """
+
+    def __init__(self,
+                 filename:str,
+                 base:ObjMesh = None,
+                 resolutions:list[int] = (32,16,8),
+                 distances:list[float] = (10,25,50),
+                 hysteresis:float = 0.1,
+                 cache:bool = True,
+                 vertex_format:str = None) -> None:
+        """
+            Parameters:
+                filename: path to the obj file
+                base: the already loaded full mesh, loaded here if None.
+                      A base passed in is not destroyed with the LodMesh.
+                resolutions: grid cells along the longest side of
+                             each reduced level (see load_lod_data)
+                distances: camera distance beyond which each reduced
+                           level is used, one per resolution
+                hysteresis: fraction of a switch distance an entity must
+                            go past before its level changes back,
+                            stops levels flickering at the boundary
+                cache: keep the reduced levels in the mesh cache
+                vertex_format: vertex format of every level (see ObjMesh)
+        """
+
+        self.owns_base = base is None
+        if base is None:
+            base = ObjMesh(filename,indexed=True,cache=cache,vertex_format=vertex_format)
+        self.levels: list[ObjMesh] = [base]
+        for resolution in resolutions:
+            self.levels.append(
+                ObjMesh(filename,data=load_lod_data(filename,resolution,cache),
+                        vertex_format=vertex_format)
+            )
+
+        self.distances = np.array(distances,dtype=np.float32)
+        self.hysteresis = hysteresis
+        #id(entity): level it was drawn at last
+        self.current: dict[int,int] = {}
+
+    def select_levels(self, entities:list[Entity], eye:np.ndarray) -> np.ndarray:
+        """
+            Level index for each entity, from its distance to eye.
+            A level only changes once the distance is past the switch
+            distance by the hysteresis margin.
+        """
+
+        if not entities:
+            return np.zeros(0,dtype=np.int64)
+
+        positions = np.array([entity.position for entity in entities],dtype=np.float32)
+        distance = np.linalg.norm(positions - eye,axis=1)
+        previous = np.array(
+            [self.current.get(id(entity),-1) for entity in entities],dtype=np.int64
+        )
+
+        #level wanted going outwards / coming back in
+        farther = np.searchsorted(self.distances*(1 + self.hysteresis),distance)
+        nearer = np.searchsorted(self.distances*(1 - self.hysteresis),distance)
+        levels = np.where(previous < 0, np.searchsorted(self.distances,distance),
+                          np.clip(previous,farther,nearer))
+
+        for entity,level in zip(entities,levels):
+            self.current[id(entity)] = int(level)
+        return levels
+
+    def partition(self, entities:list[Entity],
+                  eye:np.ndarray) -> list[tuple[ObjMesh,np.ndarray]]:
+        """
+            Which entities (as indices into entities) to draw with
+            each level's mesh, empty levels skipped.
+        """
+
+        levels = self.select_levels(entities,eye)
+        groups = []
+        for level,mesh in enumerate(self.levels):
+            chosen = np.flatnonzero(levels == level)
+            if len(chosen):
+                groups.append((mesh,chosen))
+        return groups
+
+    def forget(self, entity:Entity) -> None:
+        """ Drop the level remembered for a removed entity """
+
+        self.current.pop(id(entity),None)
+
+    def destroy(self) -> None:
+
+        start = 0 if self.owns_base else 1
+        for mesh in self.levels[start:]:
+            mesh.destroy()
@@ -0,0 +1,141 @@
+import numpy as np
+
+"""
+    Reorder indexed meshes for the gpu's post transform vertex cache
+    (Tipsify, Sander et al. 2007) and for vertex fetch locality.
+"""
+
+#vertices the post transform cache is assumed to hold
+CACHE_SIZE = 16
+
+def acmr(indices:np.ndarray, cache_size:int = CACHE_SIZE) -> float:
+    """
+        Average cache miss ratio: vertex shader runs per triangle
+        with a FIFO cache of cache_size vertices. 0.5 is the best
+        possible on large regular meshes, 3 means no reuse at all.
+    """
+
+    triangles = len(indices) // 3
+    if triangles == 0:
+        return 0.0
+
+    cache = [-1]*cache_size
+    cached = set()
+    head = 0
+    misses = 0
+    for vertex in np.asarray(indices).tolist():
+        if vertex in cached:
+            continue
+        misses += 1
+        cached.discard(cache[head])
+        cache[head] = vertex
+        cached.add(vertex)
+        head = (head + 1) % cache_size
+    return misses / triangles
+
+def tipsify(indices:np.ndarray, vertex_count:int, cache_size:int = CACHE_SIZE) -> np.ndarray:
+    """
+        Reorder the triangles for vertex cache reuse: fan around a
+        vertex, then move on to the neighbour that will still be in
+        the cache longest, falling back on recently used vertices
+        and finally input order when a fan dead ends.
+        Returns the reordered indices, same dtype.
+    """
+
+    triangles = np.asarray(indices,dtype=np.int64).reshape(-1,3)
+    if len(triangles) == 0:
+        return indices
+
+    #triangles around each vertex, as offsets into one list
+    corners = triangles.ravel()
+    adjacency = (np.argsort(corners,kind="stable") // 3).tolist()
+    live = np.bincount(corners,minlength=vertex_count)
+    ends = np.cumsum(live)
+    starts = (ends - live).tolist()
+    ends = ends.tolist()
+    live = live.tolist()
+    triangle_list = triangles.tolist()
+
+    cache_time = [0]*vertex_count
+    emitted = [False]*len(triangle_list)
+    dead_end = []
+    output = []
+    time = cache_size + 1
+    cursor = 0
+    fan = int(corners[0])
+
+    while fan >= 0:
+        candidates = []
+        for triangle in adjacency[starts[fan]:ends[fan]]:
+            if emitted[triangle]:
+                continue
+            emitted[triangle] = True
+            for vertex in triangle_list[triangle]:
+                output.append(vertex)
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                live[vertex] -= 1
+                if time - cache_time[vertex] > cache_size:
+                    cache_time[vertex] = time
+                    time += 1
+
+        #next fanning vertex: the candidate staying in cache longest
+        fan = -1
+        best = -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                priority = 0
+                if time - cache_time[vertex] + 2*live[vertex] <= cache_size:
+                    priority = time - cache_time[vertex]
+                if priority > best:
+                    best = priority
+                    fan = vertex
+
+        if fan == -1:
+            while dead_end:
+                vertex = dead_end.pop()
+                if live[vertex] > 0:
+                    fan = vertex
+                    break
+        if fan == -1:
+            while cursor < vertex_count:
+                if live[cursor] > 0:
+                    fan = cursor
+                    break
+                cursor += 1
+
+    return np.array(output,dtype=indices.dtype)
+
+def optimize_vertex_fetch(rows:np.ndarray,
+                          indices:np.ndarray) -> tuple[np.ndarray,np.ndarray]:
+    """
+        Renumber the vertices in the order the indices first use them,
+        so vertex fetches walk through the vbo mostly forwards.
+    """
+
+    used,first_use = np.unique(indices,return_index=True)
+    order = used[np.argsort(first_use)]
+    renumber = np.empty(len(rows),dtype=np.int64)
+    renumber[order] = np.arange(len(order))
+    return rows[order],renumber[indices].astype(indices.dtype)
+
+def optimize_mesh(vertices:np.ndarray,
+                  indices:np.ndarray,
+                  ranges:list) -> tuple[np.ndarray,np.ndarray,list[float]]:
+    """
+        Tipsify every range of an indexed mesh (ranges keep their
+        place), then reorder the vertices for fetch.
+        Returns the new vertices and indices, and the ACMR
+        [before, after].
+    """
+
+    rows = np.asarray(vertices).reshape(-1,8)
+    indices = np.asarray(indices)
+    before = acmr(indices)
+
+    optimized = indices.copy()
+    for _,first,count in ranges:
+        optimized[first:first + count] = tipsify(indices[first:first + count],len(rows))
+
+    rows,optimized = optimize_vertex_fetch(rows,optimized)
+    return rows.ravel(),optimized,[before,acmr(optimized)]
@@ -0,0 +1,230 @@
+import os
+from OpenGL.GL import *
+import numpy as np
+from tools.Objects import BaseMesh,Mesh,load_mesh_data
+
+"""
+    Suballocate many static meshes from one vertex buffer and one
+    index buffer under a single vao, so they can be drawn without
+    rebinding and submitted together with glMultiDrawElements.
+    Meshes added with a model transform are baked into world space
+    (static batching), so one draw covers many entities.
+"""
+
+class FreeList:
+    """
+        First fit allocator over a range of [0, capacity) slots,
+        freed blocks are merged with their neighbours.
+    """
+
+    def __init__(self, capacity:int) -> None:
+
+        self.capacity = capacity
+        #sorted (offset, size) of the free blocks
+        self.blocks: list[tuple[int,int]] = [(0,capacity)] if capacity else []
+
+    def allocate(self, size:int) -> int:
+        """ Offset of a free block of size slots, or None if none fits """
+
+        for i,(offset,free) in enumerate(self.blocks):
+            if free >= size:
+                if free == size:
+                    del self.blocks[i]
+                else:
+                    self.blocks[i] = (offset + size,free - size)
+                return offset
+        return None
+
+    def free(self, offset:int, size:int) -> None:
+
+        i = 0
+        while i < len(self.blocks) and self.blocks[i][0] < offset:
+            i += 1
+        self.blocks.insert(i,(offset,size))
+
+        #merge with the next block, then the previous one
+        if i + 1 < len(self.blocks) and offset + size == self.blocks[i + 1][0]:
+            self.blocks[i] = (offset,size + self.blocks[i + 1][1])
+            del self.blocks[i + 1]
+        if i > 0 and self.blocks[i - 1][0] + self.blocks[i - 1][1] == offset:
+            self.blocks[i - 1] = (self.blocks[i - 1][0],self.blocks[i - 1][1] + self.blocks[i][1])
+            del self.blocks[i]
+
+    def grow(self, capacity:int) -> None:
+        """ Add the slots [self.capacity, capacity) as free """
+
+        added = capacity - self.capacity
+        self.capacity = capacity
+        self.free(capacity - added,added)
+
+class PooledMesh(BaseMesh):
+    """
+        A mesh living in a MeshPool, drawn like any other mesh but
+        through the vao and buffers shared by everything in the pool.
+    """
+
+    def __init__(self, pool, vertex_offset:int, vertex_count:int,
+                 index_offset:int, index_count:int, ranges:list) -> None:
+
+        super().__init__(pool.vao,pool.ebo,GL_UNSIGNED_INT)
+        self.pool = pool
+        self.vertex_offset = vertex_offset
+        self.vertex_count = vertex_count
+        self.index_offset = index_offset
+        self.index_count = index_count
+        #ranges point into the pool's index buffer
+        self.ranges = ranges
+
+    def destroy(self) -> None:
+        """ Give the mesh's space back to the pool """
+
+        self.pool.remove(self)
+
+def transform_vertices(vertices:np.ndarray, transform:np.ndarray) -> np.ndarray:
+    """
+        Copy of interleaved float vertices with the positions and
+        normals moved by a (row vector) model transform
+    """
+
+    rows = np.array(vertices,dtype=np.float32).reshape(-1,8)
+    transform = np.asarray(transform,dtype=np.float32)
+    rows[:,0:3] = rows[:,0:3] @ transform[0:3,0:3] + transform[3,0:3]
+    normals = rows[:,5:8] @ np.linalg.inv(transform[0:3,0:3]).T
+    lengths = np.linalg.norm(normals,axis=1,keepdims=True)
+    rows[:,5:8] = np.divide(normals,lengths,out=normals,where=lengths > 0)
+    return rows.ravel()
+
+class MeshPool(Mesh):
+    """
+        One vbo (x, y, z, s, t, nx, ny, nz vertices) and one uint32
+        index buffer shared by many meshes. Space is handed out by
+        free lists, both buffers double in size when full.
+    """
+
+    def __init__(self, vertex_capacity:int = 1 << 16, index_capacity:int = 1 << 18) -> None:
+
+        super().__init__()
+
+        self.vertices = FreeList(vertex_capacity)
+        self.indices = FreeList(index_capacity)
+        self.meshes: list[PooledMesh] = []
+
+        self.ebo = glGenBuffers(1)
+        self.bind()
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertex_capacity*32, None, GL_STATIC_DRAW)
+        self.set_vertex_layout()
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, index_capacity*4, None, GL_STATIC_DRAW)
+
+    def add_obj(self, filename:str, cache:bool = True, transform:np.ndarray = None) -> PooledMesh:
+        """ Load an obj file (see load_mesh_data) into the pool """
+
+        return self.add(*load_mesh_data(filename,True,cache),transform=transform,filename=filename)
+
+    def add(self, vertices:np.ndarray, indices:np.ndarray = None,
+            submeshes:dict = None, transform:np.ndarray = None,
+            filename:str = None) -> PooledMesh:
+        """
+            Copy mesh data (as returned by load_mesh_data) into the pool.
+            Unindexed data is drawn through a 0, 1, 2, ... index list.
+            With a model transform the vertices are stored in world
+            space, draw them with an identity model.
+            filename is the obj the data came from, the mesh's
+            material library is found next to it.
+        """
+
+        if transform is not None:
+            vertices = transform_vertices(vertices,transform)
+        vertex_count = len(vertices)//8
+        if indices is None:
+            indices = np.arange(vertex_count,dtype=np.uint32)
+        ranges = [[None,0,len(indices)]] if submeshes is None else submeshes["ranges"]
+
+        vertex_offset = self.vertices.allocate(vertex_count)
+        if vertex_offset is None:
+            self.grow_vertices(vertex_count)
+            vertex_offset = self.vertices.allocate(vertex_count)
+        index_offset = self.indices.allocate(len(indices))
+        if index_offset is None:
+            self.grow_indices(len(indices))
+            index_offset = self.indices.allocate(len(indices))
+
+        #bake the vertex offset into the indices, no base vertex needed
+        indices = np.asarray(indices,dtype=np.uint32) + np.uint32(vertex_offset)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferSubData(GL_ARRAY_BUFFER, vertex_offset*32, vertex_count*32,
+                        np.ascontiguousarray(vertices,dtype=np.float32))
+        glBindBuffer(GL_COPY_WRITE_BUFFER, self.ebo)
+        glBufferSubData(GL_COPY_WRITE_BUFFER, index_offset*4, indices.nbytes, indices)
+
+        mesh = PooledMesh(
+            self,vertex_offset,vertex_count,index_offset,len(indices),
+            [[name,index_offset + first,count] for name,first,count in ranges]
+        )
+        mesh.set_bounds(vertices)
+        if submeshes is not None and submeshes["mtllib"] is not None:
+            mesh.mtllib = os.path.join(os.path.dirname(filename or ""),submeshes["mtllib"])
+        self.meshes.append(mesh)
+        return mesh
+
+    def remove(self, mesh:PooledMesh) -> None:
+        """ Free a mesh's space, it must not be drawn afterwards """
+
+        self.meshes.remove(mesh)
+        self.vertices.free(mesh.vertex_offset,mesh.vertex_count)
+        self.indices.free(mesh.index_offset,mesh.index_count)
+
+    def grow_vertices(self, needed:int) -> None:
+        capacity = max(self.vertices.capacity*2,self.vertices.capacity + needed)
+        self.vbo = self.resize_buffer(self.vbo,self.vertices.capacity*32,capacity*32)
+        self.bind()
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        self.set_vertex_layout()
+        self.vertices.grow(capacity)
+
+    def grow_indices(self, needed:int) -> None:
+        capacity = max(self.indices.capacity*2,self.indices.capacity + needed)
+        self.ebo = self.resize_buffer(self.ebo,self.indices.capacity*4,capacity*4)
+        self.bind()
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        self.indices.grow(capacity)
+        for mesh in self.meshes:
+            mesh.ebo = self.ebo
+
+    def resize_buffer(self, old, old_bytes:int, new_bytes:int):
+        """ Make a bigger buffer holding old's contents, old is deleted """
+
+        new = glGenBuffers(1)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, new)
+        glBufferData(GL_COPY_WRITE_BUFFER, new_bytes, None, GL_STATIC_DRAW)
+        glBindBuffer(GL_COPY_READ_BUFFER, old)
+        glCopyBufferSubData(GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, 0, 0, old_bytes)
+        glDeleteBuffers(1,(old,))
+        return new
+
+    def draw_meshes(self, meshes:list[PooledMesh]) -> None:
+        """
+            Draw several whole meshes with one glMultiDrawElements,
+            they share whatever uniforms and textures are bound.
+            The pool's vao must be bound.
+        """
+
+        self.draw_ranges([(mesh.index_offset,mesh.index_count) for mesh in meshes])
+
+    def draw_ranges(self, ranges:list[tuple[int,int]]) -> None:
+        """
+            Draw (first index, count) ranges of the pool with one
+            glMultiDrawElements. The pool's vao must be bound.
+        """
+
+        if not ranges:
+            return
+        counts = np.array([count for _,count in ranges],dtype=np.int32)
+        offsets = (ctypes.c_void_p * len(ranges))(*(first*4 for first,_ in ranges))
+        glMultiDrawElements(GL_TRIANGLES, counts, GL_UNSIGNED_INT, offsets, len(ranges))
+
+    def draw(self) -> None:
+        """ Draw everything in the pool, the vao must be bound. """
+
+        self.draw_meshes(self.meshes)
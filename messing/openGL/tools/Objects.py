@@ -1,11 +1,48 @@
 from OpenGL.GL import *
 import numpy as np
 from PIL import Image
+import hashlib
+import json
+import os
+import tempfile
+from tools.VertexFormat import pack_vertices,set_packed_layout
+from tools.MeshOptimize import optimize_mesh
+from tools.GLState import gl_state
 
 """
     load objects, materials, etc from .obj and .mtl files
 """
 
+#bump whenever the parser output changes, old cache files are then ignored
+PARSER_VERSION = 5
+MESH_CACHE_DIR = ".meshcache"
+MESH_CACHE_MAGIC = b"OBJC"
+#magic, parser version, vertex floats, indices, index item size,
+#length of the json submesh description stored after the arrays
+MESH_CACHE_HEADER = np.dtype([
+    ("magic","S4"),
+    ("version","<u4"),
+    ("vertex_floats","<u8"),
+    ("index_count","<u8"),
+    ("index_size","<u4"),
+    ("submesh_bytes","<u4"),
+])
+#bytes of lookahead after each block, enough to recognise "usemtl "
+BLOCK_PADDING = 7
+#bump whenever the mip filter changes
+MIP_VERSION = 1
+MIP_CACHE_DIR = ".mipcache"
+MIP_CACHE_MAGIC = b"MIPC"
+#magic, mip version, base width, base height, level count
+MIP_CACHE_HEADER = np.dtype([
+    ("magic","S4"),
+    ("version","<u4"),
+    ("width","<u4"),
+    ("height","<u4"),
+    ("levels","<u4"),
+    ("padding","<u4"),
+])
+
 def load_model_from_file(filename:str) -> list[float]:
     """ 
         Read the given obj file and return a list of all the
@@ -33,6 +70,637 @@ def load_model_from_file(filename:str) -> list[float]:
     
     return vertices
 
+def load_model_array(filename:str) -> np.ndarray:
+    """
+        Bulk version of load_model_from_file.
+        Reads the whole obj file at once and pulls out the
+        v, vt, vn and f records with numpy instead of line by line.
+        Faces must be written as v/vt/vn corners (ValueError
+        otherwise), polygons are triangulated as fans (same as
+        read_face_data).
+        Returns the interleaved (x, y, z, s, t, nx, ny, nz) vertex
+        data as a flat float32 array, grouped by material
+        (see load_model_submeshes).
+    """
+
+    return load_model_submeshes(filename)[0]
+
+def load_model_submeshes(filename:str) -> tuple[np.ndarray,dict]:
+    """
+        load_model_array, also following mtllib/usemtl.
+        Triangles are grouped by material into contiguous ranges,
+        ordered by texture (map_Kd) so that drawing the ranges in
+        order switches texture as little as possible.
+        Returns the vertex data and the submesh description:
+            {"mtllib": mtl path relative to the obj, or None,
+             "ranges": [[material name or None, first vertex, count], ...]}
+    """
+
+    with open(filename,'rb') as f:
+        data = pad_block(f.read())
+
+    lines = classify_lines(data)
+    v = read_records(data,*lines["v"],3)
+    vt = read_records(data,*lines["vt"],2)
+    vn = read_records(data,*lines["vn"],3)
+    corners,face_of_triangle = read_faces(data,lines,(len(v),len(vt),len(vn)))
+
+    mtllib = None
+    if len(lines["mtllib"][0]):
+        mtllib = read_line_texts(data,*lines["mtllib"])[0]
+
+    #each face uses the last usemtl before it, -1 when there is none
+    names = read_line_texts(data,*lines["usemtl"])
+    used_names = sorted(set(names))
+    face_material = np.full(len(lines["f"][0]),-1,dtype=np.int64)
+    if names:
+        name_ids = np.array([used_names.index(name) for name in names],dtype=np.int64)
+        last_use = np.searchsorted(lines["usemtl"][0],lines["f"][0]) - 1
+        face_material = np.where(last_use < 0, -1, name_ids[np.maximum(last_use,0)])
+
+    #rank the materials by texture, then name, faces before any usemtl first
+    library = {}
+    if mtllib is not None:
+        library = read_mtl_file(os.path.join(os.path.dirname(filename),mtllib))
+    names = [None] + used_names
+    ranked = sorted(
+        range(len(names)),
+        key=lambda i: (names[i] is not None,
+                       library.get(names[i],{}).get("map_Kd",""),
+                       names[i] or "")
+    )
+    rank = np.empty(len(names),dtype=np.int64)
+    rank[ranked] = np.arange(len(names))
+
+    triangle_rank = rank[face_material[face_of_triangle] + 1]
+    order = np.argsort(triangle_rank,kind="stable")
+    corners = corners.reshape(-1,3,3)[order].reshape(-1,3)
+    triangle_rank = triangle_rank[order]
+
+    ranges = []
+    counts = np.bincount(triangle_rank,minlength=len(names))
+    first = 0
+    for i in ranked:
+        count = int(counts[rank[i]])*3
+        if count:
+            ranges.append([names[i],first,count])
+        first += count
+
+    vertices = expand_corners(corners,v,vt,vn).ravel()
+    return vertices,{"mtllib": mtllib, "ranges": ranges}
+
+def read_line_texts(data:np.ndarray,
+                    starts:np.ndarray,
+                    ends:np.ndarray) -> list[str]:
+    """ Text of the selected lines (tag already skipped), without comments, stripped """
+
+    return [
+        bytes(data[start:end]).decode().split("#")[0].strip()
+        for start,end in zip(starts,ends)
+    ]
+
+def read_mtl_file(filename:str) -> dict[str,dict[str,str]]:
+    """
+        Read a material library.
+        Returns, per material name, its statements as text,
+        eg. {"Kd": "0.8 0.8 0.8", "map_Kd": "wood.jpeg"}.
+        A missing file gives an empty library.
+    """
+
+    library = {}
+    if not os.path.exists(filename):
+        return library
+
+    material = None
+    with open(filename,'r') as f:
+        for line in f:
+            words = line.split(maxsplit=1)
+            if not words or words[0].startswith('#'):
+                continue
+            value = words[1].strip() if len(words) > 1 else ""
+            if words[0] == 'newmtl':
+                material = library.setdefault(value,{})
+            elif material is not None:
+                material[words[0]] = value
+    return library
+
+def load_model_chunks(filename:str, chunk_bytes:int = 1 << 24):
+    """
+        Streaming version of load_model_array for models too big to
+        hold in memory several times over.
+        The first pass over the file only counts records and triangles
+        (from the slashes of the face lines, nothing is parsed), the
+        second fills the v, vt, vn tables allocated at their final
+        size, the third parses the faces chunk_bytes of text at a time.
+        The tables are memory mapped from an unlinked file in
+        MESH_CACHE_DIR next to the model, the os pages them in and
+        out as the faces use them.
+        Returns the total vertex count and a generator of float32
+        (count, 8) vertex chunks in file order. Peak memory is a small
+        multiple of chunk_bytes however big the model is (see
+        benchmarks/streamMemory.py), the tables' pages aside.
+        Materials are ignored, triangles stay in file order.
+    """
+
+    counts = np.zeros(3,dtype=np.int64)
+    triangles = 0
+    for data in read_blocks(filename,chunk_bytes):
+        lines = classify_lines(data)
+        counts += [len(lines[tag][0]) for tag in ("v","vt","vn")]
+        triangles += count_triangles(data,*lines["f"])
+
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)),MESH_CACHE_DIR)
+    os.makedirs(cache_dir,exist_ok=True)
+    table_file = tempfile.TemporaryFile(dir=cache_dir)
+    tables = []
+    offset = 0
+    for count,width in zip(counts,(3,2,3)):
+        if count == 0:
+            tables.append(np.zeros((0,width),dtype=np.float32))
+            continue
+        tables.append(np.memmap(table_file,dtype=np.float32,mode='w+',
+                                offset=offset,shape=(int(count),width)))
+        offset += int(count)*width*4
+    filled = [0,0,0]
+    first_line = 1
+    for data in read_blocks(filename,chunk_bytes):
+        lines = classify_lines(data)
+        for axis,(tag,table) in enumerate(zip(("v","vt","vn"),tables)):
+            records = read_records(data,*lines[tag],table.shape[1],first_line)
+            table[filled[axis]:filled[axis] + len(records)] = records
+            filled[axis] += len(records)
+        first_line += count_lines(data)
+    v,vt,vn = tables
+
+    def chunks():
+        #records and lines before the block, for relative indices and errors
+        base = np.zeros(3,dtype=np.int64)
+        first_line = 1
+        try:
+            for data in read_blocks(filename,chunk_bytes):
+                lines = classify_lines(data)
+                corners,_ = read_faces(data,lines,counts,base,first_line)
+                base += [len(lines[tag][0]) for tag in ("v","vt","vn")]
+                first_line += count_lines(data)
+                if len(corners):
+                    yield expand_corners(corners,v,vt,vn)
+        finally:
+            table_file.close()
+
+    return triangles*3,chunks()
+
+def count_triangles(data:np.ndarray, starts:np.ndarray, ends:np.ndarray) -> int:
+    """
+        Triangles the selected face lines fan into, from their slash
+        count (two per v/vt/vn corner, up to any # comment) without
+        parsing them. read_faces checks the faces really are v/vt/vn corners.
+    """
+
+    hashes = np.flatnonzero(data == ord("#"))
+    if len(hashes):
+        first_hash = hashes[np.minimum(np.searchsorted(hashes,starts),len(hashes) - 1)]
+        ends = np.where((first_hash >= starts) & (first_hash < ends),first_hash,ends)
+    slashes = np.flatnonzero(data == ord("/"))
+    corners = (np.searchsorted(slashes,ends) - np.searchsorted(slashes,starts)) // 2
+    return int(np.maximum(corners - 2,0).sum())
+
+def read_blocks(filename:str, block_bytes:int):
+    """
+        Yield the file as padded uint8 blocks of roughly block_bytes,
+        each one cut at a line boundary.
+    """
+
+    with open(filename,'rb') as f:
+        leftover = b""
+        while True:
+            block = f.read(block_bytes)
+            if not block:
+                break
+            block = leftover + block
+            cut = block.rfind(b"\n") + 1
+            if cut == 0:
+                leftover = block
+                continue
+            leftover = block[cut:]
+            yield pad_block(block[:cut])
+        if leftover:
+            yield pad_block(leftover)
+
+def pad_block(text:bytes) -> np.ndarray:
+    """
+        View obj text as uint8, ending in a newline plus padding
+        so classify_lines can look ahead past the last line.
+    """
+
+    return np.frombuffer(text + b"\n" + b" "*BLOCK_PADDING,dtype=np.uint8)
+
+def classify_lines(data:np.ndarray) -> dict[str,tuple[np.ndarray,np.ndarray]]:
+    """
+        Find the v, vt, vn, f, usemtl and mtllib lines of a padded block,
+        the tag may be followed by spaces or tabs.
+        Returns (starts, ends) per tag, starts skip the tag
+        except for f lines, which read_faces wants whole.
+    """
+
+    line_ends = np.flatnonzero(data[:-BLOCK_PADDING] == ord("\n"))
+    line_starts = np.concatenate(([0],line_ends[:-1] + 1))
+
+    #the first bytes of every line, the padding covers the last ones
+    heads = data[line_starts[:,None] + np.arange(BLOCK_PADDING)]
+    blank = (heads == ord(" ")) | (heads == ord("\t"))
+
+    def starts_with(tag:bytes) -> np.ndarray:
+        found = blank[:,len(tag)].copy()
+        for i,char in enumerate(tag):
+            found &= heads[:,i] == char
+        return found
+
+    lines = {}
+    for tag in ("v","vt","vn","usemtl","mtllib"):
+        found = starts_with(tag.encode())
+        lines[tag] = (line_starts[found] + len(tag) + 1, line_ends[found])
+    found = starts_with(b"f")
+    lines["f"] = (line_starts[found], line_ends[found])
+    return lines
+
+def read_faces(data:np.ndarray,
+               lines:dict,
+               counts:tuple,
+               base:tuple = (0,0,0),
+               first_line:int = 1) -> tuple[np.ndarray,np.ndarray]:
+    """
+        Parse the f lines of a block (lines as from classify_lines)
+        and fan triangulate them.
+        Negative indices count back from the v, vt, vn records read
+        before their face line: base is how many of each came before
+        the block, first_line the block's first line number.
+        counts is how many v, vt, vn records the whole file has.
+        Returns the 0 based (v, vt, vn) indices of every triangle
+        corner as an int64 (corners, 3) array, and which of the
+        lines each triangle came from.
+        Raises ValueError, naming the line, for faces that are not
+        three or more v/vt/vn corners or point outside the records.
+    """
+
+    starts,ends = lines["f"]
+    if len(starts) == 0:
+        return np.zeros((0,3),dtype=np.int64),np.zeros(0,dtype=np.int64)
+
+    #keep the whole face line, its leading f becomes a 0 marker
+    #(obj indices are never 0) and the corners become plain numbers
+    face_text,face_offsets = gather_lines(data,starts,ends)
+    strip_comments(face_text)
+    slashes = face_text == ord("/")
+    slash_counts = np.diff(np.searchsorted(
+        np.flatnonzero(slashes),np.append(face_offsets,len(face_text))
+    ))
+    face_text[slashes] = ord(" ")
+    face_text[face_offsets] = ord("0")
+    #intermediates are dropped as soon as possible, streaming
+    #peak memory is a multiple of the largest of them
+    text = face_text.tobytes()
+    del face_text,slashes
+    try:
+        indices = np.fromstring(text,dtype=np.int64,sep=' ')
+        face_starts = np.flatnonzero(indices == 0)
+    except ValueError:
+        face_starts = None
+    del text
+    if face_starts is None or len(face_starts) != len(starts):
+        #text that is not numbers, or a 0 index, threw the parse off
+        for start,end in zip(starts,ends):
+            text = bytes(data[start + 2:end]).decode(errors="replace").split("#")[0]
+            corners = [corner.split("/") for corner in text.split()]
+            if not all(len(corner) == 3 and all(part.lstrip("-").isdigit() and int(part)
+                                                for part in corner) for corner in corners):
+                raise ValueError(f"line {line_number(data,start,first_line)}: "
+                                 f"bad face corner in '{text.strip()}'")
+        raise ValueError("could not parse the faces")
+
+    #each face must be 3 numbers and 2 slashes per corner, 3 corners or more
+    number_counts = np.diff(np.append(face_starts,len(indices))) - 1
+    corner_counts = number_counts // 3
+    bad = (number_counts != 3*corner_counts) | (slash_counts != 2*corner_counts) | (corner_counts < 3)
+    if bad.any():
+        start = starts[np.argmax(bad)]
+        raise ValueError(f"line {line_number(data,start,first_line)}: faces need three "
+                         f"or more v/vt/vn corners, got "
+                         f"'{bytes(data[start:ends[np.argmax(bad)]]).decode().strip()}'")
+    corners = np.delete(indices,face_starts).reshape(-1,3)
+    del indices
+
+    #1 based, or relative to the records before the face line
+    face_of_corner = np.repeat(np.arange(len(starts)),corner_counts)
+    for axis,tag in enumerate(("v","vt","vn")):
+        column = corners[:,axis]
+        relative = column < 0
+        if relative.any():
+            before = base[axis] + np.searchsorted(lines[tag][0],starts)
+            column[relative] += before[face_of_corner[relative]]
+            column[~relative] -= 1
+            if (column < 0).any():
+                start = starts[face_of_corner[np.argmax(column < 0)]]
+                raise ValueError(f"line {line_number(data,start,first_line)}: "
+                                 f"relative {tag} index before the first {tag}")
+        else:
+            column -= 1
+        if len(column) and column.max() >= counts[axis]:
+            start = starts[face_of_corner[np.argmax(column >= counts[axis])]]
+            raise ValueError(f"line {line_number(data,start,first_line)}: "
+                             f"{tag} index past the last of {counts[axis]} {tag}")
+
+    #fan triangulate every face at once, int32 halves the corner arrays
+    if len(corners) and corners.max() < 2**31:
+        corners = corners.astype(np.int32)
+    first_corner = np.cumsum(corner_counts) - corner_counts
+    triangle_counts = corner_counts - 2
+    face_of_triangle = np.repeat(np.arange(len(starts)),triangle_counts)
+    triangle_in_face = np.arange(len(face_of_triangle)) - np.repeat(
+        np.cumsum(triangle_counts) - triangle_counts,triangle_counts)
+    first = first_corner[face_of_triangle]
+    corner_order = np.stack(
+        (first, first + triangle_in_face + 1, first + triangle_in_face + 2),
+        axis=1
+    ).ravel()
+    return corners[corner_order],face_of_triangle
+
+def line_number(data:np.ndarray, position:int, first_line:int = 1) -> int:
+    """ Line number of a byte position in a block starting at first_line """
+
+    return first_line + int(np.count_nonzero(data[:position] == ord("\n")))
+
+def count_lines(data:np.ndarray) -> int:
+    """ Lines of text in a padded block """
+
+    return int(np.count_nonzero(data[:-BLOCK_PADDING - 1] == ord("\n")))
+
+def expand_corners(corners:np.ndarray,
+                   v:np.ndarray,
+                   vt:np.ndarray,
+                   vn:np.ndarray) -> np.ndarray:
+    """
+        Look up the v, vt, vn data of every corner (0 based indices,
+        see read_faces) and return the
+        interleaved float32 (corners, 8) vertex array.
+    """
+
+    vertices = np.empty((len(corners),8),dtype=np.float32)
+    np.take(v,corners[:,0],axis=0,out=vertices[:,0:3])
+    np.take(vt,corners[:,1],axis=0,out=vertices[:,3:5])
+    np.take(vn,corners[:,2],axis=0,out=vertices[:,5:8])
+    return vertices
+
+def gather_lines(data:np.ndarray,
+                 starts:np.ndarray,
+                 ends:np.ndarray) -> tuple[np.ndarray,np.ndarray]:
+    """
+        Copy the byte ranges [start, end] (end being the newline)
+        of the selected lines into one new buffer.
+        Returns the buffer and the offset of each line in it.
+    """
+
+    lengths = ends - starts + 1
+    offsets = np.cumsum(lengths) - lengths
+    return data[byte_mask(len(data),starts,ends)],offsets
+
+def byte_mask(size:int, starts:np.ndarray, ends:np.ndarray) -> np.ndarray:
+    """
+        Bool mask of size bytes selecting the sorted, separate
+        ranges [start, end], built from alternating runs of skipped
+        and selected bytes (a byte per byte, positions would take eight)
+    """
+
+    runs = np.empty(2*len(starts) + 1,dtype=np.int64)
+    runs[0:-1:2] = starts - np.concatenate(([0],ends[:-1] + 1))
+    runs[1::2] = ends - starts + 1
+    runs[-1] = size - ends[-1] - 1
+    pattern = np.zeros(len(runs),dtype=bool)
+    pattern[1::2] = True
+    return np.repeat(pattern,runs)
+
+def strip_comments(text:np.ndarray) -> None:
+    """ Blank out # comments in place, text is whole lines ending in newlines """
+
+    hashes = np.flatnonzero(text == ord("#"))
+    if len(hashes) == 0:
+        return
+    newlines = np.flatnonzero(text == ord("\n"))
+    comment_ends = newlines[np.searchsorted(newlines,hashes)]
+    #a line's comment starts at its first #
+    first = np.ones(len(hashes),dtype=bool)
+    first[1:] = comment_ends[1:] != comment_ends[:-1]
+    text[byte_mask(len(text),hashes[first],comment_ends[first] - 1)] = ord(" ")
+
+def read_records(data:np.ndarray,
+                 starts:np.ndarray,
+                 ends:np.ndarray,
+                 width:int,
+                 first_line:int = 1) -> np.ndarray:
+    """
+        Parse the numbers of the selected lines (tag already skipped)
+        and return the first width of each line as a (count, width)
+        float32 array. Lines may have more (eg. vt u v w), comments
+        are skipped. Raises ValueError, naming the line (first_line
+        being the block's first), for text that is not numbers or
+        lines with fewer than width of them.
+    """
+
+    if len(starts) == 0:
+        return np.zeros((0,width),dtype=np.float32)
+    text,offsets = gather_lines(data,starts,ends)
+    strip_comments(text)
+    #numbers per line, from where runs of non blank bytes start
+    solid = text > ord(" ")
+    solid[1:] &= ~solid[:-1]
+    counts = np.diff(np.searchsorted(np.flatnonzero(solid),np.append(offsets,len(text))))
+    del solid
+    try:
+        values = np.fromstring(text.tobytes(),dtype=np.float32,sep=' ')
+    except ValueError:
+        values = None
+    del text
+
+    if values is None or len(values) != counts.sum():
+        for start,end in zip(starts,ends):
+            words = bytes(data[start:end]).decode(errors="replace").split("#")[0].split()
+            try:
+                [float(word) for word in words]
+            except ValueError:
+                raise ValueError(f"line {line_number(data,start,first_line)}: "
+                                 f"bad number in '{' '.join(words)}'") from None
+        raise ValueError("could not parse the records")
+    if (counts < width).any():
+        start = starts[np.argmax(counts < width)]
+        raise ValueError(f"line {line_number(data,start,first_line)}: "
+                         f"needs {width} numbers, got "
+                         f"'{bytes(data[start:ends[np.argmax(counts < width)]]).decode().strip()}'")
+    if (counts == counts[0]).all():
+        return values.reshape(len(starts),-1)[:,:width]
+    first = np.cumsum(counts) - counts
+    return values[first[:,None] + np.arange(width)]
+
+def index_vertices(vertices:np.ndarray,
+                   stride:int = 8) -> tuple[np.ndarray,np.ndarray]:
+    """
+        Collapse identical vertices of an expanded vertex array.
+        Returns the unique vertices (in order of first use) and
+        the element indices that rebuild the original triangles.
+    """
+
+    rows = np.ascontiguousarray(vertices.reshape(-1,stride))
+    #compare whole rows at once by viewing each one as a single value
+    keys = rows.view(np.dtype((np.void,rows.itemsize*stride))).ravel()
+    _,first_use,inverse = np.unique(keys,return_index=True,return_inverse=True)
+
+    #renumber so unique vertices keep the order they were first used in
+    order = np.argsort(first_use)
+    renumber = np.empty_like(order)
+    renumber[order] = np.arange(len(order))
+
+    unique = rows[first_use[order]].ravel()
+    indices = renumber[inverse.ravel()]
+    index_type = np.uint16 if len(order) <= 65536 else np.uint32
+    return unique,indices.astype(index_type)
+
+def load_mesh_data(filename:str,
+                   indexed:bool = False,
+                   cache:bool = True) -> tuple[np.ndarray,np.ndarray,dict]:
+    """
+        Get the ready to upload vertex data, indices when indexed
+        (None otherwise) and submesh description (see
+        load_model_submeshes) for an obj file.
+        With cache on, the parsed arrays are stored in a binary file
+        under MESH_CACHE_DIR next to the model, and later calls
+        memory map that file instead of parsing the obj again.
+    """
+
+    if not cache:
+        return parse_mesh_data(filename,indexed)
+
+    cache_path = mesh_cache_path(filename,indexed)
+    cached = read_mesh_cache(cache_path)
+    if cached is not None:
+        return cached
+
+    data = parse_mesh_data(filename,indexed)
+    write_mesh_cache(cache_path,*data)
+    return data
+
+def parse_mesh_data(filename:str, indexed:bool) -> tuple[np.ndarray,np.ndarray,dict]:
+    """
+        Parse the obj file, collapsing identical vertices when indexed.
+        Indexed meshes are also reordered for the vertex cache
+        (see tools.MeshOptimize), the ACMR before and after is kept
+        in submeshes["acmr"]. Triangles stay inside their ranges,
+        which count indices instead of vertices.
+    """
+
+    vertices,submeshes = load_model_submeshes(filename)
+    indices = None
+    if indexed:
+        vertices,indices = index_vertices(vertices)
+        vertices,indices,submeshes["acmr"] = optimize_mesh(
+            vertices,indices,submeshes["ranges"]
+        )
+    return vertices,indices,submeshes
+
+def mesh_cache_path(filename:str, indexed:bool) -> str:
+    """
+        Name of the cache file for this obj, the key covers the path,
+        modification time, size, parser version and layout, so any
+        change to the model or parser gives a new file.
+    """
+
+    return source_cache_path(
+        filename,MESH_CACHE_DIR,".mesh",
+        PARSER_VERSION,"indexed" if indexed else "expanded"
+    )
+
+def source_cache_path(filename:str, cache_dir:str, extension:str, *params) -> str:
+    """
+        Path of a cache file derived from filename, in cache_dir next to it.
+        The name hashes the source's path, modification time and size
+        with any extra params (versions, options).
+    """
+
+    info = os.stat(filename)
+    key = "|".join((
+        os.path.abspath(filename),
+        str(info.st_mtime_ns),
+        str(info.st_size),
+    ) + tuple(str(param) for param in params))
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    folder = os.path.join(os.path.dirname(os.path.abspath(filename)),cache_dir)
+    return os.path.join(folder,digest + extension)
+
+def read_mesh_cache(cache_path:str) -> tuple[np.ndarray,np.ndarray,dict]:
+    """
+        Memory map a cache file written by write_mesh_cache.
+        Returns None when the file is missing or not usable.
+    """
+
+    if not os.path.exists(cache_path):
+        return None
+
+    header = np.fromfile(cache_path,dtype=MESH_CACHE_HEADER,count=1)
+    if len(header) == 0:
+        return None
+    header = header[0]
+    if header["magic"] != MESH_CACHE_MAGIC or header["version"] != PARSER_VERSION:
+        return None
+
+    offset = MESH_CACHE_HEADER.itemsize
+    vertex_floats = int(header["vertex_floats"])
+    index_count = int(header["index_count"])
+    index_type = np.uint16 if header["index_size"] == 2 else np.uint32
+    index_bytes = index_count*np.dtype(index_type).itemsize
+    submesh_offset = offset + vertex_floats*4 + index_bytes
+    expected = submesh_offset + int(header["submesh_bytes"])
+    if vertex_floats == 0 or os.path.getsize(cache_path) != expected:
+        return None
+
+    vertices = np.memmap(cache_path,dtype=np.float32,mode='r',
+                         offset=offset,shape=(vertex_floats,))
+    indices = None
+    if header["index_size"] != 0:
+        indices = np.memmap(cache_path,dtype=index_type,mode='r',
+                            offset=offset + vertex_floats*4,shape=(index_count,))
+    with open(cache_path,'rb') as f:
+        f.seek(submesh_offset)
+        submeshes = json.loads(f.read().decode())
+    return vertices,indices,submeshes
+
+def write_mesh_cache(cache_path:str,
+                     vertices:np.ndarray,
+                     indices:np.ndarray,
+                     submeshes:dict) -> None:
+    """
+        Store the arrays as: header, float32 vertices, indices,
+        then the submesh description as json.
+        Written to a temporary file first so a crash never leaves
+        a half written cache behind.
+    """
+
+    header = np.zeros(1,dtype=MESH_CACHE_HEADER)
+    header["magic"] = MESH_CACHE_MAGIC
+    header["version"] = PARSER_VERSION
+    header["vertex_floats"] = len(vertices)
+    if indices is not None:
+        header["index_count"] = len(indices)
+        header["index_size"] = indices.dtype.itemsize
+    submesh_text = json.dumps(submeshes).encode()
+    header["submesh_bytes"] = len(submesh_text)
+
+    os.makedirs(os.path.dirname(cache_path),exist_ok=True)
+    temp_path = cache_path + ".tmp"
+    with open(temp_path,'wb') as f:
+        header.tofile(f)
+        np.asarray(vertices,dtype=np.float32).tofile(f)
+        if indices is not None:
+            indices.tofile(f)
+        f.write(submesh_text)
+    os.replace(temp_path,cache_path)
+
 def read_vertex_data(words:list[str])->list[float]:
     return [
         float(words[1]),
@@ -89,67 +757,389 @@ def read_corner(description: str,
     for x in vn[int(v_vt_vn[2])-1]:
         vertices.append(x)
 
-class Mesh:
+class BaseMesh:
+    """
+        What renderers use of a mesh: its vao, draw ranges, bounds,
+        position decoding and the draw calls. Mesh owns its vao and
+        buffers, a PooledMesh (see tools.MeshPool) borrows its pool's.
+    """
+
+    def __init__(self, vao = None, ebo = None, index_type = None):
+
+        self.vao = vao
+        self.ebo = ebo
+        self.index_type = index_type
+        self.vertex_count = 0
+        self.index_count = 0
+        #where the mesh's indices start in the ebo, for shared ones
+        self.index_offset = 0
+        #[material name, first, count] per submesh, in draw order
+        self.ranges = []
+        self.mtllib = None
+        #None for the float layout, else a VertexFormat name
+        self.vertex_format = None
+        #decodes quantized positions: offset + scale * position
+        self.position_scale = np.ones(3,dtype=np.float32)
+        self.position_offset = np.zeros(3,dtype=np.float32)
+        #bounds in model space, an infinite sphere is never culled
+        self.aabb_min = np.full(3,-np.inf,dtype=np.float32)
+        self.aabb_max = np.full(3,np.inf,dtype=np.float32)
+        self.bounding_center = np.zeros(3,dtype=np.float32)
+        self.bounding_radius = np.inf
+
+    def set_bounds(self, vertices:np.ndarray) -> None:
+        """
+            Compute the axis aligned box and bounding sphere
+            (around the box centre) of interleaved float vertices.
+        """
+
+        positions = np.asarray(vertices).reshape(-1,8)[:,0:3]
+        if len(positions) == 0:
+            return
+        self.aabb_min = positions.min(axis=0)
+        self.aabb_max = positions.max(axis=0)
+        self.bounding_center = (self.aabb_min + self.aabb_max) * 0.5
+        self.bounding_radius = float(
+            np.linalg.norm(positions - self.bounding_center,axis=1).max()
+        )
+
+    def bind(self) -> None:
+        """ Bind the mesh's vao, if it is not already """
+
+        gl_state.bind_vertex_array(self.vao)
+
+    def index_pointer(self, first:int):
+        """ Byte offset of index first in the ebo, as glDrawElements takes it """
+
+        return ctypes.c_void_p(first * (2 if self.index_type == GL_UNSIGNED_SHORT else 4))
+
+    def draw(self) -> None:
+        """ Draw the whole mesh, the vao must be bound. """
+
+        if self.ebo is None:
+            glDrawArrays(GL_TRIANGLES, 0, self.vertex_count)
+        else:
+            glDrawElements(GL_TRIANGLES, self.index_count, self.index_type,
+                           self.index_pointer(self.index_offset))
+
+    def draw_range(self, first:int, count:int) -> None:
+        """
+            Draw one submesh, first and count are vertices, or
+            indices for an indexed mesh. The vao must be bound.
+        """
+
+        if self.ebo is None:
+            glDrawArrays(GL_TRIANGLES, first, count)
+        else:
+            glDrawElements(GL_TRIANGLES, count, self.index_type, self.index_pointer(first))
+
+    def draw_range_instanced(self, first:int, count:int, instances:int) -> None:
+        """
+            Draw one submesh (see draw_range) instances times, per
+            instance data comes from an InstanceBuffer on the vao.
+        """
+
+        if self.ebo is None:
+            glDrawArraysInstanced(GL_TRIANGLES, first, count, instances)
+        else:
+            glDrawElementsInstanced(GL_TRIANGLES, count, self.index_type,
+                                    self.index_pointer(first), instances)
+
+class Mesh(BaseMesh):
     """ A general mesh """
 
 
     def __init__(self):
 
-        self.vertex_count = 0
-
-        self.vao = glGenVertexArrays(1)
+        super().__init__(glGenVertexArrays(1))
         self.vbo = glGenBuffers(1)
+
+    def set_vertex_layout(self) -> None:
+        """
+            Describe the interleaved x, y, z, s, t, nx, ny, nz layout
+            of the vbo (or the packed one, see tools.VertexFormat).
+            The vao and vbo must be bound.
+        """
+
+        if self.vertex_format is not None:
+            set_packed_layout(self.vertex_format)
+            return
+
+        #position
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
+        #texture
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
+        #normal
+        glEnableVertexAttribArray(2)
+        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
+
+    def set_indices(self, indices:np.ndarray) -> None:
+        """
+            Upload element indices (uint16 or uint32) for the mesh,
+            draw() then uses glDrawElements. The vao must be bound.
+        """
+
+        self.ebo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        self.index_count = len(indices)
+        self.index_type = GL_UNSIGNED_SHORT if indices.dtype == np.uint16 else GL_UNSIGNED_INT
     
     def destroy(self):
         
+        gl_state.forget_vertex_array(self.vao)
         glDeleteVertexArrays(1, (self.vao,))
         glDeleteBuffers(1,(self.vbo,))
+        if self.ebo is not None:
+            glDeleteBuffers(1,(self.ebo,))
 
 class ObjMesh(Mesh):
 
 
-    def __init__(self, filename):
+    def __init__(self, filename, indexed = False, cache = True, data = None,
+                 vertex_format = None):
+        """
+            Load the obj file into a vbo.
+            Parameters:
+                filename: path to the obj file
+                indexed: store each distinct vertex once and draw
+                         with an element buffer. dedup_ratio reports
+                         how many expanded vertices each one replaced.
+                cache: use the binary mesh cache (see load_mesh_data)
+                data: (vertices, indices, submeshes) already returned
+                      by load_mesh_data, eg. on a loader thread,
+                      then only the upload happens here.
+                vertex_format: store the vertices in a smaller format,
+                               "compact" or "quantized" (see tools.VertexFormat).
+                               Quantized meshes need the shader to decode
+                               positions with position_scale/position_offset.
+            Faces are grouped by material into ranges, the material
+            library (if the obj names one) is at mtllib.
+        """
 
         super().__init__()
 
         # x, y, z, s, t, nx, ny, nz
-        vertices = load_model_from_file(filename)
+        if data is None:
+            data = load_mesh_data(filename,indexed,cache)
+        vertices,indices,submeshes = data
+        self.ranges = submeshes["ranges"]
+        if submeshes["mtllib"] is not None:
+            self.mtllib = os.path.join(os.path.dirname(filename),submeshes["mtllib"])
         self.vertex_count = len(vertices)//8
-        vertices = np.array(vertices, dtype=np.float32)
+        self.dedup_ratio = 1.0
+        #vertex cache miss ratio [before, after] optimizing, indexed only
+        self.acmr = submeshes.get("acmr")
+        if indices is not None:
+            self.dedup_ratio = len(indices) / max(1,self.vertex_count)
+        self.set_bounds(vertices)
+        if vertex_format is not None:
+            self.vertex_format = vertex_format
+            vertices,self.position_scale,self.position_offset = \
+                pack_vertices(vertices,vertex_format)
 
-        glBindVertexArray(self.vao)
+        self.bind()
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
         glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
-        #position
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
-        #texture
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
-        #normal
-        glEnableVertexAttribArray(2)
-        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
+        self.set_vertex_layout()
+        if indices is not None:
+            self.set_indices(indices)
+
+class StreamedObjMesh(Mesh):
+
+
+    def __init__(self, filename, chunk_bytes = 1 << 24):
+        """
+            Load a very large obj file into a vbo without ever holding
+            the whole vertex array in memory: the vbo is allocated at
+            its final size, then filled chunk by chunk with glBufferSubData.
+            Parameters:
+                filename: path to the obj file
+                chunk_bytes: how much obj text to parse per chunk
+        """
+
+        super().__init__()
+
+        self.vertex_count,chunks = load_model_chunks(filename,chunk_bytes)
+
+        self.bind()
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertex_count*32, None, GL_STATIC_DRAW)
+        offset = 0
+        low = np.full(3,np.inf,dtype=np.float32)
+        high = np.full(3,-np.inf,dtype=np.float32)
+        for chunk in chunks:
+            glBufferSubData(GL_ARRAY_BUFFER, offset, chunk.nbytes, chunk)
+            offset += chunk.nbytes
+            low = np.minimum(low,chunk[:,0:3].min(axis=0))
+            high = np.maximum(high,chunk[:,0:3].max(axis=0))
+        self.set_vertex_layout()
+        self.ranges = [[None,0,self.vertex_count]]
+        #the chunks are gone, so the sphere is the one around the box
+        if self.vertex_count:
+            self.aabb_min = low
+            self.aabb_max = high
+            self.bounding_center = (low + high) * 0.5
+            self.bounding_radius = float(np.linalg.norm(high - low)) * 0.5
+
+def load_image_data(filepath:str,
+                    mip_cache:bool = True) -> tuple[int,int,list[np.ndarray]]:
+    """
+        Decode an image file to RGBA.
+        Returns its width, height and pixel levels as (h, w, 4) uint8
+        arrays: the whole mip chain when mip_cache is on (read from
+        MIP_CACHE_DIR next to the image, built there on first use),
+        otherwise only the base level.
+    """
+
+    if mip_cache:
+        cache_path = source_cache_path(filepath,MIP_CACHE_DIR,".mips",MIP_VERSION)
+        levels = read_mip_cache(cache_path)
+        if levels is None:
+            levels = make_mip_chain(decode_image(filepath))
+            write_mip_cache(cache_path,levels)
+    else:
+        levels = [decode_image(filepath)]
+
+    image_height,image_width = levels[0].shape[:2]
+    return image_width,image_height,levels
+
+def decode_image(filepath:str) -> np.ndarray:
+    """ Decode the image into one (h, w, 4) uint8 array """
+
+    with Image.open(filepath, mode = "r") as image:
+        image = image.convert("RGBA")
+        return np.asarray(image)
+
+def mip_level_count(width:int, height:int) -> int:
+    return int(max(width,height)).bit_length()
+
+def make_mip_chain(pixels:np.ndarray) -> list[np.ndarray]:
+    """
+        Box filter the image down to 1x1, each level is half the
+        size of the last (rounded down, never below 1).
+    """
+
+    levels = [pixels]
+    while max(levels[-1].shape[:2]) > 1:
+        level = levels[-1].astype(np.float32)
+        height,width = level.shape[:2]
+        if height > 1:
+            level = (level[0:height//2*2:2] + level[1:height//2*2:2]) * 0.5
+        if width > 1:
+            level = (level[:,0:width//2*2:2] + level[:,1:width//2*2:2]) * 0.5
+        levels.append((level + 0.5).astype(np.uint8))
+    return levels
+
+def read_mip_cache(cache_path:str) -> list[np.ndarray]:
+    """
+        Memory map every level of a cache file written by write_mip_cache.
+        Returns None when the file is missing or not usable.
+    """
+
+    if not os.path.exists(cache_path):
+        return None
+
+    header = np.fromfile(cache_path,dtype=MIP_CACHE_HEADER,count=1)
+    if len(header) == 0:
+        return None
+    header = header[0]
+    if header["magic"] != MIP_CACHE_MAGIC or header["version"] != MIP_VERSION:
+        return None
+
+    width = int(header["width"])
+    height = int(header["height"])
+    if header["levels"] != mip_level_count(width,height):
+        return None
+
+    shapes = []
+    while True:
+        shapes.append((height,width,4))
+        if max(width,height) == 1:
+            break
+        width = max(1,width//2)
+        height = max(1,height//2)
+    offset = MIP_CACHE_HEADER.itemsize
+    if os.path.getsize(cache_path) != offset + sum(np.prod(shape) for shape in shapes):
+        return None
+
+    levels = []
+    for shape in shapes:
+        levels.append(np.memmap(cache_path,dtype=np.uint8,mode='r',offset=offset,shape=shape))
+        offset += int(np.prod(shape))
+    return levels
+
+def write_mip_cache(cache_path:str, levels:list[np.ndarray]) -> None:
+    """
+        Store the levels as: header, then each level's pixels.
+        Written to a temporary file first so a crash never leaves
+        a half written cache behind.
+    """
+
+    header = np.zeros(1,dtype=MIP_CACHE_HEADER)
+    header["magic"] = MIP_CACHE_MAGIC
+    header["version"] = MIP_VERSION
+    header["height"],header["width"] = levels[0].shape[:2]
+    header["levels"] = len(levels)
+
+    os.makedirs(os.path.dirname(cache_path),exist_ok=True)
+    temp_path = cache_path + ".tmp"
+    with open(temp_path,'wb') as f:
+        header.tofile(f)
+        for level in levels:
+            np.ascontiguousarray(level).tofile(f)
+    os.replace(temp_path,cache_path)
 
 class Material:
 
     
-    def __init__(self, filepath):
+    def __init__(self, filepath, data = None, mip_cache = True):
+        """
+            Load the image into a mipmapped texture.
+            Uses immutable storage (glTexStorage2D) when the driver
+            has it, and the pre-baked mip levels from load_image_data
+            instead of glGenerateMipmap when mip_cache is on.
+            Parameters:
+                filepath: path to the image
+                data: (width, height, levels) already returned by
+                      load_image_data, eg. on a loader thread,
+                      then only the upload happens here.
+                mip_cache: see load_image_data
+        """
+
+        if data is None:
+            data = load_image_data(filepath,mip_cache)
+        image_width,image_height,levels = data
+        level_count = mip_level_count(image_width,image_height)
+
         self.texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, self.texture)
+        gl_state.bind_texture(self.texture)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST_MIPMAP_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        with Image.open(filepath, mode = "r") as image:
-            image_width,image_height = image.size
-            image = image.convert("RGBA")
-            img_data = bytes(image.tobytes())
-            glTexImage2D(GL_TEXTURE_2D,0,GL_RGBA,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-        glGenerateMipmap(GL_TEXTURE_2D)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+
+        #the arrays are handed to GL as they are, no bytes() copies
+        if bool(glTexStorage2D):
+            glTexStorage2D(GL_TEXTURE_2D,level_count,GL_RGBA8,image_width,image_height)
+            for level,pixels in enumerate(levels):
+                level_height,level_width = pixels.shape[:2]
+                glTexSubImage2D(GL_TEXTURE_2D,level,0,0,level_width,level_height,
+                                GL_RGBA,GL_UNSIGNED_BYTE,np.ascontiguousarray(pixels))
+        else:
+            for level,pixels in enumerate(levels):
+                level_height,level_width = pixels.shape[:2]
+                glTexImage2D(GL_TEXTURE_2D,level,GL_RGBA8,level_width,level_height,0,
+                             GL_RGBA,GL_UNSIGNED_BYTE,np.ascontiguousarray(pixels))
+        if len(levels) < level_count:
+            glGenerateMipmap(GL_TEXTURE_2D)
 
-    def use(self):
-        glActiveTexture(GL_TEXTURE0)
-        glBindTexture(GL_TEXTURE_2D,self.texture)
+    def use(self, unit = 0):
+        gl_state.bind_texture(self.texture,unit)
 
     def destroy(self):
+        gl_state.forget_texture(self.texture)
         glDeleteTextures(1, (self.texture,))
\ No newline at end of file
@@ -1,6 +1,85 @@
 from tools.Entities import Entity, Player
+from tools.Transforms import model_transform
+from tools.ECS import World
+from tools.Spatial import SpatialGrid
 import numpy as np
 
+class SceneNode:
+    """
+        A node of the transform hierarchy, world = local @ parent's world
+        (pyrr's row vector order), both cached. Changing a node marks it
+        dirty and its ancestors as having a dirty descendant, so
+        update_world only walks into and recomputes what changed:
+        untouched subtrees cost nothing per frame.
+    """
+
+    def __init__(self, entity:Entity = None, parent:"SceneNode" = None) -> None:
+        """
+            Parameters:
+                entity: the entity whose position and eulers make the
+                        local transform, None for a plain pivot (see set_local)
+                parent: node to attach to
+        """
+
+        self.entity = entity
+        self.parent: SceneNode = None
+        self.children: list[SceneNode] = []
+        self.local = np.identity(4,dtype=np.float32)
+        self.world = np.identity(4,dtype=np.float32)
+        #own transform changed / something below changed
+        self.dirty = True
+        self.dirty_below = False
+        if parent is not None:
+            parent.add_child(self)
+
+    def add_child(self, child:"SceneNode") -> None:
+        """ Attach child (taking it from its old parent) """
+
+        if child.parent is not None:
+            child.parent.children.remove(child)
+        child.parent = self
+        self.children.append(child)
+        child.mark_dirty()
+
+    def remove_child(self, child:"SceneNode") -> None:
+
+        self.children.remove(child)
+        child.parent = None
+        child.mark_dirty()
+
+    def set_local(self, transform:np.ndarray) -> None:
+        """ Set a pivot's local transform """
+
+        self.local[:] = transform
+        self.mark_dirty()
+
+    def mark_dirty(self) -> None:
+        """ Call when the node's local transform (its entity) has changed """
+
+        self.dirty = True
+        node = self.parent
+        while node is not None and not node.dirty_below:
+            node.dirty_below = True
+            node = node.parent
+
+    def update_world(self, parent_changed:bool = False) -> None:
+        """ Recompute the world transforms of the changed part of the subtree """
+
+        changed = self.dirty or parent_changed
+        if changed:
+            if self.entity is not None:
+                model_transform(self.entity.position,self.entity.eulers,self.local)
+            if self.parent is None:
+                self.world[:] = self.local
+            else:
+                np.matmul(self.local,self.parent.world,out=self.world)
+            self.dirty = False
+
+        if changed or self.dirty_below:
+            for child in self.children:
+                child.update_world(changed)
+        self.dirty_below = False
+
 class Scene:
     """ 
         Manages all logical objects in the game,
@@ -12,6 +91,151 @@ class Scene:
 
         self.renderables = renderables
         self.camera = camera
+        self.build_stores()
+
+    def build_stores(self) -> None:
+        """
+            Move the renderables into the scene's World (one archetype
+            per type and set of components), renderables[type] is then
+            the entities in archetype row order, and index them in the
+            scene's spatial grid.
+            Scenes that set renderables themselves call this after.
+        """
+
+        self.world = World()
+        #id(entity): entity, for those with an update of their own
+        self.scripted: dict[int,Entity] = {}
+        for objectType,objectList in self.renderables.items():
+            for entity in objectList:
+                self.world.add(entity)
+                self.add_script(entity)
+            self.refresh_renderables(objectType)
+
+        #hierarchy of attached entities, see attach
+        self.root = SceneNode()
+        #id(entity): its node
+        self.nodes: dict[int,SceneNode] = {}
+
+        #where every renderable is, for the renderer, culling and
+        #gameplay to share, kept up to date by update
+        self.spatial = SpatialGrid()
+        for objectList in self.renderables.values():
+            for entity in objectList:
+                self.spatial.insert(entity)
+
+    def attach(self, entity:Entity, parent = None) -> SceneNode:
+        """
+            Put an entity in the transform hierarchy under parent (an
+            attached Entity, or a SceneNode), or the root if None.
+            It then moves with its parent: its position and eulers
+            are relative to the parent's world transform.
+        """
+
+        if parent is None:
+            parent = self.root
+        elif not isinstance(parent,SceneNode):
+            parent = self.nodes[id(parent)]
+
+        node = self.nodes.get(id(entity))
+        if node is None:
+            node = SceneNode(entity)
+            self.nodes[id(entity)] = node
+        parent.add_child(node)
+        return node
+
+    def detach(self, entity:Entity) -> None:
+        """ Take an entity out of the hierarchy, its children go to the root """
+
+        node = self.nodes.pop(id(entity))
+        for child in list(node.children):
+            self.root.add_child(child)
+        node.parent.remove_child(node)
+        #its row of the transforms held the world transform
+        entity.moved()
+
+    def refresh_renderables(self, objectType:int) -> None:
+        """ Rebuild renderables[objectType] after its archetypes changed """
+
+        archetypes = self.world.query(objectType=objectType)
+        if len(archetypes) == 1:
+            #the archetype's own list stays current by itself
+            self.renderables[objectType] = archetypes[0].entities
+        else:
+            self.renderables[objectType] = [
+                entity for archetype in archetypes for entity in archetype.entities
+            ]
+
+    def add_script(self, entity:Entity) -> None:
+
+        if not entity.static and type(entity).update is not Entity.update:
+            self.scripted[id(entity)] = entity
+
+    def add_entity(self, entity:Entity) -> None:
+
+        self.world.add(entity)
+        self.add_script(entity)
+        self.refresh_renderables(entity.objectType)
+        self.spatial.insert(entity,self.world_position(entity))
+
+    def remove_entity(self, entity:Entity) -> None:
+        """ Remove a renderable, the last one of its archetype takes its place """
+
+        if id(entity) in self.nodes:
+            self.detach(entity)
+        self.spatial.remove(entity)
+        self.scripted.pop(id(entity),None)
+        self.world.remove(entity)
+        self.refresh_renderables(entity.objectType)
+
+    def add_component(self, entity:Entity, name:str, value = 0) -> None:
+        """ Give an entity a component (so the systems using it), see World """
+
+        self.world.add_component(entity,name,value)
+        self.refresh_renderables(entity.objectType)
+
+    def remove_component(self, entity:Entity, name:str) -> None:
+
+        self.world.remove_component(entity,name)
+        self.refresh_renderables(entity.objectType)
+
+    def world_position(self, entity:Entity) -> np.ndarray:
+        """ The entity's position, after its parents' transforms if attached """
+
+        node = self.nodes.get(id(entity))
+        if node is not None and node.parent is not self.root:
+            return node.world[3,0:3]
+        return entity.position
+
+    def model_transforms(self) -> dict[int,np.ndarray]:
+        """
+            Model transforms of every renderable, one (count, 4, 4)
+            array per type in the order of renderables[type].
+            The arrays are reused, they hold until the next call.
+        """
+
+        transforms = {}
+        #id(archetype): its first row in transforms[type]
+        offsets = {}
+        for objectType in self.renderables:
+            archetypes = self.world.query(objectType=objectType)
+            if len(archetypes) == 1:
+                transforms[objectType] = archetypes[0].model_transforms()
+                offsets[id(archetypes[0])] = 0
+                continue
+            offset = 0
+            for archetype in archetypes:
+                offsets[id(archetype)] = offset
+                offset += archetype.count
+            transforms[objectType] = np.concatenate(
+                [np.zeros((0,4,4),dtype=np.float32)]
+                + [archetype.model_transforms() for archetype in archetypes]
+            )
+        #attached entities move with their parents
+        for node in self.nodes.values():
+            if node.parent is not self.root:
+                entity = node.entity
+                transforms[entity.objectType][offsets[id(entity.store)] + entity.index] = node.world
+        return transforms
 
     def update(self,rate : float) -> None:
         """
@@ -21,9 +245,31 @@ class Scene:
                 rate: framerate correction factor     
         """
 
-        for _,objectlist in self.renderables.items():
-            for object in objectlist:
-                object.update(rate)
+        #whole columns at once, then what systems can't do
+        written = self.world.run_systems(rate)
+        for object in self.scripted.values():
+            object.update(rate)
+
+        #id(archetype) of those whose transforms changed
+        turned = {
+            id(archetype) for archetype,components in written
+            if "position" in components or "eulers" in components
+        }
+        for node in self.nodes.values():
+            entity = node.entity
+            if id(entity.store) in turned or id(entity) in self.scripted:
+                node.mark_dirty()
+        self.root.update_world()
+
+        #re-index what may have changed position: scripted entities
+        #(which may move in place), rows marked by the setters, moved()
+        #and systems, and attached entities, which move with their parents
+        moved = list(self.scripted.values())
+        for archetype in self.world.archetypes.values():
+            moved += archetype.take_relocated()
+        moved += [node.entity for node in self.nodes.values() if node.parent is not self.root]
+        for object in moved:
+            self.spatial.update(object,self.world_position(object))
         
         self.camera.update()
 
@@ -1,97 +1,746 @@
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileProgram,compileShader
+from OpenGL.GL.KHR.parallel_shader_compile import (
+    glInitParallelShaderCompileKHR,glMaxShaderCompilerThreadsKHR,GL_COMPLETION_STATUS_KHR
+)
+from tools.GLState import gl_state
+import numpy as np
+import hashlib
+import os
+from collections import OrderedDict
 
 """
     basic shader management"""
 
+#std140 layout of the CameraBlock uniform block, which the
+#shaders declare as
+#   layout (std140) uniform CameraBlock {
+#       mat4 view; mat4 projection; vec3 cameraPosition;
+#   };
+#matrices are stored as pyrr makes them, same as uploading
+#them with glUniformMatrix4fv(..., GL_FALSE, ...)
+CAMERA_BLOCK = np.dtype([
+    ("view","<f4",(4,4)),
+    ("projection","<f4",(4,4)),
+    ("cameraPosition","<f4",3),
+    ("padding","<f4"),
+])
+#binding point every program's CameraBlock is attached to
+CAMERA_BLOCK_BINDING = 0
+
+#where #include "name" looks after the including file's folder
+SHADER_INCLUDE_DIRS = [os.path.join(os.path.dirname(os.path.abspath(__file__)),"shaders")]
+
+#linked program binaries, kept next to the first stage's source
+SHADER_CACHE_DIR = ".shadercache"
+SHADER_CACHE_MAGIC = b"PGMB"
+SHADER_CACHE_VERSION = 1
+#magic, cache version, driver binary format, binary length
+SHADER_CACHE_HEADER = np.dtype([
+    ("magic","S4"),
+    ("version","<u4"),
+    ("format","<u4"),
+    ("length","<u4"),
+])
+
 class Shader():
     """
         Compile and use Shader
     """
 
-    def __init__(self, *args ,type = 'G'):
+    def __init__(self, *args ,type = 'G', cache = True, wait = True, defines = None):
+        """
+            Parameters:
+                args: paths to the stage sources, vertex, fragment
+                      and/or compute depending on type
+                type: 'G' vertex + fragment, 'C' compute, 'GC' all three
+                cache: reuse the linked program binary from the last run
+                       (see buildProgram) instead of compiling
+                wait: block until the program is linked. Otherwise the
+                      compile only starts here, poll ready() and draw
+                      with another program until it is True. Using
+                      the shader before then waits for it.
+                defines: {name: value} (or names) to #define in every
+                         stage, see load_source
+        """
 
+        self.cache = cache
+        self.defines = defines
+        #per stage, the file of each #line source string number
+        self.sources: list[list[str]] = []
+        #shader objects of a link still in progress
+        self.pending = None
+        self.pending_cache_path = None
+        #uniforms to set once that link is done, see setUniformsOnLink
+        self.link_uniforms = {}
         if (type == 'G'):
             self.createVFShader(*args)
         elif (type == 'C'):
             self.createCShader(*args)
         elif (type == 'GC'):
             self.createCVFShader(*args)
-        self.unifNames = {None:None}
+        if self.pending is None:
+            self.linked()
+        elif wait:
+            self.finish()
 
     def createVFShader(self,*args):
         
         vertexPath = args[0]
         fragmentPath = args[1]
 
-        with open(vertexPath,'r') as f:
-            vertex_src = f.readlines()
+        vertex_src = self.loadStage(vertexPath)
 
-        with open(fragmentPath,'r') as f:
-            fragment_src = f.readlines()
+        fragment_src = self.loadStage(fragmentPath)
         
-        self.shader = compileProgram(compileShader(vertex_src,GL_VERTEX_SHADER),
-                                     compileShader(fragment_src,GL_FRAGMENT_SHADER))
+        self.shader = self.buildProgram(vertexPath,
+                                        (vertex_src,GL_VERTEX_SHADER),
+                                        (fragment_src,GL_FRAGMENT_SHADER))
         
     def createCShader(self,*args):
         computePath = args[0]
 
-        with open(computePath,'r') as f:
-            compute_src = f.readlines()
-        self.shader = compileProgram(compileShader(compute_src,GL_COMPUTE_SHADER))
+        compute_src = self.loadStage(computePath)
+        self.shader = self.buildProgram(computePath,(compute_src,GL_COMPUTE_SHADER))
 
     def createCVFShader(self,*args):
         vertexPath = args[0]
         fragmentPath = args[1]
         computePath = args[2]
 
-        with open(vertexPath,'r') as f:
-            vertex_src = f.readlines()
+        vertex_src = self.loadStage(vertexPath)
+
+        fragment_src = self.loadStage(fragmentPath)
+
+        compute_src = self.loadStage(computePath)
+
+        self.shader = self.buildProgram(vertexPath,
+                                        (vertex_src,GL_VERTEX_SHADER),
+                                        (fragment_src,GL_FRAGMENT_SHADER),
+                                        (compute_src,GL_COMPUTE_SHADER))
+
+    def loadStage(self, path:str) -> list[str]:
+        """ A stage's source, see load_source. Its source strings go in self.sources """
+
+        sources = []
+        self.sources.append(sources)
+        return load_source(path,self.defines,sources)
+
+    def buildProgram(self, path:str, *stages):
+        """
+            Link (source, stage type) stages into a program. With the
+            cache on, a binary saved by an earlier run is loaded instead
+            when the sources and driver are the same and the driver
+            still accepts it; otherwise the program is compiled and its
+            binary saved.
+        """
+
+        cache_path = None
+        if self.cache and program_binaries_supported():
+            cache_path = program_cache_path(path,stages)
+            program = read_program_cache(cache_path)
+            if program is not None:
+                return program
+
+        #finished (and the binary saved) by finish()
+        program,self.pending = start_link(stages,retrievable = cache_path is not None)
+        self.pending_cache_path = cache_path
+        return program
+
+    def ready(self) -> bool:
+        """
+            Whether the program has finished linking, never blocks
+            where the driver compiles in parallel (GL_KHR_parallel_shader_compile).
+            Without it, the first call waits for the link.
+        """
+
+        if self.pending is None:
+            return True
+        if parallel_compile_supported() and \
+                not glGetProgramiv(self.shader,GL_COMPLETION_STATUS_KHR):
+            return False
+        self.finish()
+        return True
+
+    def readyOr(self, fallback):
+        """ This shader once it is ready(), fallback (eg. a plainer program) until then """
+
+        return self if self.ready() else fallback
+
+    def finish(self) -> None:
+        """ Wait for the link, raising RuntimeError with the log if it failed """
 
-        with open(fragmentPath,'r') as f:
-            fragment_src = f.readlines()
+        if self.pending is None:
+            return
+        shaders,self.pending = self.pending,None
+        finish_link(self.shader,shaders,self.sources)
+        if self.pending_cache_path is not None:
+            write_program_cache(self.pending_cache_path,self.shader)
+        self.linked()
 
-        with open(computePath,'r') as f:
-            compute_src = f.readlines()
+    def linked(self) -> None:
+        """ Set up what needs the linked program """
 
-        self.shader = compileProgram(compileShader(vertex_src,GL_VERTEX_SHADER),
-                                     compileShader(fragment_src,GL_FRAGMENT_SHADER),
-                                     compileShader(compute_src,GL_COMPUTE_SHADER))
+        self.reflectUniforms()
+        self.bindUniformBlock("CameraBlock",CAMERA_BLOCK_BINDING)
+        if self.link_uniforms:
+            self.setUniforms(self.link_uniforms)
+            self.link_uniforms = {}
 
     def use(self) -> None:
-        glUseProgram(self.shader)
+        if self.pending is not None:
+            self.finish()
+        gl_state.use_program(self.shader)
 
-    def setBool(self, name:str, value:bool) -> None:
+    def reflectUniforms(self) -> None:
+        """
+            Table every active uniform after linking:
+            uniforms[name] = (location, GL type, array size).
+            Arrays are reachable as both name and name[0], uniforms
+            in blocks have no location and are left out.
+        """
+
+        self.uniforms: dict[str,tuple[int,int,int]] = {}
+        for index in range(glGetProgramiv(self.shader,GL_ACTIVE_UNIFORMS)):
+            name,size,uniform_type = glGetActiveUniform(self.shader,index)
+            name = name.decode() if isinstance(name,bytes) else name
+            location = glGetUniformLocation(self.shader,name)
+            if location < 0:
+                continue
+            uniform = (location,int(uniform_type),int(size))
+            self.uniforms[name] = uniform
+            if name.endswith("[0]"):
+                self.uniforms[name[:-3]] = uniform
+
+    def findUniform(self, name:str) -> tuple[int,int,int]:
+        """ (location, GL type, array size) of an active uniform, or None """
+
+        if self.pending is not None:
+            self.finish()
+        return self.uniforms.get(name)
+
+    def setUniform(self, name:str, value) -> None:
+        """ Set any uniform, uploaded according to its reflected type """
+
+        uniform = self.findUniform(name)
+        if uniform is None:
+            return
         self.use()
-        if not(name in self.unifNames.keys()):
-            self.unifNames[name] = glGetUniformLocation(self.shader,name)
-        glUniform1i(self.unifNames[name],value)
+        uniform_setter(name,uniform[1])(uniform[0],value)
+
+    def setUniforms(self, values:dict) -> None:
+        """ Set many uniforms ({name: value}) with one program bind """
 
-    def setInt(self, name:str, value:int) -> None:
         self.use()
-        if not(name in self.unifNames.keys()):
-            self.unifNames[name] = glGetUniformLocation(self.shader,name)
-        glUniform1i(self.unifNames[name], value)
+        for name,value in values.items():
+            uniform = self.uniforms.get(name)
+            if uniform is not None:
+                uniform_setter(name,uniform[1])(uniform[0],value)
+
+    def setUniformsOnLink(self, values:dict) -> None:
+        """ setUniforms without waiting, a pending program gets them once linked """
+
+        if self.pending is None:
+            self.setUniforms(values)
+        else:
+            self.link_uniforms.update(values)
+
+    #typed setters, uniforms the program doesn't use are ignored
+    def setBool(self, name:str, value:bool) -> None:
+        uniform = self.findUniform(name)
+        if uniform is not None:
+            self.use()
+            glUniform1i(uniform[0],value)
+
+    def setInt(self, name:str, value:int) -> None:
+        uniform = self.findUniform(name)
+        if uniform is not None:
+            self.use()
+            glUniform1i(uniform[0], value)
 
     def setFloat(self, name:str, value) -> None:
-        self.use()
-        if not(name in self.unifNames.keys()):
-            self.unifNames[name] = glGetUniformLocation(self.shader,name)
-        glUniform1f(self.unifNames[name], value)
+        uniform = self.findUniform(name)
+        if uniform is not None:
+            self.use()
+            glUniform1f(uniform[0], value)
     
     def setVec2f(self,name:str, value) -> None:
-        self.use()
-        if not(name in self.unifNames.keys()):
-            self.unifNames[name] = glGetUniformLocation(self.shader,name)
-        glUniform2f(self.unifNames[name], value[0], value[1])
+        uniform = self.findUniform(name)
+        if uniform is not None:
+            self.use()
+            glUniform2f(uniform[0], value[0], value[1])
+
+    def setVec3f(self,name:str, value) -> None:
+        uniform = self.findUniform(name)
+        if uniform is not None:
+            self.use()
+            glUniform3f(uniform[0], value[0], value[1], value[2])
 
     def setMat4fv(self, name:str, Matrix4fv) -> None:
-        self.use()
-        if not(name in self.unifNames.keys()):
-            self.unifNames[name] = glGetUniformLocation(self.shader,name)
-        glUniformMatrix4fv(self.unifNames[name],1,GL_FALSE,Matrix4fv)
+        uniform = self.findUniform(name)
+        if uniform is not None:
+            self.use()
+            glUniformMatrix4fv(uniform[0],1,GL_FALSE,Matrix4fv)
+
+    def bindUniformBlock(self, name:str, binding:int) -> bool:
+        """ Attach a uniform block to a binding point, False if the program has no such block """
+
+        index = glGetUniformBlockIndex(self.shader,name)
+        if index == GL_INVALID_INDEX:
+            return False
+        glUniformBlockBinding(self.shader,index,binding)
+        return True
 
     def deletePgm(self):
+        if self.pending is not None:
+            for shader in self.pending:
+                glDeleteShader(shader)
+            self.pending = None
+        gl_state.forget_program(self.shader)
         glDeleteProgram(self.shader)
 
-        
\ No newline at end of file
+        
+class ShaderVariants:
+    """
+        Specialised programs built from one set of sources by
+        #defines (eg. TEXTURED, LIT, INSTANCED), so the gpu runs no
+        branches for features a draw doesn't use. Each variant is
+        compiled on first use, and only the capacity most recently
+        used are kept: the least recently used is deleted to make room.
+        Variants taken with hold() are never deleted until dropped.
+    """
+
+    def __init__(self, *paths:str, type:str = 'G', capacity:int = 8, cache:bool = True) -> None:
+        """
+            Parameters:
+                paths, type, cache: as for Shader
+                capacity: most linked programs to keep at once
+        """
+
+        self.paths = paths
+        self.type = type
+        self.capacity = capacity
+        self.cache = cache
+        #define key: Shader, least recently used first
+        self.programs: OrderedDict[tuple,Shader] = OrderedDict()
+        #define key: number of hold() calls not dropped yet
+        self.holds: dict[tuple,int] = {}
+
+    def get(self, defines = None, wait:bool = True, uniforms:dict = None) -> Shader:
+        """
+            The variant for defines, made now if it isn't kept.
+            uniforms are set on a newly made variant once it links
+            (see Shader.setUniformsOnLink).
+            Don't hold on to it across calls, another get may delete it.
+        """
+
+        key = define_lines(defines)
+        shader = self.programs.get(key)
+        if shader is not None:
+            self.programs.move_to_end(key)
+            return shader
+
+        shader = Shader(*self.paths,type=self.type,cache=self.cache,wait=wait,defines=defines)
+        if uniforms:
+            shader.setUniformsOnLink(uniforms)
+        self.programs[key] = shader
+        self.evict()
+        return shader
+
+    def hold(self, defines = None, wait:bool = True) -> Shader:
+        """ The variant for defines, kept until drop()ped as often as held """
+
+        shader = self.get(defines,wait)
+        key = define_lines(defines)
+        self.holds[key] = self.holds.get(key,0) + 1
+        return shader
+
+    def drop(self, shader:Shader) -> int:
+        """ Give back one hold of the shader, returns the holds left on it """
+
+        key = define_lines(shader.defines)
+        left = self.holds[key] - 1
+        if left:
+            self.holds[key] = left
+        else:
+            del self.holds[key]
+            self.evict()
+        return left
+
+    def evict(self) -> None:
+        """
+            Delete the least recently used variants not held, down to
+            capacity. The most recently used one is always kept.
+        """
+
+        for key in list(self.programs)[:-1]:
+            if len(self.programs) <= self.capacity:
+                return
+            if key not in self.holds:
+                self.programs.pop(key).deletePgm()
+
+    def destroy(self) -> None:
+
+        for shader in self.programs.values():
+            shader.deletePgm()
+        self.programs.clear()
+        self.holds.clear()
+
+def load_source(path:str, defines = None, sources:list = None) -> list[str]:
+    """
+        Read a stage's source lines, with every #include "name"
+        replaced by that file (see find_include) and the defines
+        added after #version. #line directives give each file its
+        own source string number, so error messages point at the
+        right line of the right file: sources (when given) is filled
+        with the path of each number, the top level file is 0.
+        The directives count as GLSL before 4.20 does (#version 330),
+        where the line after #line N is line N + 1.
+    """
+
+    lines = expand_includes(path,(),[] if sources is None else sources)
+    if defines:
+        first = 1 if lines and lines[0].lstrip().startswith("#version") else 0
+        lines[first:first] = list(define_lines(defines)) + ["#line %d 0\n" % first]
+    return lines
+
+def define_lines(defines) -> tuple[str,...]:
+    """
+        #define lines for {name: value} or names, sorted so the same
+        defines always make the same source. A value of None or True
+        defines the name alone.
+    """
+
+    if not defines:
+        return ()
+    if not isinstance(defines,dict):
+        defines = dict.fromkeys(defines)
+    lines = []
+    for name,value in sorted(defines.items()):
+        if value is None or value is True:
+            lines.append("#define %s\n" % name)
+        else:
+            lines.append("#define %s %s\n" % (name,value))
+    return tuple(lines)
+
+def expand_includes(path:str, including:tuple, sources:list) -> list[str]:
+    """
+        The file's lines with its includes expanded. A file's source
+        string number is its index in sources, where it is added the
+        first time it is read.
+    """
+
+    path = os.path.abspath(path)
+    if path in including:
+        raise RuntimeError("Shader include cycle: %s" % " -> ".join(including + (path,)))
+    if path not in sources:
+        sources.append(path)
+    source_id = sources.index(path)
+
+    with open(path,'r') as f:
+        source = f.readlines()
+    #the top level file starts as string 0, #version must come first
+    lines = ["#line 0 %d\n" % source_id] if including else []
+    for number,line in enumerate(source,1):
+        if not line.endswith("\n"):
+            line += "\n"
+        if line.lstrip().startswith("#include"):
+            name = line.strip()[len("#include"):].strip().strip('"<>')
+            lines += expand_includes(find_include(name,os.path.dirname(path)),including + (path,),sources)
+            lines.append("#line %d %d\n" % (number,source_id))
+        else:
+            lines.append(line)
+    return lines
+
+def describe_sources(sources:list) -> str:
+    """ The source string number: path table of a stage, for error messages """
+
+    return "\n".join("    %d: %s" % (number,path) for number,path in enumerate(sources))
+
+def find_include(name:str, folder:str) -> str:
+    """ Path of an included file, next to the including one or in SHADER_INCLUDE_DIRS """
+
+    for directory in [folder] + SHADER_INCLUDE_DIRS:
+        path = os.path.join(directory,name)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError("Shader include not found: %s" % name)
+
+def vector_setter(function, dtype, components:int):
+    """ Upload a value, or an array of them, with a glUniform*v function """
+
+    def setter(location:int, value) -> None:
+        value = np.asarray(value,dtype=dtype)
+        function(location,max(1,value.size // components),value)
+    return setter
+
+def matrix_setter(function, components:int, dtype = np.float32):
+    """ Upload a pyrr matrix, or an array of them, as glUniformMatrix4fv(..., GL_FALSE, ...) would """
+
+    def setter(location:int, value) -> None:
+        value = np.asarray(value,dtype=dtype)
+        function(location,max(1,value.size // components),GL_FALSE,value)
+    return setter
+
+#GL uniform type: how setUniform uploads it
+UNIFORM_SETTERS = {
+    GL_FLOAT: vector_setter(glUniform1fv,np.float32,1),
+    GL_FLOAT_VEC2: vector_setter(glUniform2fv,np.float32,2),
+    GL_FLOAT_VEC3: vector_setter(glUniform3fv,np.float32,3),
+    GL_FLOAT_VEC4: vector_setter(glUniform4fv,np.float32,4),
+    GL_DOUBLE: vector_setter(glUniform1dv,np.float64,1),
+    GL_DOUBLE_VEC2: vector_setter(glUniform2dv,np.float64,2),
+    GL_DOUBLE_VEC3: vector_setter(glUniform3dv,np.float64,3),
+    GL_DOUBLE_VEC4: vector_setter(glUniform4dv,np.float64,4),
+    GL_INT: vector_setter(glUniform1iv,np.int32,1),
+    GL_INT_VEC2: vector_setter(glUniform2iv,np.int32,2),
+    GL_INT_VEC3: vector_setter(glUniform3iv,np.int32,3),
+    GL_INT_VEC4: vector_setter(glUniform4iv,np.int32,4),
+    GL_UNSIGNED_INT: vector_setter(glUniform1uiv,np.uint32,1),
+    GL_UNSIGNED_INT_VEC2: vector_setter(glUniform2uiv,np.uint32,2),
+    GL_UNSIGNED_INT_VEC3: vector_setter(glUniform3uiv,np.uint32,3),
+    GL_UNSIGNED_INT_VEC4: vector_setter(glUniform4uiv,np.uint32,4),
+    GL_BOOL: vector_setter(glUniform1iv,np.int32,1),
+    GL_BOOL_VEC2: vector_setter(glUniform2iv,np.int32,2),
+    GL_BOOL_VEC3: vector_setter(glUniform3iv,np.int32,3),
+    GL_BOOL_VEC4: vector_setter(glUniform4iv,np.int32,4),
+    GL_FLOAT_MAT2: matrix_setter(glUniformMatrix2fv,4),
+    GL_FLOAT_MAT3: matrix_setter(glUniformMatrix3fv,9),
+    GL_FLOAT_MAT4: matrix_setter(glUniformMatrix4fv,16),
+    GL_FLOAT_MAT2x3: matrix_setter(glUniformMatrix2x3fv,6),
+    GL_FLOAT_MAT2x4: matrix_setter(glUniformMatrix2x4fv,8),
+    GL_FLOAT_MAT3x2: matrix_setter(glUniformMatrix3x2fv,6),
+    GL_FLOAT_MAT3x4: matrix_setter(glUniformMatrix3x4fv,12),
+    GL_FLOAT_MAT4x2: matrix_setter(glUniformMatrix4x2fv,8),
+    GL_FLOAT_MAT4x3: matrix_setter(glUniformMatrix4x3fv,12),
+    GL_DOUBLE_MAT2: matrix_setter(glUniformMatrix2dv,4,np.float64),
+    GL_DOUBLE_MAT3: matrix_setter(glUniformMatrix3dv,9,np.float64),
+    GL_DOUBLE_MAT4: matrix_setter(glUniformMatrix4dv,16,np.float64),
+    GL_DOUBLE_MAT2x3: matrix_setter(glUniformMatrix2x3dv,6,np.float64),
+    GL_DOUBLE_MAT2x4: matrix_setter(glUniformMatrix2x4dv,8,np.float64),
+    GL_DOUBLE_MAT3x2: matrix_setter(glUniformMatrix3x2dv,6,np.float64),
+    GL_DOUBLE_MAT3x4: matrix_setter(glUniformMatrix3x4dv,12,np.float64),
+    GL_DOUBLE_MAT4x2: matrix_setter(glUniformMatrix4x2dv,8,np.float64),
+    GL_DOUBLE_MAT4x3: matrix_setter(glUniformMatrix4x3dv,12,np.float64),
+}
+#samplers and images of every kind are set to a texture/image unit
+OPAQUE_UNIFORM_TYPES = (
+    GL_SAMPLER_1D,GL_SAMPLER_2D,GL_SAMPLER_3D,GL_SAMPLER_CUBE,
+    GL_SAMPLER_1D_SHADOW,GL_SAMPLER_2D_SHADOW,GL_SAMPLER_CUBE_SHADOW,
+    GL_SAMPLER_1D_ARRAY,GL_SAMPLER_2D_ARRAY,GL_SAMPLER_CUBE_MAP_ARRAY,
+    GL_SAMPLER_1D_ARRAY_SHADOW,GL_SAMPLER_2D_ARRAY_SHADOW,GL_SAMPLER_CUBE_MAP_ARRAY_SHADOW,
+    GL_SAMPLER_2D_MULTISAMPLE,GL_SAMPLER_2D_MULTISAMPLE_ARRAY,
+    GL_SAMPLER_2D_RECT,GL_SAMPLER_2D_RECT_SHADOW,GL_SAMPLER_BUFFER,
+    GL_INT_SAMPLER_1D,GL_INT_SAMPLER_2D,GL_INT_SAMPLER_3D,GL_INT_SAMPLER_CUBE,
+    GL_INT_SAMPLER_1D_ARRAY,GL_INT_SAMPLER_2D_ARRAY,GL_INT_SAMPLER_CUBE_MAP_ARRAY,
+    GL_INT_SAMPLER_2D_MULTISAMPLE,GL_INT_SAMPLER_2D_MULTISAMPLE_ARRAY,
+    GL_INT_SAMPLER_2D_RECT,GL_INT_SAMPLER_BUFFER,
+    GL_UNSIGNED_INT_SAMPLER_1D,GL_UNSIGNED_INT_SAMPLER_2D,GL_UNSIGNED_INT_SAMPLER_3D,
+    GL_UNSIGNED_INT_SAMPLER_CUBE,GL_UNSIGNED_INT_SAMPLER_1D_ARRAY,
+    GL_UNSIGNED_INT_SAMPLER_2D_ARRAY,GL_UNSIGNED_INT_SAMPLER_CUBE_MAP_ARRAY,
+    GL_UNSIGNED_INT_SAMPLER_2D_MULTISAMPLE,GL_UNSIGNED_INT_SAMPLER_2D_MULTISAMPLE_ARRAY,
+    GL_UNSIGNED_INT_SAMPLER_2D_RECT,GL_UNSIGNED_INT_SAMPLER_BUFFER,
+    GL_IMAGE_1D,GL_IMAGE_2D,GL_IMAGE_3D,GL_IMAGE_2D_RECT,GL_IMAGE_CUBE,GL_IMAGE_BUFFER,
+    GL_IMAGE_1D_ARRAY,GL_IMAGE_2D_ARRAY,GL_IMAGE_CUBE_MAP_ARRAY,
+    GL_IMAGE_2D_MULTISAMPLE,GL_IMAGE_2D_MULTISAMPLE_ARRAY,
+    GL_INT_IMAGE_1D,GL_INT_IMAGE_2D,GL_INT_IMAGE_3D,GL_INT_IMAGE_2D_RECT,
+    GL_INT_IMAGE_CUBE,GL_INT_IMAGE_BUFFER,GL_INT_IMAGE_1D_ARRAY,GL_INT_IMAGE_2D_ARRAY,
+    GL_INT_IMAGE_CUBE_MAP_ARRAY,GL_INT_IMAGE_2D_MULTISAMPLE,GL_INT_IMAGE_2D_MULTISAMPLE_ARRAY,
+    GL_UNSIGNED_INT_IMAGE_1D,GL_UNSIGNED_INT_IMAGE_2D,GL_UNSIGNED_INT_IMAGE_3D,
+    GL_UNSIGNED_INT_IMAGE_2D_RECT,GL_UNSIGNED_INT_IMAGE_CUBE,GL_UNSIGNED_INT_IMAGE_BUFFER,
+    GL_UNSIGNED_INT_IMAGE_1D_ARRAY,GL_UNSIGNED_INT_IMAGE_2D_ARRAY,
+    GL_UNSIGNED_INT_IMAGE_CUBE_MAP_ARRAY,GL_UNSIGNED_INT_IMAGE_2D_MULTISAMPLE,
+    GL_UNSIGNED_INT_IMAGE_2D_MULTISAMPLE_ARRAY,
+)
+for opaque_type in OPAQUE_UNIFORM_TYPES:
+    UNIFORM_SETTERS[int(opaque_type)] = UNIFORM_SETTERS[GL_INT]
+
+def uniform_setter(name:str, uniform_type:int):
+    """ The UNIFORM_SETTERS entry for a uniform, ValueError if there is none """
+
+    setter = UNIFORM_SETTERS.get(uniform_type)
+    if setter is None:
+        raise ValueError(f"uniform {name} has GL type {uniform_type:#06x}, "
+                         f"which setUniform can't upload")
+    return setter
+
+class UniformBuffer:
+    """
+        A buffer backing a std140 uniform block, attached to a binding
+        point so every program bound to that point reads it.
+        Fill data (a one element array of the block's dtype), then upload.
+    """
+
+    def __init__(self, layout:np.dtype, binding:int) -> None:
+
+        self.data = np.zeros(1,dtype=layout)
+        self.binding = binding
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, binding, self.ubo)
+
+    def upload(self) -> None:
+        """ Send the whole block in one call """
+
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.data.nbytes, self.data)
+
+    def destroy(self) -> None:
+        glDeleteBuffers(1,(self.ubo,))
+
+class CameraBlock(UniformBuffer):
+    """ Per frame camera data shared by every program (see CAMERA_BLOCK) """
+
+    def __init__(self) -> None:
+
+        super().__init__(CAMERA_BLOCK,CAMERA_BLOCK_BINDING)
+
+    def update(self, view, projection, position) -> None:
+        """ Write and upload the block, once per frame """
+
+        self.data["view"] = view
+        self.data["projection"] = projection
+        self.data["cameraPosition"] = position
+        self.upload()
+
+def program_binaries_supported() -> bool:
+    """ Whether the driver can save and load linked programs """
+
+    return bool(glGetProgramBinary) and glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+
+#None until the first program is made in the context
+PARALLEL_COMPILE = None
+
+def parallel_compile_supported() -> bool:
+    """
+        Whether the driver compiles and links in the background and
+        reports GL_COMPLETION_STATUS_KHR. The first call lets it
+        use as many compiler threads as it likes.
+    """
+
+    global PARALLEL_COMPILE
+    if PARALLEL_COMPILE is None:
+        PARALLEL_COMPILE = bool(glInitParallelShaderCompileKHR())
+        if PARALLEL_COMPILE:
+            glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)
+    return PARALLEL_COMPILE
+
+def start_link(stages, retrievable:bool = False):
+    """
+        Start compiling and linking (source, stage type) stages,
+        without asking for any status so the driver need not block.
+        retrievable asks the driver to keep the binary for glGetProgramBinary.
+        Returns the program and its shader objects, for finish_link.
+    """
+
+    parallel_compile_supported()
+    shaders = []
+    for source,stage in stages:
+        shader = glCreateShader(stage)
+        glShaderSource(shader,source)
+        glCompileShader(shader)
+        shaders.append(shader)
+
+    program = glCreateProgram()
+    for shader in shaders:
+        glAttachShader(program,shader)
+    if retrievable:
+        glProgramParameteri(program,GL_PROGRAM_BINARY_RETRIEVABLE_HINT,GL_TRUE)
+    glLinkProgram(program)
+    return program,shaders
+
+def finish_link(program, shaders, sources = ()) -> None:
+    """
+        Wait for a start_link, then free its shader objects.
+        Raises RuntimeError with the compile or link log on failure,
+        the program is deleted then. sources holds each shader's
+        source string paths (see load_source), a compile log is
+        followed by the paths its numbers stand for.
+    """
+
+    error = None
+    for index,shader in enumerate(shaders):
+        if error is None and glGetShaderiv(shader,GL_COMPILE_STATUS) != GL_TRUE:
+            error = "Shader compile failure: %s" % glGetShaderInfoLog(shader)
+            if index < len(sources):
+                error += "\nsource strings:\n" + describe_sources(sources[index])
+    if error is None and glGetProgramiv(program,GL_LINK_STATUS) != GL_TRUE:
+        error = "Link failure: %s" % glGetProgramInfoLog(program)
+
+    for shader in shaders:
+        glDetachShader(program,shader)
+        glDeleteShader(shader)
+    if error is not None:
+        glDeleteProgram(program)
+        raise RuntimeError(error)
+
+def program_cache_path(path:str, stages) -> str:
+    """
+        Cache file for a program, named by a hash of every stage's
+        type and source and the driver's vendor, renderer and version,
+        so editing a shader or updating the driver misses the cache.
+    """
+
+    key = hashlib.sha1()
+    key.update(str(SHADER_CACHE_VERSION).encode())
+    for name in (GL_VENDOR,GL_RENDERER,GL_VERSION):
+        key.update(glGetString(name) or b"")
+    for source,stage in stages:
+        key.update(str(int(stage)).encode())
+        key.update("".join(source).encode())
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)),SHADER_CACHE_DIR)
+    return os.path.join(folder,key.hexdigest() + ".bin")
+
+def read_program_cache(cache_path:str):
+    """
+        Make a program from a binary written by write_program_cache.
+        Returns None when the file is missing or the driver rejects it.
+    """
+
+    if not os.path.exists(cache_path):
+        return None
+
+    with open(cache_path,'rb') as f:
+        header = np.fromfile(f,dtype=SHADER_CACHE_HEADER,count=1)
+        if len(header) == 0:
+            return None
+        header = header[0]
+        if header["magic"] != SHADER_CACHE_MAGIC or header["version"] != SHADER_CACHE_VERSION:
+            return None
+        binary = np.fromfile(f,dtype=np.uint8,count=int(header["length"]))
+    if len(binary) != header["length"]:
+        return None
+
+    program = glCreateProgram()
+    glProgramBinary(program,int(header["format"]),binary,len(binary))
+    if glGetProgramiv(program,GL_LINK_STATUS) != GL_TRUE:
+        glDeleteProgram(program)
+        return None
+    return program
+
+def write_program_cache(cache_path:str, program) -> None:
+    """
+        Save a linked program's binary. Written to a temporary file
+        first so a crash never leaves a half written cache behind.
+    """
+
+    size = glGetProgramiv(program,GL_PROGRAM_BINARY_LENGTH)
+    if size <= 0:
+        return
+    length = np.zeros(1,dtype=np.int32)
+    binary_format = np.zeros(1,dtype=np.uint32)
+    binary = np.empty(size,dtype=np.uint8)
+    glGetProgramBinary(program,size,length,binary_format,binary)
+
+    header = np.zeros(1,dtype=SHADER_CACHE_HEADER)
+    header["magic"] = SHADER_CACHE_MAGIC
+    header["version"] = SHADER_CACHE_VERSION
+    header["format"] = binary_format[0]
+    header["length"] = length[0]
+
+    os.makedirs(os.path.dirname(cache_path),exist_ok=True)
+    temp_path = cache_path + ".tmp"
+    with open(temp_path,'wb') as f:
+        header.tofile(f)
+        binary[:length[0]].tofile(f)
+    os.replace(temp_path,cache_path)
@@ -0,0 +1,213 @@
+import numpy as np
+from tools.Entities import Entity
+from tools.Culling import Frustum
+
+"""
+    Spatial index over entity positions, so questions like what is near
+    a point or inside the view only look at the nearby part of the scene.
+"""
+
+class SpatialGrid:
+    """
+        Uniform hash grid: each entity sits in the cell of its position,
+        only occupied cells are stored. Updating an entity costs nothing
+        unless it changed cell. Queries visit cells around the question
+        (or the occupied cells, whichever is fewer), not every entity.
+    """
+
+    def __init__(self, cell_size:float = 10.0) -> None:
+        """
+            Parameters:
+                cell_size: side of a cell, about the typical query
+                           radius works well
+        """
+
+        self.cell_size = cell_size
+        #cell: entities in it
+        self.cells: dict[tuple[int,int,int],set[Entity]] = {}
+        #id(entity): (cell, position it was indexed at)
+        self.entries: dict[int,tuple[tuple[int,int,int],np.ndarray]] = {}
+        #occupied cells as a list and an array, for whole grid
+        #queries, None when stale (see occupied_cells)
+        self.cell_keys: list[tuple[int,int,int]] = None
+        self.cell_array: np.ndarray = None
+        #lowest and highest occupied cell per axis
+        self.cell_bounds: tuple[np.ndarray,np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, entity:Entity) -> bool:
+        return id(entity) in self.entries
+
+    def cell_of(self, position) -> tuple[int,int,int]:
+
+        x,y,z = np.floor(np.asarray(position) / self.cell_size)
+        return (int(x),int(y),int(z))
+
+    def insert(self, entity:Entity, position = None) -> None:
+        """ Index an entity at position (its own position if None) """
+
+        position = np.array(entity.position if position is None else position,dtype=np.float32)
+        cell = self.cell_of(position)
+        if cell not in self.cells:
+            self.cells[cell] = set()
+            self.cell_keys = None
+        self.cells[cell].add(entity)
+        self.entries[id(entity)] = (cell,position)
+
+    def remove(self, entity:Entity) -> None:
+
+        cell,_ = self.entries.pop(id(entity))
+        members = self.cells[cell]
+        members.discard(entity)
+        if not members:
+            del self.cells[cell]
+            self.cell_keys = None
+
+    def update(self, entity:Entity, position = None) -> None:
+        """ Re-index an entity that moved, only changing cell costs anything """
+
+        position = entity.position if position is None else position
+        cell,indexed = self.entries[id(entity)]
+        if self.cell_of(position) == cell:
+            indexed[:] = position
+            return
+        self.remove(entity)
+        self.insert(entity,position)
+
+    def position(self, entity:Entity) -> np.ndarray:
+        """ Where the entity is indexed """
+
+        return self.entries[id(entity)][1]
+
+    def occupied_cells(self) -> list[tuple[int,int,int]]:
+        """ Occupied cell keys, rebuilding cell_array and cell_bounds if they changed """
+
+        if self.cell_keys is None:
+            self.cell_keys = list(self.cells)
+            self.cell_array = np.array(self.cell_keys,dtype=np.int64).reshape(-1,3)
+            self.cell_bounds = (self.cell_array.min(axis=0),self.cell_array.max(axis=0))
+        return self.cell_keys
+
+    def cells_in_box(self, low:tuple, high:tuple) -> list[tuple[int,int,int]]:
+        """ Occupied cells with low <= cell <= high (inclusive, per axis) """
+
+        volume = (high[0] - low[0] + 1)*(high[1] - low[1] + 1)*(high[2] - low[2] + 1)
+        if volume > len(self.cells):
+            self.occupied_cells()
+            inside = np.all((self.cell_array >= low) & (self.cell_array <= high),axis=1)
+            return [self.cell_keys[index] for index in np.flatnonzero(inside)]
+        cells = self.cells
+        return [
+            (x,y,z)
+            for x in range(low[0],high[0] + 1)
+            for y in range(low[1],high[1] + 1)
+            for z in range(low[2],high[2] + 1)
+            if (x,y,z) in cells
+        ]
+
+    def query_radius(self, center, radius:float) -> list[Entity]:
+        """ Entities within radius of center """
+
+        center = np.asarray(center,dtype=np.float32)
+        low = self.cell_of(center - radius)
+        high = self.cell_of(center + radius)
+        candidates = [entity for cell in self.cells_in_box(low,high) for entity in self.cells[cell]]
+        return self.within(candidates,center,radius)
+
+    def within(self, candidates:list[Entity], center:np.ndarray, radius:float) -> list[Entity]:
+
+        if not candidates:
+            return []
+        positions = np.array([self.entries[id(entity)][1] for entity in candidates])
+        inside = np.sum((positions - center)**2,axis=1) <= radius*radius
+        return [entity for entity,keep in zip(candidates,inside) if keep]
+
+    def query_frustum(self, frustum:Frustum, radius:float = 0.0) -> list[Entity]:
+        """
+            Entities whose bounding sphere (radius around their position)
+            touches the frustum: the cells in the frustum's bounding box
+            are tested first, then the entities of the cells that pass.
+        """
+
+        if not self.cells:
+            return []
+        low = self.cell_of(frustum.corners.min(axis=0) - radius)
+        high = self.cell_of(frustum.corners.max(axis=0) + radius)
+        cells = self.cells_in_box(low,high)
+        if not cells:
+            return []
+
+        centers = (np.array(cells,dtype=np.float32) + 0.5) * self.cell_size
+        cell_radius = 0.5*np.sqrt(3)*self.cell_size + radius
+        visible = frustum.spheres_visible(centers,cell_radius)
+        candidates = [
+            entity
+            for index in np.flatnonzero(visible)
+            for entity in self.cells[cells[index]]
+        ]
+        if not candidates:
+            return []
+        positions = np.array([self.entries[id(entity)][1] for entity in candidates])
+        inside = frustum.spheres_visible(positions,radius)
+        return [entity for entity,keep in zip(candidates,inside) if keep]
+
+    def nearest(self, point, k:int = 1) -> list[Entity]:
+        """
+            The k entities closest to point, nearest first.
+            Searches outwards ring by ring of cells, stopping once no
+            unvisited cell can hold anything closer.
+        """
+
+        point = np.asarray(point,dtype=np.float32)
+        if not self.cells or k <= 0:
+            return []
+
+        center = self.cell_of(point)
+        self.occupied_cells()
+        #ring beyond which there are no occupied cells
+        low,high = self.cell_bounds
+        last_ring = int(max(np.max(np.subtract(center,low)),np.max(np.subtract(high,center))))
+
+        candidates = []
+        distances = np.zeros(0,dtype=np.float32)
+        for ring in range(last_ring + 1):
+            found = [entity for members in self.cells_in_ring(center,ring) for entity in members]
+            if found:
+                positions = np.array([self.entries[id(entity)][1] for entity in found])
+                candidates += found
+                distances = np.concatenate((distances,np.linalg.norm(positions - point,axis=1)))
+            #anything in ring + 1 or further is at least ring cells away
+            if len(candidates) >= k and np.partition(distances,k - 1)[k - 1] <= ring*self.cell_size:
+                break
+
+        order = np.argsort(distances,kind="stable")[:k]
+        return [candidates[i] for i in order]
+
+    def cells_in_ring(self, center:tuple, ring:int):
+        """ Occupied cells exactly ring cells away (Chebyshev distance) from center """
+
+        shell = (2*ring + 1)**3 - max(2*ring - 1,0)**3
+        if shell > len(self.cells):
+            for cell,members in self.cells.items():
+                if max(abs(cell[axis] - center[axis]) for axis in range(3)) == ring:
+                    yield members
+            return
+        for x in range(-ring,ring + 1):
+            for y in range(-ring,ring + 1):
+                #inside the shell only the two z faces are on the ring
+                if abs(x) == ring or abs(y) == ring:
+                    zs = range(-ring,ring + 1)
+                else:
+                    zs = (-ring,ring)
+                for z in zs:
+                    members = self.cells.get((center[0] + x,center[1] + y,center[2] + z))
+                    if members:
+                        yield members
+
+    def clear(self) -> None:
+
+        self.cells.clear()
+        self.entries.clear()
+        self.cell_keys = None
@@ -0,0 +1,178 @@
+import math
+import numpy as np
+
+"""
+    Closed form float32 model, view and projection transforms, laid out
+    like pyrr's (row vectors, translation in row 3) so they upload and
+    combine the same way. Every builder writes into a given out buffer
+    and makes no temporary arrays, so per frame calls leave no garbage.
+    The plural versions take (N, 3) inputs and write (N, ...) outputs.
+"""
+
+def model_transform(position, eulers, out:np.ndarray = None) -> np.ndarray:
+    """
+        Rotation about z by eulers[2] degrees, then translation to
+        position (pyrr's identity @ z rotation @ translation).
+        Written into out ((4, 4) float32) when given.
+    """
+
+    if out is None:
+        out = np.empty((4,4),dtype=np.float32)
+    theta = math.radians(eulers[2])
+    cosine = math.cos(theta)
+    sine = math.sin(theta)
+
+    out.fill(0)
+    out[0,0] = cosine
+    out[0,1] = -sine
+    out[1,0] = sine
+    out[1,1] = cosine
+    out[2,2] = 1
+    out[3,0:3] = position
+    out[3,3] = 1
+    return out
+
+def model_transforms(positions:np.ndarray, eulers:np.ndarray,
+                     out:np.ndarray = None) -> np.ndarray:
+    """
+        model_transform for each row of positions and eulers.
+        Written into out ((count, 4, 4) float32) when given.
+    """
+
+    count = len(positions)
+    if out is None:
+        out = np.empty((count,4,4),dtype=np.float32)
+    #the cosine and sine slots double as scratch space
+    cosine = out[:,0,0]
+    sine = out[:,1,0]
+
+    out.fill(0)
+    np.radians(eulers[:,2],out=cosine)
+    np.sin(cosine,out=sine)
+    np.cos(cosine,out=cosine)
+    np.negative(sine,out=out[:,0,1])
+    out[:,1,1] = cosine
+    out[:,2,2] = 1
+    out[:,3,0:3] = positions
+    out[:,3,3] = 1
+    return out
+
+def camera_vectors(eulers, forwards:np.ndarray, right:np.ndarray, up:np.ndarray) -> None:
+    """
+        Orthonormal camera basis for yaw eulers[2] and pitch eulers[1]
+        (degrees) with z up, as normalising forwards x z and
+        right x forwards would give. Written into the three (3,) arrays.
+    """
+
+    yaw = math.radians(eulers[2])
+    pitch = math.radians(eulers[1])
+    cos_yaw = math.cos(yaw)
+    sin_yaw = math.sin(yaw)
+    cos_pitch = math.cos(pitch)
+    sin_pitch = math.sin(pitch)
+
+    forwards[0] = cos_yaw*cos_pitch
+    forwards[1] = sin_yaw*cos_pitch
+    forwards[2] = sin_pitch
+    right[0] = sin_yaw
+    right[1] = -cos_yaw
+    right[2] = 0
+    up[0] = -cos_yaw*sin_pitch
+    up[1] = -sin_yaw*sin_pitch
+    up[2] = cos_pitch
+
+def camera_bases(eulers:np.ndarray, forwards:np.ndarray,
+                 right:np.ndarray, up:np.ndarray) -> None:
+    """ camera_vectors for each row of eulers, into (N, 3) arrays """
+
+    #right's z column is scratch until the end
+    scratch = right[:,2]
+    np.radians(eulers[:,2],out=scratch)
+    np.sin(scratch,out=right[:,0])
+    np.cos(scratch,out=forwards[:,0])
+    np.radians(eulers[:,1],out=scratch)
+    np.sin(scratch,out=forwards[:,2])
+    np.cos(scratch,out=up[:,2])
+    scratch.fill(0)
+    np.negative(forwards[:,0],out=right[:,1])
+
+    #forwards x holds cos yaw until last
+    np.multiply(right[:,0],up[:,2],out=forwards[:,1])
+    np.multiply(forwards[:,0],forwards[:,2],out=up[:,0])
+    np.negative(up[:,0],out=up[:,0])
+    np.multiply(right[:,0],forwards[:,2],out=up[:,1])
+    np.negative(up[:,1],out=up[:,1])
+    np.multiply(forwards[:,0],up[:,2],out=forwards[:,0])
+
+def view_transform(eye, forwards, right, up, out:np.ndarray = None) -> np.ndarray:
+    """
+        World to camera transform for a camera at eye with the given
+        orthonormal basis, pyrr.matrix44.create_look_at(eye,
+        eye + forwards, up). Written into out ((4, 4) float32) when given.
+    """
+
+    if out is None:
+        out = np.empty((4,4),dtype=np.float32)
+    x,y,z = float(eye[0]),float(eye[1]),float(eye[2])
+    for row in range(3):
+        out[row,0] = right[row]
+        out[row,1] = up[row]
+        out[row,2] = -forwards[row]
+        out[row,3] = 0
+    out[3,0] = -(right[0]*x + right[1]*y + right[2]*z)
+    out[3,1] = -(up[0]*x + up[1]*y + up[2]*z)
+    out[3,2] = forwards[0]*x + forwards[1]*y + forwards[2]*z
+    out[3,3] = 1
+    return out
+
+def view_transforms(eyes:np.ndarray, forwards:np.ndarray, right:np.ndarray,
+                    up:np.ndarray, out:np.ndarray = None) -> np.ndarray:
+    """ view_transform for each row, into out ((N, 4, 4) float32) when given """
+
+    if out is None:
+        out = np.empty((len(eyes),4,4),dtype=np.float32)
+    out[:,0:3,0] = right
+    out[:,0:3,1] = up
+    #a column at a time, 2d strided outs make ufuncs buffer
+    for axis in range(3):
+        np.negative(forwards[:,axis],out=out[:,axis,2])
+    out[:,0:3,3] = 0
+    #out[:,3,3] is scratch for the dot products until the end
+    dot_rows(right,eyes,out[:,3,0],out[:,3,3])
+    np.negative(out[:,3,0],out=out[:,3,0])
+    dot_rows(up,eyes,out[:,3,1],out[:,3,3])
+    np.negative(out[:,3,1],out=out[:,3,1])
+    dot_rows(forwards,eyes,out[:,3,2],out[:,3,3])
+    out[:,3,3] = 1
+    return out
+
+def dot_rows(a:np.ndarray, b:np.ndarray, out:np.ndarray, scratch:np.ndarray) -> np.ndarray:
+    """
+        Row by row dot products of (N, 3) arrays into out (N,), using
+        scratch (N,) instead of temporaries
+    """
+
+    np.multiply(a[:,0],b[:,0],out=out)
+    for axis in (1,2):
+        np.multiply(a[:,axis],b[:,axis],out=scratch)
+        np.add(out,scratch,out=out)
+    return out
+
+def perspective_projection(fovy:float, aspect:float, near:float, far:float,
+                           out:np.ndarray = None) -> np.ndarray:
+    """
+        pyrr.matrix44.create_perspective_projection: fovy in degrees,
+        aspect is width / height. Written into out ((4, 4) float32) when given.
+    """
+
+    if out is None:
+        out = np.empty((4,4),dtype=np.float32)
+    focal = 1/math.tan(math.radians(fovy)/2)
+
+    out.fill(0)
+    out[0,0] = focal/aspect
+    out[1,1] = focal
+    out[2,2] = -(far + near)/(far - near)
+    out[2,3] = -1
+    out[3,2] = -2*far*near/(far - near)
+    return out
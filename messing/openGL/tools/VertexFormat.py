@@ -0,0 +1,133 @@
+from OpenGL.GL import *
+import numpy as np
+
+"""
+    Compact vertex formats, as an opt in alternative to the
+    32 byte x, y, z, s, t, nx, ny, nz float layout:
+        "compact":   float32 position, half float texcoord,
+                     normal packed as GL_INT_2_10_10_10_REV (20 bytes)
+        "quantized": as compact, but the position is 3 normalized
+                     uint16 that the vertex shader decodes with the
+                     mesh's positionScale/positionOffset (16 bytes)
+"""
+
+VERTEX_FORMATS = {
+    "compact": np.dtype([
+        ("position","<f4",3),
+        ("texcoord","<f2",2),
+        ("normal","<u4"),
+    ]),
+    "quantized": np.dtype([
+        ("position","<u2",3),
+        ("padding","<u2"),
+        ("texcoord","<f2",2),
+        ("normal","<u4"),
+    ]),
+}
+
+def pack_vertices(vertices:np.ndarray,
+                  vertex_format:str) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """
+        Convert interleaved float vertices to one of VERTEX_FORMATS.
+        Returns the packed vertices as a flat uint8 array, and the
+        position scale and offset (ones and zeros unless quantized).
+    """
+
+    rows = np.asarray(vertices,dtype=np.float32).reshape(-1,8)
+    packed = np.zeros(len(rows),dtype=VERTEX_FORMATS[vertex_format])
+    scale = np.ones(3,dtype=np.float32)
+    offset = np.zeros(3,dtype=np.float32)
+
+    if vertex_format == "quantized":
+        offset = rows[:,0:3].min(axis=0)
+        scale = np.maximum(rows[:,0:3].max(axis=0) - offset,1e-12)
+        packed["position"] = np.round((rows[:,0:3] - offset) / scale * 65535)
+    else:
+        packed["position"] = rows[:,0:3]
+    packed["texcoord"] = rows[:,3:5]
+    packed["normal"] = pack_normals(rows[:,5:8])
+
+    return packed.view(np.uint8),scale,offset
+
+def pack_normals(normals:np.ndarray) -> np.ndarray:
+    """ Signed normalized 10 bit x, y, z in one uint32, w = 0 """
+
+    quantized = np.round(np.clip(normals,-1,1) * 511).astype(np.int64) & 0x3FF
+    return (quantized[:,0] | quantized[:,1] << 10 | quantized[:,2] << 20).astype(np.uint32)
+
+def unpack_vertices(packed:np.ndarray,
+                    vertex_format:str,
+                    scale:np.ndarray,
+                    offset:np.ndarray) -> np.ndarray:
+    """
+        Decode packed vertices back to (count, 8) floats, the way
+        the gpu reads them.
+    """
+
+    packed = packed.view(VERTEX_FORMATS[vertex_format])
+    rows = np.empty((len(packed),8),dtype=np.float32)
+
+    if vertex_format == "quantized":
+        rows[:,0:3] = offset + scale * (packed["position"] / 65535)
+    else:
+        rows[:,0:3] = packed["position"]
+    rows[:,3:5] = packed["texcoord"]
+
+    normals = packed["normal"].astype(np.int64)
+    for axis in range(3):
+        component = (normals >> (10*axis)) & 0x3FF
+        component = np.where(component >= 512, component - 1024, component)
+        #GL rule for signed normalized: -512 and -511 both give -1
+        rows[:,5 + axis] = np.maximum(component / 511, -1)
+
+    return rows
+
+def quantization_error(vertices:np.ndarray, vertex_format:str) -> dict[str,float]:
+    """
+        Largest error packing brings into the mesh:
+            position: distance, in model units
+            texcoord: largest difference in s or t
+            normal: angle, in degrees
+    """
+
+    rows = np.asarray(vertices,dtype=np.float32).reshape(-1,8)
+    packed,scale,offset = pack_vertices(rows,vertex_format)
+    decoded = unpack_vertices(packed,vertex_format,scale,offset)
+
+    original_normals = rows[:,5:8] / np.maximum(
+        np.linalg.norm(rows[:,5:8],axis=1,keepdims=True),1e-12)
+    decoded_normals = decoded[:,5:8] / np.maximum(
+        np.linalg.norm(decoded[:,5:8],axis=1,keepdims=True),1e-12)
+    cosines = np.clip(np.sum(original_normals*decoded_normals,axis=1),-1,1)
+
+    return {
+        "position": float(np.linalg.norm(rows[:,0:3] - decoded[:,0:3],axis=1).max(initial=0)),
+        "texcoord": float(np.abs(rows[:,3:5] - decoded[:,3:5]).max(initial=0)),
+        "normal": float(np.degrees(np.arccos(cosines)).max(initial=0)),
+    }
+
+def set_packed_layout(vertex_format:str) -> None:
+    """
+        Describe a packed vbo to the bound vao, attribute locations
+        match the float layout (0 position, 1 texcoord, 2 normal).
+    """
+
+    layout = VERTEX_FORMATS[vertex_format]
+    stride = layout.itemsize
+
+    #position
+    glEnableVertexAttribArray(0)
+    if vertex_format == "quantized":
+        glVertexAttribPointer(0, 3, GL_UNSIGNED_SHORT, GL_TRUE, stride,
+                              ctypes.c_void_p(layout.fields["position"][1]))
+    else:
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, stride,
+                              ctypes.c_void_p(layout.fields["position"][1]))
+    #texture
+    glEnableVertexAttribArray(1)
+    glVertexAttribPointer(1, 2, GL_HALF_FLOAT, GL_FALSE, stride,
+                          ctypes.c_void_p(layout.fields["texcoord"][1]))
+    #normal
+    glEnableVertexAttribArray(2)
+    glVertexAttribPointer(2, 4, GL_INT_2_10_10_10_REV, GL_TRUE, stride,
+                          ctypes.c_void_p(layout.fields["normal"][1]))